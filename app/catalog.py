@@ -0,0 +1,128 @@
+"""Versioned in-process snapshots of the small reference catalogs (interests, badges)."""
+
+import hashlib
+import json
+import threading
+import time
+import unicodedata
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from .config import settings
+
+# Um id ausente força nova leitura, no máximo uma vez por este intervalo
+MISS_REFRESH_SECONDS = 1.0
+
+
+def fold(value: str) -> str:
+    """Casefolded text without accents, matching the f_unaccent/ILIKE database search."""
+    decomposed = unicodedata.normalize("NFKD", value)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+class CatalogSnapshot:
+    """Immutable view of a catalog; readers keep using the snapshot they got while a new one is built."""
+
+    __slots__ = ("rows", "by_id", "version", "built_at", "_folded")
+
+    def __init__(self, rows: Sequence):
+        self._folded = {row.id: fold(row.name) for row in rows}
+        self.rows = tuple(sorted(rows, key=lambda row: (self._folded[row.id], row.name, str(row.id))))
+        self.by_id = {row.id: row for row in self.rows}
+        self.built_at = time.monotonic()
+        # Derivada do conteúdo: todos os workers chegam à mesma versão para os mesmos dados
+        digest = hashlib.sha1()
+        for row in sorted(self.rows, key=lambda row: str(row.id)):
+            digest.update(json.dumps(row._asdict(), default=str, sort_keys=True).encode())
+        self.version = digest.hexdigest()[:16]
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def get(self, row_id):
+        return self.by_id.get(row_id)
+
+    def query(
+        self,
+        *,
+        skip: int = 0,
+        limit: int = 100,
+        search: Optional[str] = None,
+        sort_by: Optional[str] = None,
+        sort_order: str = "desc",
+        sort_fields: Iterable[str] = ("name", "created_at"),
+    ) -> List:
+        rows: Sequence = self.rows
+        if search:
+            term = fold(search)
+            rows = [row for row in rows if term in self._folded[row.id]]
+            if sort_by not in sort_fields:
+                # Relevância: nome igual ao termo, depois prefixo, depois substring
+                rows.sort(key=lambda row: (self._folded[row.id] != term, not self._folded[row.id].startswith(term)))
+        if sort_by == "name" and "name" in sort_fields:
+            # self.rows já está em ordem de nome sem acentos
+            rows = list(reversed(rows)) if sort_order == "desc" else list(rows)
+        elif sort_by in sort_fields:
+            present = [row for row in rows if getattr(row, sort_by) is not None]
+            missing = [row for row in rows if getattr(row, sort_by) is None]
+            present.sort(key=lambda row: getattr(row, sort_by), reverse=sort_order == "desc")
+            # Como no Postgres: NULLs por último em ASC e primeiro em DESC
+            rows = missing + present if sort_order == "desc" else present + missing
+        return list(rows[skip : skip + limit])
+
+
+class Catalog:
+    """Holds the current snapshot of one catalog and rebuilds it on writes or after `ttl_seconds`.
+
+    The TTL bounds how long writes made by other worker processes stay
+    invisible; writes made through this process rebuild immediately.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._lock = threading.Lock()
+
+    def snapshot(self, load: Callable[[], Sequence]) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - snapshot.built_at < self.ttl_seconds:
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and time.monotonic() - snapshot.built_at < self.ttl_seconds:
+                return snapshot
+            return self._build(load)
+
+    def rebuild(self, load: Callable[[], Sequence]) -> CatalogSnapshot:
+        with self._lock:
+            return self._build(load)
+
+    def get(self, load: Callable[[], Sequence], row_id):
+        """Row by id; a miss on a snapshot older than MISS_REFRESH_SECONDS reloads once."""
+        snapshot = self.snapshot(load)
+        row = snapshot.get(row_id)
+        if row is None and time.monotonic() - snapshot.built_at > MISS_REFRESH_SECONDS:
+            row = self.rebuild(load).get(row_id)
+        return row
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def _build(self, load: Callable[[], Sequence]) -> CatalogSnapshot:
+        snapshot = CatalogSnapshot(load())
+        self._snapshot = snapshot
+        return snapshot
+
+    def stats(self) -> Dict[str, object]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {"size": 0, "version": None, "age_seconds": None, "ttl_seconds": self.ttl_seconds}
+        return {
+            "size": len(snapshot),
+            "version": snapshot.version,
+            "age_seconds": round(time.monotonic() - snapshot.built_at, 3),
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+interest_catalog = Catalog(settings.CATALOG_TTL_SECONDS)
+badge_catalog = Catalog(settings.CATALOG_TTL_SECONDS)
@@ -20,4 +20,44 @@ class Settings:
     PORT: int = int(os.getenv("PORT", "8000"))
     DEBUG: bool = os.getenv("DEBUG", "True").lower() == "true"
 
+    # Pool do engine síncrono: atende as rotas `def`, que rodam no threadpool
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    # Pool próprio do engine assíncrono (autenticação, /register, /login, /users/me, /users/{id}).
+    # São consultas curtas por chave: um pool pequeno basta. Conexões por worker, no máximo:
+    # DB_POOL_SIZE + DB_MAX_OVERFLOW + DB_ASYNC_POOL_SIZE + DB_ASYNC_MAX_OVERFLOW
+    DB_ASYNC_POOL_SIZE: int = int(os.getenv("DB_ASYNC_POOL_SIZE", "5"))
+    DB_ASYNC_MAX_OVERFLOW: int = int(os.getenv("DB_ASYNC_MAX_OVERFLOW", "5"))
+
+    # Threads para rotas síncronas; por padrão, uma por conexão que o pool pode abrir
+    THREADPOOL_SIZE: int = int(os.getenv("THREADPOOL_SIZE") or DB_POOL_SIZE + DB_MAX_OVERFLOW)
+
+    # Cache do usuário autenticado (get_current_user)
+    USER_CACHE_TTL_SECONDS: float = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+    USER_CACHE_MAX_SIZE: int = int(os.getenv("USER_CACHE_MAX_SIZE", "10000"))
+
+    # Snapshot em memória de interesses e badges; o TTL limita o atraso para escritas de outros workers
+    CATALOG_TTL_SECONDS: float = float(os.getenv("CATALOG_TTL_SECONDS", "300"))
+    # Índice geográfico dos locais; o TTL limita o atraso para escritas de outros workers
+    GEO_INDEX_TTL_SECONDS: float = float(os.getenv("GEO_INDEX_TTL_SECONDS", "300"))
+    # Contagens por faceta da busca de locais; mesmo papel do TTL acima
+    FACET_INDEX_TTL_SECONDS: float = float(os.getenv("FACET_INDEX_TTL_SECONDS", "300"))
+
+    # Push de notificações/mensagens: "local" (um worker) ou "postgres" (LISTEN/NOTIFY entre workers)
+    REALTIME_BACKEND: str = os.getenv("REALTIME_BACKEND", "local")
+    REALTIME_QUEUE_SIZE: int = int(os.getenv("REALTIME_QUEUE_SIZE", "100"))
+
+    # Feed de amigos: acima de FEED_FANOUT_MAX_FRIENDS amigos, as atividades do usuário são lidas sob demanda
+    FEED_FANOUT_MAX_FRIENDS: int = int(os.getenv("FEED_FANOUT_MAX_FRIENDS", "1000"))
+    FEED_TIMELINE_SIZE: int = int(os.getenv("FEED_TIMELINE_SIZE", "500"))
+    FEED_BACKFILL_SIZE: int = int(os.getenv("FEED_BACKFILL_SIZE", "50"))
+
+    # Grafo de amizades em memória (amigos em comum/sugestões); recarregado após o TTL
+    SOCIAL_GRAPH_TTL_SECONDS: float = float(os.getenv("SOCIAL_GRAPH_TTL_SECONDS", "300"))
+
+    # Intervalo da reconciliação dos contadores de não lidas (0 desativa)
+    UNREAD_RECONCILE_INTERVAL_SECONDS: float = float(os.getenv("UNREAD_RECONCILE_INTERVAL_SECONDS", "3600"))
+
 settings = Settings() 
\ No newline at end of file
@@ -1,36 +1,125 @@
-from sqlalchemy.orm import Session
+import re
+import uuid
+from collections import defaultdict
+from sqlalchemy import Numeric, bindparam, case, cast, delete, func, insert, literal, or_, select, text, true, tuple_, union, union_all, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
 from typing import Optional, List
-from . import models, schemas
+from . import models, schemas, catalog, facets, geo, realtime
+from .social_graph import social_graph
+from .cache import principal_cache
+from .config import settings
+from .database import SessionLocal
+from .pagination import apply_keyset, paginate
+
+
+# ===== Escritas com RETURNING =====
+# Cada escrita devolve a linha no próprio INSERT/UPDATE (sem SELECT prévio nem refresh).
+# A sessão usa expire_on_commit=False, então o objeto continua carregado após o commit.
+def _insert_returning(db: Session, model, values: dict):
+    return db.execute(insert(model).values(**values).returning(model)).scalar_one()
+
+
+def _update_returning(db: Session, model, values: dict, *criteria):
+    if not values:
+        return db.query(model).filter(*criteria).first()
+    stmt = update(model).where(*criteria).values(**values).returning(model)
+    return db.execute(stmt.execution_options(populate_existing=True)).scalar_one_or_none()
+
+
+def _update_returning_previous(db: Session, model, row_id, values: dict, column, *criteria):
+    """UPDATE por id que também devolve o valor anterior de `column`.
+
+    A linha é travada em uma CTE (SELECT ... FOR UPDATE), de modo que o valor
+    anterior é consistente com o que foi sobrescrito. `criteria` restringe a
+    linha (ex.: permissão); se não casar, nada é alterado e volta (None, None).
+    """
+    previous = (
+        select(model.id, column.label("previous"))
+        .where(model.id == row_id, *criteria)
+        .with_for_update()
+        .cte("previous")
+    )
+    stmt = update(model).where(model.id == previous.c.id).values(**values).returning(model, previous.c.previous)
+    row = db.execute(stmt.execution_options(populate_existing=True)).first()
+    if row is None:
+        return None, None
+    return row[0], row[1]
 
 
-def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+# ===== Leitura por colunas =====
+def _read_columns(model, schema, *extra: str) -> tuple:
+    """Colunas de `model` usadas por `schema`, mais `extra` (ordenação/cursor/ETag).
 
+    db.query(*colunas) devolve Rows leves: sem instâncias ORM, sem identity map
+    e sem ler colunas que a resposta descarta.
+    """
+    names = [name for name in schema.model_fields if hasattr(model, name)]
+    return tuple(getattr(model, name) for name in dict.fromkeys([*names, *extra]))
 
-def create_user(db: Session, user: schemas.UserCreate):
-    db_user = models.User(
-        id=user.id,
-        email=user.email,
-        name=user.name,
-        avatar_url=user.avatar_url,
-        bio=user.bio,
-        location=user.location,
-        phone=user.phone,
-        profile_visibility=user.profile_visibility,
-        auto_checkin_visibility=user.auto_checkin_visibility,
-        allow_messages_from=user.allow_messages_from,
-        review_delay=user.review_delay,
-        is_connectable=user.is_connectable,
-        notifications_enabled=user.notifications_enabled,
-    )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
 
+USER_READ_COLUMNS = _read_columns(models.User, schemas.User, "created_at", "updated_at")
+VENUE_READ_COLUMNS = _read_columns(models.Venue, schemas.Venue, "created_at", "updated_at")
+GROUP_READ_COLUMNS = _read_columns(models.Group, schemas.Group, "created_at", "updated_at")
+EVENT_READ_COLUMNS = _read_columns(models.Event, schemas.Event, "created_at", "updated_at")
+CHECKIN_READ_COLUMNS = _read_columns(models.Checkin, schemas.Checkin, "created_at")
+PROMOTION_READ_COLUMNS = _read_columns(models.Promotion, schemas.Promotion)
+GROUP_MEMBER_READ_COLUMNS = _read_columns(models.GroupMember, schemas.GroupMember)
+EVENT_ATTENDEE_READ_COLUMNS = _read_columns(models.EventAttendee, schemas.EventAttendee)
+
+
+# ===== Vínculos idempotentes =====
+class ReferenceNotFound(Exception):
+    """O INSERT violou uma chave estrangeira: a linha referenciada por `column` não existe."""
+
+    def __init__(self, column: Optional[str]):
+        super().__init__(column)
+        self.column = column
+
+
+_FK_COLUMN = re.compile(r"Key \((\w+)\)")
+
+
+def _insert_link(db: Session, model, values: dict, constraint: Optional[str] = None, index_elements=None):
+    """INSERT ... ON CONFLICT DO NOTHING RETURNING, em um único comando.
+
+    O conflito é detectado pela `constraint` nomeada ou, para índices únicos
+    de expressão, por `index_elements`. Retorna None se o vínculo já existia
+    e levanta ReferenceNotFound se alguma das linhas referenciadas não existe.
+    Não faz commit: quem chama grava o vínculo e o que depende dele na mesma transação.
+    """
+    stmt = pg_insert(model).values(**values).on_conflict_do_nothing(constraint=constraint, index_elements=index_elements)
+    stmt = stmt.returning(model)
+    try:
+        link = db.execute(stmt).scalar_one_or_none()
+    except IntegrityError as exc:
+        db.rollback()
+        if getattr(exc.orig, "sqlstate", None) != "23503":
+            raise
+        match = _FK_COLUMN.search(getattr(exc.orig.diag, "message_detail", None) or "")
+        raise ReferenceNotFound(match.group(1) if match else None) from exc
+    return link
+
+
+# ===== Busca textual =====
+def _search(query, term: str, sort_by: Optional[str], sortable: set, *columns):
+    """Filtra por substring sem acento e, sem ordenação explícita, ordena por relevância.
+
+    O filtro f_unaccent(coluna) ILIKE f_unaccent('%termo%') é servido pelos
+    índices trigram declarados nos modelos (models.trigram_index).
+    """
+    pattern = func.f_unaccent(f"%{term}%")
+    query = query.filter(or_(*(func.f_unaccent(column).ilike(pattern) for column in columns)))
+    if sort_by not in sortable:
+        normalized = func.f_unaccent(term)
+        scores = [func.similarity(func.f_unaccent(column), normalized) for column in columns]
+        rank = scores[0] if len(scores) == 1 else func.greatest(*scores)
+        query = query.order_by(rank.desc(), columns[0].asc())
+    return query
 
-def get_user_by_id(db: Session, user_id):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+
+USER_SORT_FIELDS = {"name", "created_at"}
 
 
 def list_users(
@@ -41,36 +130,39 @@ def list_users(
     sort_by: Optional[str] = None,
     sort_order: str = "desc",
 ):
-    query = db.query(models.User)
+    query = db.query(*USER_READ_COLUMNS)
     if search:
-        like = f"%{search}%"
-        query = query.filter(models.User.name.ilike(like) | models.User.email.ilike(like))
-    if sort_by in {"name", "created_at"}:
+        query = _search(query, search, sort_by, USER_SORT_FIELDS, models.User.name, models.User.email)
+    if sort_by in USER_SORT_FIELDS:
         column = getattr(models.User, sort_by)
         query = query.order_by(column.desc() if sort_order == "desc" else column.asc())
     return query.offset(skip).limit(limit).all()
 
 
 def update_user(db: Session, user_id, user_update: schemas.UserUpdate):
-    db_user = get_user_by_id(db, user_id)
+    db_user = _update_returning(db, models.User, user_update.dict(exclude_unset=True), models.User.id == user_id)
     if not db_user:
         return None
-    for field, value in user_update.dict(exclude_unset=True).items():
-        setattr(db_user, field, value)
     db.commit()
-    db.refresh(db_user)
+    principal_cache.invalidate(db_user.email)
     return db_user
 
 
 # ===== Venues =====
+# rating/total_reviews são agregados mantidos pelas escritas de check-in
+VENUE_AGGREGATE_FIELDS = {"rating", "total_reviews"}
+
+
 def create_venue(db: Session, payload: schemas.VenueCreate):
-    venue = models.Venue(**payload.dict(exclude_unset=True))
-    db.add(venue)
+    venue = _insert_returning(db, models.Venue, payload.dict(exclude_unset=True, exclude=VENUE_AGGREGATE_FIELDS))
     db.commit()
-    db.refresh(venue)
+    _sync_venue_indexes(venue)
     return venue
 
 
+VENUE_SORT_FIELDS = {"name", "created_at", "rating", "total_reviews"}
+
+
 def list_venues(
     db: Session,
     skip: int = 0,
@@ -79,11 +171,10 @@ def list_venues(
     sort_by: Optional[str] = None,
     sort_order: str = "desc",
 ):
-    query = db.query(models.Venue)
+    query = db.query(*VENUE_READ_COLUMNS)
     if search:
-        like = f"%{search}%"
-        query = query.filter(models.Venue.name.ilike(like))
-    if sort_by in {"name", "created_at", "rating", "total_reviews"}:
+        query = _search(query, search, sort_by, VENUE_SORT_FIELDS, models.Venue.name)
+    if sort_by in VENUE_SORT_FIELDS:
         column = getattr(models.Venue, sort_by)
         query = query.order_by(column.desc() if sort_order == "desc" else column.asc())
     return query.offset(skip).limit(limit).all()
@@ -94,30 +185,63 @@ def get_venue(db: Session, venue_id):
 
 
 def update_venue(db: Session, venue_id, payload: schemas.VenueUpdate):
-    venue = get_venue(db, venue_id)
+    updates = payload.dict(exclude_unset=True, exclude=VENUE_AGGREGATE_FIELDS)
+    venue = _update_returning(db, models.Venue, updates, models.Venue.id == venue_id)
     if not venue:
         return None
-    for field, value in payload.dict(exclude_unset=True).items():
-        setattr(venue, field, value)
     db.commit()
-    db.refresh(venue)
+    _sync_venue_indexes(venue)
     return venue
 
 
 def delete_venue(db: Session, venue_id):
     db.query(models.Venue).filter(models.Venue.id == venue_id).delete()
     db.commit()
+    geo.venue_index.remove(venue_id)
+    facets.venue_facets.remove(venue_id)
+
+
+def _sync_venue_indexes(venue: models.Venue):
+    active = venue.is_active is not False
+    geo.venue_index.upsert(venue.id, venue.latitude, venue.longitude, active)
+    facets.venue_facets.upsert(venue.id, venue.category, venue.price_range, venue.tags, venue.rating, active)
+
+
+def _load_venue_locations(db: Session):
+    return (
+        db.query(models.Venue.id, models.Venue.latitude, models.Venue.longitude)
+        .filter(
+            models.Venue.is_active.isnot(False),
+            models.Venue.latitude.isnot(None),
+            models.Venue.longitude.isnot(None),
+        )
+        .yield_per(10000)
+    )
+
+
+def list_nearby_venues(db: Session, lat: float, lon: float, radius_km: float = 5, limit: int = 50):
+    geo.venue_index.ensure_loaded(lambda: _load_venue_locations(db))
+    hits = geo.venue_index.nearby(lat, lon, radius_km, limit)
+    if not hits:
+        return []
+    venues = {v.id: v for v in db.query(models.Venue).filter(models.Venue.id.in_([venue_id for venue_id, _ in hits]))}
+    return [
+        schemas.VenueNearby(venue=venues[venue_id], distance_km=round(distance, 3))
+        for venue_id, distance in hits
+        if venue_id in venues
+    ]
 
 
 # ===== Groups =====
 def create_group(db: Session, payload: schemas.GroupCreate, created_by):
-    group = models.Group(**payload.dict(exclude_unset=True), created_by=created_by)
-    db.add(group)
+    group = _insert_returning(db, models.Group, {**payload.dict(exclude_unset=True), "created_by": created_by})
     db.commit()
-    db.refresh(group)
     return group
 
 
+GROUP_SORT_FIELDS = {"name", "created_at"}
+
+
 def list_groups(
     db: Session,
     skip: int = 0,
@@ -126,11 +250,10 @@ def list_groups(
     sort_by: Optional[str] = None,
     sort_order: str = "desc",
 ):
-    query = db.query(models.Group)
+    query = db.query(*GROUP_READ_COLUMNS)
     if search:
-        like = f"%{search}%"
-        query = query.filter(models.Group.name.ilike(like))
-    if sort_by in {"name", "created_at"}:
+        query = _search(query, search, sort_by, GROUP_SORT_FIELDS, models.Group.name)
+    if sort_by in GROUP_SORT_FIELDS:
         column = getattr(models.Group, sort_by)
         query = query.order_by(column.desc() if sort_order == "desc" else column.asc())
     return query.offset(skip).limit(limit).all()
@@ -141,13 +264,10 @@ def get_group(db: Session, group_id):
 
 
 def update_group(db: Session, group_id, payload: schemas.GroupUpdate):
-    group = get_group(db, group_id)
+    group = _update_returning(db, models.Group, payload.dict(exclude_unset=True), models.Group.id == group_id)
     if not group:
         return None
-    for field, value in payload.dict(exclude_unset=True).items():
-        setattr(group, field, value)
     db.commit()
-    db.refresh(group)
     return group
 
 
@@ -157,14 +277,34 @@ def delete_group(db: Session, group_id):
 
 
 # ===== Interests =====
+# Servidos pelo snapshot em catalog.interest_catalog; toda escrita o reconstrói
+INTEREST_CATALOG_COLUMNS = (
+    models.Interest.id,
+    models.Interest.name,
+    models.Interest.category,
+    models.Interest.icon,
+    models.Interest.created_at,
+)
+
+
+def _load_interests(db: Session):
+    return db.execute(select(*INTEREST_CATALOG_COLUMNS)).all()
+
+
+def interest_snapshot(db: Session) -> catalog.CatalogSnapshot:
+    return catalog.interest_catalog.snapshot(lambda: _load_interests(db))
+
+
 def create_interest(db: Session, payload: schemas.InterestCreate):
-    interest = models.Interest(**payload.dict(exclude_unset=True))
-    db.add(interest)
+    interest = _insert_returning(db, models.Interest, payload.dict(exclude_unset=True))
     db.commit()
-    db.refresh(interest)
+    catalog.interest_catalog.rebuild(lambda: _load_interests(db))
     return interest
 
 
+INTEREST_SORT_FIELDS = {"name", "created_at"}
+
+
 def list_interests(
     db: Session,
     skip: int = 0,
@@ -173,45 +313,61 @@ def list_interests(
     sort_by: Optional[str] = None,
     sort_order: str = "desc",
 ):
-    query = db.query(models.Interest)
-    if search:
-        like = f"%{search}%"
-        query = query.filter(models.Interest.name.ilike(like))
-    if sort_by in {"name", "created_at"}:
-        column = getattr(models.Interest, sort_by)
-        query = query.order_by(column.desc() if sort_order == "desc" else column.asc())
-    return query.offset(skip).limit(limit).all()
+    return interest_snapshot(db).query(
+        skip=skip, limit=limit, search=search, sort_by=sort_by, sort_order=sort_order, sort_fields=INTEREST_SORT_FIELDS
+    )
 
 
 def get_interest(db: Session, interest_id):
-    return db.query(models.Interest).filter(models.Interest.id == interest_id).first()
+    return catalog.interest_catalog.get(lambda: _load_interests(db), interest_id)
 
 
 def update_interest(db: Session, interest_id, payload: schemas.InterestUpdate):
-    interest = get_interest(db, interest_id)
+    interest = _update_returning(db, models.Interest, payload.dict(exclude_unset=True), models.Interest.id == interest_id)
     if not interest:
         return None
-    for field, value in payload.dict(exclude_unset=True).items():
-        setattr(interest, field, value)
     db.commit()
-    db.refresh(interest)
+    catalog.interest_catalog.rebuild(lambda: _load_interests(db))
     return interest
 
 
 def delete_interest(db: Session, interest_id):
     db.query(models.Interest).filter(models.Interest.id == interest_id).delete()
     db.commit()
+    catalog.interest_catalog.rebuild(lambda: _load_interests(db))
 
 
 # ===== Badges =====
+# Servidas pelo snapshot em catalog.badge_catalog; toda escrita o reconstrói
+BADGE_CATALOG_COLUMNS = (
+    models.Badge.id,
+    models.Badge.name,
+    models.Badge.description,
+    models.Badge.icon,
+    models.Badge.category,
+    models.Badge.criteria,
+    models.Badge.created_at,
+)
+
+
+def _load_badges(db: Session):
+    return db.execute(select(*BADGE_CATALOG_COLUMNS)).all()
+
+
+def badge_snapshot(db: Session) -> catalog.CatalogSnapshot:
+    return catalog.badge_catalog.snapshot(lambda: _load_badges(db))
+
+
 def create_badge(db: Session, payload: schemas.BadgeCreate):
-    badge = models.Badge(**payload.dict(exclude_unset=True))
-    db.add(badge)
+    badge = _insert_returning(db, models.Badge, payload.dict(exclude_unset=True))
     db.commit()
-    db.refresh(badge)
+    catalog.badge_catalog.rebuild(lambda: _load_badges(db))
     return badge
 
 
+BADGE_SORT_FIELDS = {"name", "created_at"}
+
+
 def list_badges(
     db: Session,
     skip: int = 0,
@@ -220,34 +376,28 @@ def list_badges(
     sort_by: Optional[str] = None,
     sort_order: str = "desc",
 ):
-    query = db.query(models.Badge)
-    if search:
-        like = f"%{search}%"
-        query = query.filter(models.Badge.name.ilike(like))
-    if sort_by in {"name", "created_at"}:
-        column = getattr(models.Badge, sort_by)
-        query = query.order_by(column.desc() if sort_order == "desc" else column.asc())
-    return query.offset(skip).limit(limit).all()
+    return badge_snapshot(db).query(
+        skip=skip, limit=limit, search=search, sort_by=sort_by, sort_order=sort_order, sort_fields=BADGE_SORT_FIELDS
+    )
 
 
 def get_badge(db: Session, badge_id):
-    return db.query(models.Badge).filter(models.Badge.id == badge_id).first()
+    return catalog.badge_catalog.get(lambda: _load_badges(db), badge_id)
 
 
 def update_badge(db: Session, badge_id, payload: schemas.BadgeUpdate):
-    badge = get_badge(db, badge_id)
+    badge = _update_returning(db, models.Badge, payload.dict(exclude_unset=True), models.Badge.id == badge_id)
     if not badge:
         return None
-    for field, value in payload.dict(exclude_unset=True).items():
-        setattr(badge, field, value)
     db.commit()
-    db.refresh(badge)
+    catalog.badge_catalog.rebuild(lambda: _load_badges(db))
     return badge
 
 
 def delete_badge(db: Session, badge_id):
     db.query(models.Badge).filter(models.Badge.id == badge_id).delete()
     db.commit()
+    catalog.badge_catalog.rebuild(lambda: _load_badges(db))
 
 
 # ===== Associations =====
@@ -261,35 +411,33 @@ def group_exists(db: Session, group_id) -> bool:
 
 
 def interest_exists(db: Session, interest_id) -> bool:
-    return db.query(models.Interest.id).filter(models.Interest.id == interest_id).first() is not None
+    return get_interest(db, interest_id) is not None
 
 
 def badge_exists(db: Session, badge_id) -> bool:
-    return db.query(models.Badge.id).filter(models.Badge.id == badge_id).first() is not None
+    return get_badge(db, badge_id) is not None
 
 
-def user_interest_exists(db: Session, user_id, interest_id) -> bool:
-    return (
-        db.query(models.UserInterest.id)
-        .filter(models.UserInterest.user_id == user_id, models.UserInterest.interest_id == interest_id)
-        .first()
-        is not None
-    )
+def _catalog_rows(snapshot: catalog.CatalogSnapshot, ids) -> list:
+    """Resolve ids vindos de uma tabela de vínculo no snapshot, preservando a ordem."""
+    return [row for row in map(snapshot.get, ids) if row is not None]
 
 
 def list_user_interests(db: Session, user_id):
-    return (
-        db.query(models.Interest)
-        .join(models.UserInterest, models.UserInterest.interest_id == models.Interest.id)
-        .filter(models.UserInterest.user_id == user_id)
-        .all()
-    )
+    ids = db.scalars(select(models.UserInterest.interest_id).where(models.UserInterest.user_id == user_id))
+    return _catalog_rows(interest_snapshot(db), ids)
 
 
 def add_user_interest(db: Session, user_id, interest_id):
-    link = models.UserInterest(user_id=user_id, interest_id=interest_id)
-    db.add(link)
+    link = _insert_link(
+        db,
+        models.UserInterest,
+        {"user_id": user_id, "interest_id": interest_id},
+        "user_interests_user_interest_key",
+    )
     db.commit()
+    if link is not None:
+        social_graph.add_interest(user_id, interest_id)
     return link
 
 
@@ -299,30 +447,22 @@ def remove_user_interest(db: Session, user_id, interest_id):
         models.UserInterest.interest_id == interest_id,
     ).delete()
     db.commit()
+    social_graph.remove_interest(user_id, interest_id)
 
 
 # User Badges
-def user_badge_exists(db: Session, user_id, badge_id) -> bool:
-    return (
-        db.query(models.UserBadge.id)
-        .filter(models.UserBadge.user_id == user_id, models.UserBadge.badge_id == badge_id)
-        .first()
-        is not None
-    )
-
-
 def list_user_badges(db: Session, user_id):
-    return (
-        db.query(models.Badge)
-        .join(models.UserBadge, models.UserBadge.badge_id == models.Badge.id)
-        .filter(models.UserBadge.user_id == user_id)
-        .all()
-    )
+    ids = db.scalars(select(models.UserBadge.badge_id).where(models.UserBadge.user_id == user_id))
+    return _catalog_rows(badge_snapshot(db), ids)
 
 
 def add_user_badge(db: Session, user_id, badge_id):
-    link = models.UserBadge(user_id=user_id, badge_id=badge_id)
-    db.add(link)
+    link = _insert_link(
+        db,
+        models.UserBadge,
+        {"user_id": user_id, "badge_id": badge_id},
+        "user_badges_user_badge_key",
+    )
     db.commit()
     return link
 
@@ -336,38 +476,32 @@ def remove_user_badge(db: Session, user_id, badge_id):
 
 
 # Group Members
-def group_member_exists(db: Session, group_id, user_id) -> bool:
-    return (
-        db.query(models.GroupMember.id)
-        .filter(models.GroupMember.group_id == group_id, models.GroupMember.user_id == user_id)
-        .first()
-        is not None
-    )
-
-
 def list_group_members(db: Session, group_id):
-    return db.query(models.GroupMember).filter(models.GroupMember.group_id == group_id).all()
+    return db.query(*GROUP_MEMBER_READ_COLUMNS).filter(models.GroupMember.group_id == group_id).all()
 
 
 def add_group_member(db: Session, group_id, user_id, role: Optional[str] = None):
-    member = models.GroupMember(group_id=group_id, user_id=user_id, role=role or "member")
-    db.add(member)
+    member = _insert_link(
+        db,
+        models.GroupMember,
+        {"group_id": group_id, "user_id": user_id, "role": role or "member"},
+        "group_members_group_user_key",
+    )
     db.commit()
-    db.refresh(member)
     return member
 
 
 def update_group_member(db: Session, group_id, user_id, role: str):
-    member = (
-        db.query(models.GroupMember)
-        .filter(models.GroupMember.group_id == group_id, models.GroupMember.user_id == user_id)
-        .first()
+    member = _update_returning(
+        db,
+        models.GroupMember,
+        {"role": role},
+        models.GroupMember.group_id == group_id,
+        models.GroupMember.user_id == user_id,
     )
     if not member:
         return None
-    member.role = role
     db.commit()
-    db.refresh(member)
     return member
 
 
@@ -380,22 +514,9 @@ def remove_group_member(db: Session, group_id, user_id):
 
 
 # Group Interests
-def group_interest_exists(db: Session, group_id, interest_id) -> bool:
-    return (
-        db.query(models.GroupInterest.id)
-        .filter(models.GroupInterest.group_id == group_id, models.GroupInterest.interest_id == interest_id)
-        .first()
-        is not None
-    )
-
-
 def list_group_interests(db: Session, group_id):
-    return (
-        db.query(models.Interest)
-        .join(models.GroupInterest, models.GroupInterest.interest_id == models.Interest.id)
-        .filter(models.GroupInterest.group_id == group_id)
-        .all()
-    )
+    ids = db.scalars(select(models.GroupInterest.interest_id).where(models.GroupInterest.group_id == group_id))
+    return _catalog_rows(interest_snapshot(db), ids)
 
 
 # ===== Events =====
@@ -417,13 +538,16 @@ def create_event(db: Session, payload: schemas.EventCreate, created_by):
     data["start_time"] = _parse_dt(data.get("start_time"))
     if data.get("end_time"):
         data["end_time"] = _parse_dt(data.get("end_time"))
-    event = models.Event(**data, created_by=created_by)
-    db.add(event)
+    event = _insert_returning(db, models.Event, {**data, "created_by": created_by})
+    if created_by is not None and event.is_public is not False:
+        _publish_activities(db, created_by, "event", [(event.id, event.created_at)])
     db.commit()
-    db.refresh(event)
     return event
 
 
+EVENT_SORT_FIELDS = {"start_time", "created_at"}
+
+
 def list_events(
     db: Session,
     skip: int = 0,
@@ -432,89 +556,228 @@ def list_events(
     venue_id=None,
     sort_by: Optional[str] = None,
     sort_order: str = "desc",
+    cursor: Optional[str] = None,
 ):
-    query = db.query(models.Event)
+    query = db.query(*EVENT_READ_COLUMNS)
     if group_id is not None:
         query = query.filter(models.Event.group_id == group_id)
     if venue_id is not None:
         query = query.filter(models.Event.venue_id == venue_id)
-    if sort_by in {"start_time", "created_at"}:
+    if sort_by in EVENT_SORT_FIELDS:
         column = getattr(models.Event, sort_by)
-        query = query.order_by(column.desc() if sort_order == "desc" else column.asc())
+        descending = sort_order == "desc"
     else:
-        query = query.order_by(models.Event.start_time.desc())
-    return query.offset(skip).limit(limit).all()
+        column = models.Event.start_time
+        descending = True
+    return paginate(query, column, models.Event.id, cursor=cursor, skip=skip, limit=limit, descending=descending)
 
 
 def get_event(db: Session, event_id):
     return db.query(models.Event).filter(models.Event.id == event_id).first()
 
 
-def update_event(db: Session, event_id, payload: schemas.EventUpdate):
-    event = get_event(db, event_id)
-    if not event:
-        return None
+def update_event(db: Session, event_id, payload: schemas.EventUpdate, owner_id=None):
+    """Atualiza o evento; com `owner_id`, só se ele for o criador (None se não existe ou não é dele)."""
     updates = payload.dict(exclude_unset=True)
     if "start_time" in updates:
         updates["start_time"] = _parse_dt(updates["start_time"])
     if "end_time" in updates and updates["end_time"] is not None:
         updates["end_time"] = _parse_dt(updates["end_time"])
-    for field, value in updates.items():
-        setattr(event, field, value)
+    criteria = [models.Event.id == event_id]
+    if owner_id is not None:
+        criteria.append(models.Event.created_by == owner_id)
+    event = _update_returning(db, models.Event, updates, *criteria)
+    if not event:
+        return None
+    if "is_public" in updates:
+        if event.is_public is False:
+            # Evento privado some do feed, inclusive das presenças confirmadas pelos amigos
+            _retract_activities(db, "event", [event.id])
+            _retract_activities(db, "rsvp", [event.id])
+        else:
+            if event.created_by is not None:
+                _publish_activities(db, event.created_by, "event", [(event.id, event.created_at)])
+            _republish_rsvps(db, event.id)
     db.commit()
-    db.refresh(event)
     return event
 
 
+def _republish_rsvps(db: Session, event_id):
+    """Evento voltou a ser público: publica de novo as presenças confirmadas (as já existentes são ignoradas)."""
+    attendees = db.query(models.EventAttendee.user_id, models.EventAttendee.joined_at).filter(
+        models.EventAttendee.event_id == event_id,
+        models.EventAttendee.status.in_(FEED_RSVP_STATUSES),
+        models.EventAttendee.user_id.isnot(None),
+    )
+    for attendee in attendees.all():
+        _publish_activities(db, attendee.user_id, "rsvp", [(event_id, attendee.joined_at)])
+
+
 # ===== Checkins =====
+def _venue_rating_value(rating_sum, review_count):
+    return case(
+        (review_count > 0, func.round(cast(rating_sum, Numeric) / review_count, 2)),
+        else_=0,
+    )
+
+
+_venues = models.Venue.__table__
+_new_rating_sum = func.coalesce(_venues.c.rating_sum, 0) + bindparam("b_sum")
+_new_review_count = func.coalesce(_venues.c.total_reviews, 0) + bindparam("b_count")
+_VENUE_RATING_UPDATE = (
+    update(_venues)
+    .where(_venues.c.id == bindparam("b_venue_id"))
+    .values(
+        rating_sum=_new_rating_sum,
+        total_reviews=_new_review_count,
+        rating=_venue_rating_value(_new_rating_sum, _new_review_count),
+    )
+    .returning(_venues.c.id, _venues.c.rating)
+)
+
+
+def _apply_venue_ratings(db: Session, deltas: dict) -> list:
+    """Ajusta os agregados de avaliação dos locais na transação corrente e devolve [(venue_id, nova nota)].
+
+    `deltas` mapeia venue_id -> (delta da soma, delta da contagem). As notas só
+    vão para o índice de facetas depois do commit (_sync_venue_ratings).
+    """
+    # Ordem fixa de travamento das linhas de venues: dois lotes com os mesmos locais não se bloqueiam em ciclo
+    params = [
+        {"b_venue_id": venue_id, "b_sum": delta_sum, "b_count": delta_count}
+        for venue_id, (delta_sum, delta_count) in sorted(deltas.items(), key=lambda item: item[0])
+        if venue_id is not None and (delta_sum or delta_count)
+    ]
+    # O psycopg não combina executemany com UPDATE ... RETURNING: um comando por local
+    rows = (db.execute(_VENUE_RATING_UPDATE, param).first() for param in params)
+    return [tuple(row) for row in rows if row is not None]
+
+
+def _apply_venue_rating(db: Session, venue_id, delta_sum: int, delta_count: int) -> list:
+    return _apply_venue_ratings(db, {venue_id: (delta_sum, delta_count)})
+
+
+def _sync_venue_ratings(ratings: list):
+    for venue_id, rating in ratings:
+        facets.venue_facets.set_rating(venue_id, rating)
+
+
 def create_checkin(db: Session, payload: schemas.CheckinCreate):
-    checkin = models.Checkin(**payload.dict(exclude_unset=True))
-    db.add(checkin)
+    checkin = _insert_returning(db, models.Checkin, payload.dict(exclude_unset=True))
+    ratings = _apply_venue_rating(db, checkin.venue_id, checkin.rating, 1) if checkin.rating is not None else []
+    if not checkin.is_anonymous and _checkins_in_feed(db, checkin.user_id):
+        _publish_activities(db, checkin.user_id, "checkin", [(checkin.id, checkin.created_at)])
     db.commit()
-    db.refresh(checkin)
+    _sync_venue_ratings(ratings)
     return checkin
 
 
+def create_checkins_bulk(db: Session, payloads: List[schemas.CheckinCreate], user_id):
+    """Insere vários check-ins de uma vez, reportando o resultado de cada item.
+
+    Os locais são validados com uma única consulta e as linhas válidas vão em
+    INSERTs de múltiplas linhas, com os agregados de avaliação ajustados por local.
+    """
+    venue_ids = {p.venue_id for p in payloads}
+    known_venues = {row.id for row in db.query(models.Venue.id).filter(models.Venue.id.in_(venue_ids))}
+    results = []
+    rows = []
+    deltas = defaultdict(lambda: [0, 0])
+    for index, payload in enumerate(payloads):
+        if payload.user_id != user_id:
+            results.append(schemas.CheckinBatchItemResult(index=index, status="failed", error="Sem permissão para criar check-in por outro usuário"))
+            continue
+        if payload.venue_id not in known_venues:
+            results.append(schemas.CheckinBatchItemResult(index=index, status="failed", error="Local não encontrado"))
+            continue
+        row = payload.dict(exclude_unset=True)
+        row["id"] = uuid.uuid4()
+        rows.append(row)
+        if payload.rating is not None:
+            deltas[payload.venue_id][0] += payload.rating
+            deltas[payload.venue_id][1] += 1
+        results.append(schemas.CheckinBatchItemResult(index=index, status="created", id=row["id"]))
+    if rows:
+        # Linhas com as mesmas colunas são agrupadas em INSERTs multi-linha pelo SQLAlchemy
+        db.execute(insert(models.Checkin), rows)
+        ratings = _apply_venue_ratings(db, {venue_id: tuple(delta) for venue_id, delta in deltas.items()})
+        if _checkins_in_feed(db, user_id):
+            # created_at dos check-ins é o now() desta transação, o mesmo usado pelas atividades
+            _publish_activities(db, user_id, "checkin", [(row["id"], None) for row in rows if not row.get("is_anonymous")])
+        db.commit()
+        _sync_venue_ratings(ratings)
+    return schemas.CheckinBatchResult(
+        created=len(rows),
+        failed=len(results) - len(rows),
+        results=results,
+    )
+
+
 def get_checkin(db: Session, checkin_id):
     return db.query(models.Checkin).filter(models.Checkin.id == checkin_id).first()
 
 
 def update_checkin(db: Session, checkin_id, payload: schemas.CheckinUpdate):
-    checkin = get_checkin(db, checkin_id)
-    if not checkin:
-        return None
-    for field, value in payload.dict(exclude_unset=True).items():
-        setattr(checkin, field, value)
+    updates = payload.dict(exclude_unset=True)
+    ratings = []
+    if "rating" not in updates:
+        checkin = _update_returning(db, models.Checkin, updates, models.Checkin.id == checkin_id)
+        if not checkin:
+            return None
+    else:
+        checkin, old_rating = _update_returning_previous(db, models.Checkin, checkin_id, updates, models.Checkin.rating)
+        if not checkin:
+            return None
+        if checkin.rating != old_rating:
+            ratings = _apply_venue_rating(
+                db,
+                checkin.venue_id,
+                (checkin.rating or 0) - (old_rating or 0),
+                (checkin.rating is not None) - (old_rating is not None),
+            )
+    if "is_anonymous" in updates:
+        if checkin.is_anonymous:
+            _retract_activities(db, "checkin", [checkin.id])
+        elif _checkins_in_feed(db, checkin.user_id):
+            _publish_activities(db, checkin.user_id, "checkin", [(checkin.id, checkin.created_at)])
     db.commit()
-    db.refresh(checkin)
+    _sync_venue_ratings(ratings)
     return checkin
 
 
 def delete_checkin(db: Session, checkin_id):
-    db.query(models.Checkin).filter(models.Checkin.id == checkin_id).delete()
+    removed = db.execute(
+        delete(models.Checkin)
+        .where(models.Checkin.id == checkin_id)
+        .returning(models.Checkin.venue_id, models.Checkin.rating)
+    ).first()
+    ratings = []
+    if removed is not None and removed.rating is not None:
+        ratings = _apply_venue_rating(db, removed.venue_id, -removed.rating, -1)
+    if removed is not None:
+        _retract_activities(db, "checkin", [checkin_id])
     db.commit()
+    _sync_venue_ratings(ratings)
 
 
-def list_user_checkins(db: Session, user_id, skip: int = 0, limit: int = 50):
-    return (
-        db.query(models.Checkin)
-        .filter(models.Checkin.user_id == user_id)
-        .order_by(models.Checkin.created_at.desc())
-        .offset(skip)
-        .limit(limit)
-        .all()
-    )
+def list_user_checkins(db: Session, user_id, skip: int = 0, limit: int = 50, cursor: Optional[str] = None):
+    query = db.query(*CHECKIN_READ_COLUMNS).filter(models.Checkin.user_id == user_id)
+    return paginate(query, models.Checkin.created_at, models.Checkin.id, cursor=cursor, skip=skip, limit=limit)
 
 
-def list_venue_checkins(db: Session, venue_id, skip: int = 0, limit: int = 50):
-    return (
-        db.query(models.Checkin)
-        .filter(models.Checkin.venue_id == venue_id)
-        .order_by(models.Checkin.created_at.desc())
-        .offset(skip)
-        .limit(limit)
-        .all()
-    )
+def list_venue_checkins(db: Session, venue_id, skip: int = 0, limit: int = 50, cursor: Optional[str] = None):
+    query = db.query(*CHECKIN_READ_COLUMNS).filter(models.Checkin.venue_id == venue_id)
+    return paginate(query, models.Checkin.created_at, models.Checkin.id, cursor=cursor, skip=skip, limit=limit)
+
+
+def stream_checkins(db: Session, *, user_id=None, venue_id=None, batch_size: int = 1000):
+    """Histórico completo em ordem cronológica, lido por cursor no servidor em lotes de `batch_size`."""
+    query = db.query(*CHECKIN_READ_COLUMNS)
+    if user_id is not None:
+        query = query.filter(models.Checkin.user_id == user_id)
+    if venue_id is not None:
+        query = query.filter(models.Checkin.venue_id == venue_id)
+    return query.order_by(models.Checkin.created_at.asc(), models.Checkin.id.asc()).yield_per(batch_size)
 
 
 # ===== Promotions =====
@@ -522,16 +785,14 @@ def create_promotion(db: Session, venue_id, payload: schemas.PromotionCreate):
     data = payload.dict(exclude_unset=True)
     data["start_date"] = _parse_dt(data.get("start_date"))
     data["end_date"] = _parse_dt(data.get("end_date"))
-    promo = models.Promotion(**data, venue_id=venue_id)
-    db.add(promo)
+    promo = _insert_returning(db, models.Promotion, {**data, "venue_id": venue_id})
     db.commit()
-    db.refresh(promo)
     return promo
 
 
 def list_venue_promotions(db: Session, venue_id, skip: int = 0, limit: int = 50):
     return (
-        db.query(models.Promotion)
+        db.query(*PROMOTION_READ_COLUMNS)
         .filter(models.Promotion.venue_id == venue_id)
         .order_by(models.Promotion.start_date.desc())
         .offset(skip)
@@ -545,18 +806,15 @@ def get_promotion(db: Session, promotion_id):
 
 
 def update_promotion(db: Session, promotion_id, payload: schemas.PromotionUpdate):
-    promo = get_promotion(db, promotion_id)
-    if not promo:
-        return None
     updates = payload.dict(exclude_unset=True)
     if "start_date" in updates:
         updates["start_date"] = _parse_dt(updates["start_date"])
     if "end_date" in updates:
         updates["end_date"] = _parse_dt(updates["end_date"])
-    for field, value in updates.items():
-        setattr(promo, field, value)
+    promo = _update_returning(db, models.Promotion, updates, models.Promotion.id == promotion_id)
+    if not promo:
+        return None
     db.commit()
-    db.refresh(promo)
     return promo
 
 
@@ -571,7 +829,7 @@ def event_exists(db: Session, event_id) -> bool:
 
 
 def list_event_attendees(db: Session, event_id):
-    return db.query(models.EventAttendee).filter(models.EventAttendee.event_id == event_id).all()
+    return db.query(*EVENT_ATTENDEE_READ_COLUMNS).filter(models.EventAttendee.event_id == event_id).all()
 
 
 def get_event_attendee(db: Session, event_id, user_id):
@@ -583,20 +841,34 @@ def get_event_attendee(db: Session, event_id, user_id):
 
 
 def add_event_attendee(db: Session, event_id, user_id, status: Optional[str] = None):
-    attendee = models.EventAttendee(event_id=event_id, user_id=user_id, status=status or "going")
-    db.add(attendee)
+    attendee = _insert_link(
+        db,
+        models.EventAttendee,
+        {"event_id": event_id, "user_id": user_id, "status": status or "going"},
+        "event_attendees_event_user_key",
+    )
+    # O RSVP e a publicação no feed entram na mesma transação
+    if attendee is not None and attendee.status in FEED_RSVP_STATUSES and _event_is_public(db, event_id):
+        _publish_activities(db, user_id, "rsvp", [(event_id, attendee.joined_at)])
     db.commit()
-    db.refresh(attendee)
     return attendee
 
 
 def update_event_attendee(db: Session, event_id, user_id, status: str):
-    attendee = get_event_attendee(db, event_id, user_id)
+    attendee = _update_returning(
+        db,
+        models.EventAttendee,
+        {"status": status},
+        models.EventAttendee.event_id == event_id,
+        models.EventAttendee.user_id == user_id,
+    )
     if not attendee:
         return None
-    attendee.status = status
+    if attendee.status not in FEED_RSVP_STATUSES:
+        _retract_activities(db, "rsvp", [event_id], actor_id=user_id)
+    elif _event_is_public(db, event_id):
+        _publish_activities(db, user_id, "rsvp", [(event_id, None)])
     db.commit()
-    db.refresh(attendee)
     return attendee
 
 
@@ -604,22 +876,54 @@ def remove_event_attendee(db: Session, event_id, user_id):
     db.query(models.EventAttendee).filter(
         models.EventAttendee.event_id == event_id, models.EventAttendee.user_id == user_id
     ).delete()
+    _retract_activities(db, "rsvp", [event_id], actor_id=user_id)
     db.commit()
 
 
 # ===== Friendships =====
+# Chave canônica do par, na mesma forma do índice único friendships_pair_key
+FRIENDSHIP_PAIR = (
+    func.least(models.Friendship.user_id, models.Friendship.friend_id),
+    func.greatest(models.Friendship.user_id, models.Friendship.friend_id),
+)
+
+
 def create_friendship_request(db: Session, from_user_id, to_user_id):
-    friendship = models.Friendship(user_id=from_user_id, friend_id=to_user_id, status="pending")
-    db.add(friendship)
-    db.commit()
-    db.refresh(friendship)
-    return friendship
+    """Cria o pedido pendente e devolve (pedido, None), ou (None, existente) se o par já tem um registro.
+
+    friendships_pair_key cobre as duas direções e todos os status, então
+    pedido repetido, pedido cruzado e pedido entre amigos caem no ON CONFLICT.
+    """
+    values = dict(user_id=from_user_id, friend_id=to_user_id, status="pending")
+    while True:
+        friendship = _insert_link(db, models.Friendship, values, index_elements=FRIENDSHIP_PAIR)
+        if friendship is not None:
+            db.commit()
+            return friendship, None
+        existing = get_friendship_between(db, from_user_id, to_user_id)
+        # Se o registro em conflito foi removido entre o INSERT e a leitura, tenta de novo
+        if existing is not None:
+            return None, existing
 
 
 def get_friendship(db: Session, friendship_id):
     return db.query(models.Friendship).filter(models.Friendship.id == friendship_id).first()
 
 
+def get_friendship_between(db: Session, user_a, user_b):
+    """Registro do par em qualquer direção, por uma busca no índice único do par.
+
+    Sem LIMIT: com LIMIT 1 e estatísticas ainda não coletadas para as
+    expressões do índice, o planejador prefere varrer a tabela.
+    """
+    pair = [literal(user_id, models.Friendship.user_id.type) for user_id in (user_a, user_b)]
+    return (
+        db.query(models.Friendship)
+        .filter(FRIENDSHIP_PAIR[0] == func.least(*pair), FRIENDSHIP_PAIR[1] == func.greatest(*pair))
+        .one_or_none()
+    )
+
+
 def list_incoming_friend_requests(db: Session, user_id):
     return (
         db.query(models.Friendship)
@@ -639,140 +943,320 @@ def list_outgoing_friend_requests(db: Session, user_id):
 
 
 def set_friendship_status(db: Session, friendship_id, status: str):
-    friendship = get_friendship(db, friendship_id)
+    friendship, old_status = _update_returning_previous(
+        db, models.Friendship, friendship_id, {"status": status}, models.Friendship.status
+    )
     if not friendship:
         return None
-    friendship.status = status
-    db.commit()
-    db.refresh(friendship)
+    if old_status != "accepted" and status == "accepted":
+        _adjust_friend_counts(db, (friendship.user_id, friendship.friend_id), 1)
+        _feed_connect(db, friendship.user_id, friendship.friend_id)
+        db.commit()
+        social_graph.add_friendship(friendship.user_id, friendship.friend_id)
+    elif old_status == "accepted" and status != "accepted":
+        _adjust_friend_counts(db, (friendship.user_id, friendship.friend_id), -1)
+        _feed_disconnect(db, friendship.user_id, friendship.friend_id)
+        db.commit()
+        social_graph.remove_friendship(friendship.user_id, friendship.friend_id)
+    else:
+        db.commit()
     return friendship
 
 
 def delete_friendship(db: Session, friendship_id):
-    db.query(models.Friendship).filter(models.Friendship.id == friendship_id).delete()
+    removed = db.execute(
+        delete(models.Friendship)
+        .where(models.Friendship.id == friendship_id)
+        .returning(models.Friendship.user_id, models.Friendship.friend_id, models.Friendship.status)
+    ).first()
+    if removed is not None and removed.status == "accepted":
+        _adjust_friend_counts(db, (removed.user_id, removed.friend_id), -1)
+        _feed_disconnect(db, removed.user_id, removed.friend_id)
     db.commit()
+    if removed is not None and removed.status == "accepted":
+        social_graph.remove_friendship(removed.user_id, removed.friend_id)
 
 
-def list_user_friends(db: Session, user_id):
-    # Amizades aceitas onde user é owner ou friend
-    friendships = db.query(models.Friendship).filter(
-        models.Friendship.status == "accepted",
-        (models.Friendship.user_id == user_id) | (models.Friendship.friend_id == user_id),
+def _adjust_friend_counts(db: Session, user_ids, delta: int):
+    db.query(models.User).filter(models.User.id.in_(user_ids)).update(
+        # Contadores não mexem em updated_at: o ETag do usuário cobre friend_count à parte (http_cache).
+        # Sem greatest(..., 0): um contador negativo expõe o drift, que reconcile-friend-counts corrige
+        {models.User.friend_count: models.User.friend_count + delta, models.User.updated_at: models.User.updated_at},
+        synchronize_session=False,
     )
-    # Retorna lista de usuários
-    friend_ids = []
-    for f in friendships:
-        friend_ids.append(f.friend_id if f.user_id == user_id else f.user_id)
-    if not friend_ids:
-        return []
-    return db.query(models.User).filter(models.User.id.in_(friend_ids)).all()
+
+
+def _friends_of(user_id, cursor: Optional[str] = None, per_side: Optional[int] = None):
+    """Amigos aceitos de `user_id` como (id, friends_since), lendo os dois sentidos da amizade.
+
+    Cada amizade é guardada em um só sentido; cada lado é um intervalo de um índice
+    parcial ordenado por (created_at, id do amigo). Com `per_side`, cada lado já sai
+    ordenado, a partir do cursor, e limitado do seu índice.
+    """
+    sides = []
+    for own, other in ((models.Friendship.user_id, models.Friendship.friend_id), (models.Friendship.friend_id, models.Friendship.user_id)):
+        side = select(other.label("id"), models.Friendship.created_at.label("friends_since")).where(
+            own == user_id, models.Friendship.status == "accepted"
+        )
+        if per_side is not None:
+            side = apply_keyset(side, models.Friendship.created_at, other, cursor).limit(per_side)
+        sides.append(side)
+    return union_all(*sides).subquery("friends")
+
+
+def list_user_friends(db: Session, user_id, skip: int = 0, limit: int = 50, cursor: Optional[str] = None):
+    # O Postgres não leva o LIMIT para dentro do UNION ALL; limitar cada lado evita ordenar todos os amigos
+    friends = _friends_of(user_id, cursor, per_side=limit if cursor else skip + limit)
+    query = db.query(*USER_READ_COLUMNS, friends.c.friends_since).join(friends, friends.c.id == models.User.id)
+    return paginate(query, friends.c.friends_since, friends.c.id, cursor=cursor, skip=skip, limit=limit)
+
+
+def get_friend_count(db: Session, user_id) -> Optional[int]:
+    return db.query(models.User.friend_count).filter(models.User.id == user_id).scalar()
+
+
+def _accepted_friendships():
+    # A recarga roda numa thread de fundo: não pode usar a sessão da requisição
+    with SessionLocal() as db:
+        yield from db.query(models.Friendship.user_id, models.Friendship.friend_id).filter(models.Friendship.status == "accepted").yield_per(10000)
+
+
+def _user_interests():
+    with SessionLocal() as db:
+        yield from db.query(models.UserInterest.user_id, models.UserInterest.interest_id).yield_per(10000)
+
+
+def _load_social_graph():
+    social_graph.ensure_loaded(_accepted_friendships, _user_interests)
+
+
+def _users_by_id(db: Session, user_ids) -> dict:
+    if not user_ids:
+        return {}
+    return {row.id: row for row in db.query(*USER_READ_COLUMNS).filter(models.User.id.in_(user_ids))}
+
+
+def list_mutual_friends(db: Session, user_id, other_id, skip: int = 0, limit: int = 50):
+    """Amigos em comum (ordenados por nome) e o total, pela interseção das listas de adjacência em memória."""
+    _load_social_graph()
+    common = social_graph.mutual_friends(user_id, other_id)
+    if not common:
+        return [], 0
+    query = db.query(*USER_READ_COLUMNS).filter(models.User.id.in_(common))
+    return query.order_by(models.User.name, models.User.id).offset(skip).limit(limit).all(), len(common)
+
+
+def _paired_with(db: Session, user_id, candidates) -> set:
+    """Dos `candidates`, os que já têm um registro de amizade com `user_id`, em qualquer status.
+
+    Uma busca no índice único do par por candidato; a ordem de uuid do
+    Postgres é a mesma do Python, então o par já vai ordenado.
+    """
+    if not candidates:
+        return set()
+    uuid_type = models.Friendship.user_id.type
+    pairs = [
+        tuple_(literal(min(user_id, other), uuid_type), literal(max(user_id, other), uuid_type))
+        for other in candidates
+    ]
+    counterpart = case((models.Friendship.user_id == user_id, models.Friendship.friend_id), else_=models.Friendship.user_id)
+    return {row.id for row in db.query(counterpart.label("id")).filter(tuple_(*FRIENDSHIP_PAIR).in_(pairs))}
+
+
+def list_friend_suggestions(db: Session, user_id, limit: int = 20):
+    """Amigos de amigos, ordenados por amigos em comum e depois por interesses em comum."""
+    _load_social_graph()
+    # O grafo só tem amizades aceitas: pedidos pendentes, bloqueios etc. saem aqui, e o ranking é refeito sem eles
+    excluded: set = set()
+    while True:
+        ranked = social_graph.suggestions(user_id, limit=limit, exclude=excluded)
+        paired = _paired_with(db, user_id, [candidate for candidate, _, _ in ranked])
+        if not paired:
+            break
+        excluded |= paired
+    users = _users_by_id(db, [candidate for candidate, _, _ in ranked])
+    return [
+        schemas.FriendSuggestion.model_validate(
+            {**users[candidate]._asdict(), "mutual_friends": mutual, "shared_interests": shared}
+        )
+        for candidate, mutual, shared in ranked
+        if candidate in users
+    ]
+
+
+def reconcile_friend_counts(db: Session, batch_size: int = 500) -> int:
+    """Recalcula users.friend_count a partir das amizades aceitas, em lotes."""
+    accepted = (
+        db.query(func.count(models.Friendship.id))
+        .filter(
+            models.Friendship.status == "accepted",
+            or_(models.Friendship.user_id == models.User.id, models.Friendship.friend_id == models.User.id),
+        )
+        .scalar_subquery()
+    )
+    processed = 0
+    last_id = None
+    while True:
+        query = db.query(models.User.id).order_by(models.User.id)
+        if last_id is not None:
+            query = query.filter(models.User.id > last_id)
+        ids = [row.id for row in query.limit(batch_size)]
+        if not ids:
+            break
+        db.query(models.User).filter(models.User.id.in_(ids)).update(
+            {models.User.friend_count: accepted, models.User.updated_at: models.User.updated_at}, synchronize_session=False
+        )
+        db.commit()
+        processed += len(ids)
+        last_id = ids[-1]
+    return processed
 
 
 # ===== Messages =====
+def _touch_conversations(db: Session, msg: models.Message):
+    """Atualiza o resumo da conversa dos dois lados em um único upsert."""
+    sides = [
+        {
+            "user_id": msg.sender_id,
+            "counterpart_id": msg.receiver_id,
+            "last_message_id": msg.id,
+            "last_message_at": func.now(),
+            "unread_count": 0,
+        },
+        {
+            "user_id": msg.receiver_id,
+            "counterpart_id": msg.sender_id,
+            "last_message_id": msg.id,
+            "last_message_at": func.now(),
+            "unread_count": 1,
+        },
+    ]
+    # Mensagens simultâneas nos dois sentidos travam as mesmas duas linhas; na mesma ordem, sem deadlock
+    stmt = pg_insert(models.Conversation).values(sorted(sides, key=lambda side: side["user_id"]))
+    is_newer = stmt.excluded.last_message_at >= models.Conversation.last_message_at
+    stmt = stmt.on_conflict_do_update(
+        constraint="conversations_user_counterpart_key",
+        set_={
+            "last_message_id": case((is_newer, stmt.excluded.last_message_id), else_=models.Conversation.last_message_id),
+            "last_message_at": func.greatest(models.Conversation.last_message_at, stmt.excluded.last_message_at),
+            "unread_count": models.Conversation.unread_count + stmt.excluded.unread_count,
+            "updated_at": func.now(),
+        },
+    )
+    db.execute(stmt)
+
+
 def create_message(db: Session, sender_id, receiver_id, content: str):
-    msg = models.Message(sender_id=sender_id, receiver_id=receiver_id, content=content)
-    db.add(msg)
+    msg = _insert_returning(db, models.Message, dict(sender_id=sender_id, receiver_id=receiver_id, content=content))
+    _touch_conversations(db, msg)
+    realtime.publish(db, (sender_id, receiver_id), "message", schemas.Message, msg)
     db.commit()
-    db.refresh(msg)
     return msg
 
 
-def list_messages_between(db: Session, user_a, user_b, skip: int = 0, limit: int = 50):
-    return (
-        db.query(models.Message)
-        .filter(
-            ((models.Message.sender_id == user_a) & (models.Message.receiver_id == user_b))
-            | ((models.Message.sender_id == user_b) & (models.Message.receiver_id == user_a))
-        )
-        .order_by(models.Message.created_at.desc())
+def _messages_between(user_a, user_b, cursor: Optional[str], per_side: int):
+    """Mensagens entre `user_a` e `user_b`, lendo cada sentido da conversa separadamente.
+
+    Cada sentido é um intervalo de ix_messages_pair_created; o OR entre os dois sentidos
+    virava bitmap scan seguido de sort de toda a conversa.
+    """
+    directions = ((user_a, user_b),) if user_a == user_b else ((user_a, user_b), (user_b, user_a))
+    sides = []
+    for sender, receiver in directions:
+        side = select(models.Message).where(models.Message.sender_id == sender, models.Message.receiver_id == receiver)
+        sides.append(apply_keyset(side, models.Message.created_at, models.Message.id, cursor).limit(per_side))
+    return union_all(*sides).subquery("thread")
+
+
+def list_messages_between(db: Session, user_a, user_b, skip: int = 0, limit: int = 50, cursor: Optional[str] = None):
+    # Como em list_user_friends: cada sentido já sai limitado do índice e o Postgres só intercala os dois
+    thread = aliased(models.Message, _messages_between(user_a, user_b, cursor, per_side=limit if cursor else skip + limit))
+    return paginate(db.query(thread), thread.created_at, thread.id, cursor=cursor, skip=skip, limit=limit)
+
+
+def list_message_threads(db: Session, user_id, skip: int = 0, limit: int = 50):
+    rows = (
+        db.query(models.Conversation, models.Message)
+        # last_message_id vira NULL quando a mensagem é removida: a conversa continua na lista
+        .outerjoin(models.Message, models.Message.id == models.Conversation.last_message_id)
+        .filter(models.Conversation.user_id == user_id)
+        .order_by(models.Conversation.last_message_at.desc(), models.Conversation.id.desc())
         .offset(skip)
         .limit(limit)
         .all()
     )
+    return [
+        schemas.MessageThread(user_id=conv.counterpart_id, last_message=msg, unread_count=conv.unread_count)
+        for conv, msg in rows
+    ]
 
 
-def list_message_threads(db: Session, user_id):
-    # threads simples por último contato com cada interlocutor
-    subquery = (
-        db.query(
-            models.Message.sender_id.label("sender"),
-            models.Message.receiver_id.label("receiver"),
-            models.Message.created_at.label("created_at"),
-            models.Message.id.label("id"),
-        )
-        .filter((models.Message.sender_id == user_id) | (models.Message.receiver_id == user_id))
-        .subquery()
-    )
-
-    # Agrupar por interlocutor
-    # Esta implementação pode ser otimizada com SQL mais avançado se necessário
-    messages = (
-        db.query(models.Message)
-        .filter((models.Message.sender_id == user_id) | (models.Message.receiver_id == user_id))
-        .order_by(models.Message.created_at.desc())
-        .all()
-    )
-    threads = {}
-    for m in messages:
-        counterpart = m.receiver_id if m.sender_id == user_id else m.sender_id
-        if counterpart not in threads:
-            threads[counterpart] = {
-                "last_message": m,
-                "unread_count": 0,
-            }
-        if m.receiver_id == user_id and not m.is_read:
-            threads[counterpart]["unread_count"] += 1
-    # Transformar em lista
-    result = []
-    for counterpart, data in threads.items():
-        result.append(
-            schemas.MessageThread(
-                user_id=counterpart, last_message=data["last_message"], unread_count=data["unread_count"]
-            )
-        )
-    return result
+def message_exists(db: Session, message_id) -> bool:
+    return db.query(models.Message.id).filter(models.Message.id == message_id).first() is not None
 
 
-def mark_message_read(db: Session, message_id):
-    msg = db.query(models.Message).filter(models.Message.id == message_id).first()
+def mark_message_read(db: Session, message_id, receiver_id=None):
+    """Marca a mensagem como lida; com `receiver_id`, só se ele for o destinatário (None se não existe ou não é dele)."""
+    criteria = [models.Message.receiver_id == receiver_id] if receiver_id is not None else []
+    msg, was_read = _update_returning_previous(
+        db, models.Message, message_id, {"is_read": True}, models.Message.is_read, *criteria
+    )
     if not msg:
         return None
-    msg.is_read = True
+    if not was_read:
+        db.query(models.Conversation).filter(
+            models.Conversation.user_id == msg.receiver_id,
+            models.Conversation.counterpart_id == msg.sender_id,
+        ).update(
+            {models.Conversation.unread_count: func.greatest(models.Conversation.unread_count - 1, 0)},
+            synchronize_session=False,
+        )
     db.commit()
-    db.refresh(msg)
     return msg
 
 
 def mark_thread_read(db: Session, user_id, other_id):
-    db.query(models.Message).filter(models.Message.sender_id == other_id, models.Message.receiver_id == user_id).update(
-        {"is_read": True}
+    # Desconta só as mensagens que este UPDATE marcou: uma mensagem nova, ainda não
+    # confirmada, continua não lida e é somada pelo seu próprio create_message
+    marked = (
+        db.query(models.Message)
+        .filter(
+            models.Message.sender_id == other_id,
+            models.Message.receiver_id == user_id,
+            models.Message.is_read.isnot(True),
+        )
+        .update({"is_read": True}, synchronize_session=False)
     )
+    if marked:
+        db.query(models.Conversation).filter(
+            models.Conversation.user_id == user_id, models.Conversation.counterpart_id == other_id
+        ).update(
+            {models.Conversation.unread_count: func.greatest(models.Conversation.unread_count - marked, 0)},
+            synchronize_session=False,
+        )
     db.commit()
 
 
 # ===== Notifications =====
 def create_notification(db: Session, payload: schemas.NotificationCreate):
-    notif = models.Notification(
+    values = dict(
         user_id=payload.user_id,
         type=payload.type,
         title=payload.title,
         message=payload.message,
         data=payload.data,
     )
-    db.add(notif)
+    notif = _insert_returning(db, models.Notification, values)
+    _adjust_unread_notifications(db, notif.user_id, 1)
+    realtime.publish(db, (notif.user_id,), "notification", schemas.Notification, notif)
     db.commit()
-    db.refresh(notif)
     return notif
 
 
-def list_notifications(db: Session, user_id, skip: int = 0, limit: int = 50):
-    return (
-        db.query(models.Notification)
-        .filter(models.Notification.user_id == user_id)
-        .order_by(models.Notification.created_at.desc())
-        .offset(skip)
-        .limit(limit)
-        .all()
+def list_notifications(db: Session, user_id, skip: int = 0, limit: int = 50, cursor: Optional[str] = None):
+    query = db.query(models.Notification).filter(models.Notification.user_id == user_id)
+    return paginate(
+        query, models.Notification.created_at, models.Notification.id, cursor=cursor, skip=skip, limit=limit
     )
 
 
@@ -781,26 +1265,361 @@ def get_notification(db: Session, notification_id):
 
 
 def mark_notification_read(db: Session, notification_id):
-    notif = get_notification(db, notification_id)
+    notif, was_read = _update_returning_previous(
+        db, models.Notification, notification_id, {"is_read": True}, models.Notification.is_read
+    )
     if not notif:
         return None
-    notif.is_read = True
+    if not was_read:
+        _adjust_unread_notifications(db, notif.user_id, -1)
     db.commit()
-    db.refresh(notif)
     return notif
 
 
 def mark_all_notifications_read(db: Session, user_id):
-    db.query(models.Notification).filter(models.Notification.user_id == user_id).update({"is_read": True})
+    marked = (
+        db.query(models.Notification)
+        .filter(models.Notification.user_id == user_id, models.Notification.is_read.isnot(True))
+        .update({"is_read": True}, synchronize_session=False)
+    )
+    if marked:
+        _adjust_unread_notifications(db, user_id, -marked)
     db.commit()
 
 
 def delete_notification(db: Session, notification_id):
-    db.query(models.Notification).filter(models.Notification.id == notification_id).delete()
+    removed = db.execute(
+        delete(models.Notification)
+        .where(models.Notification.id == notification_id)
+        .returning(models.Notification.user_id, models.Notification.is_read)
+    ).first()
+    if removed is not None and not removed.is_read:
+        _adjust_unread_notifications(db, removed.user_id, -1)
     db.commit()
 
 
+def _adjust_unread_notifications(db: Session, user_id, delta: int):
+    db.query(models.User).filter(models.User.id == user_id).update(
+        # unread_notifications não aparece em schemas.User: não pode invalidar o ETag do usuário
+        {models.User.unread_notifications: func.greatest(models.User.unread_notifications + delta, 0), models.User.updated_at: models.User.updated_at},
+        synchronize_session=False,
+    )
+
+
+# ===== Contadores de não lidas =====
+def get_unread_counts(db: Session, user_id) -> dict:
+    """Notificações não lidas e mensagens não lidas por conversa (schemas.UnreadCounts), lidas dos contadores."""
+    notifications = db.query(models.User.unread_notifications).filter(models.User.id == user_id).scalar()
+    conversations = (
+        db.query(models.Conversation.counterpart_id.label("user_id"), models.Conversation.unread_count)
+        .filter(models.Conversation.user_id == user_id, models.Conversation.unread_count > 0)
+        .order_by(models.Conversation.counterpart_id)
+        .all()
+    )
+    return {
+        "notifications": notifications or 0,
+        "messages": sum(row.unread_count for row in conversations),
+        "conversations": conversations,
+    }
+
+
+def reconcile_unread_counts(db: Session, batch_size: int = 500) -> int:
+    """Recalcula users.unread_notifications e conversations.unread_count a partir das linhas, em lotes de usuários.
+
+    As linhas de contador do lote são travadas antes da contagem: escritas
+    concorrentes esperam e somam depois, e o UPDATE seguinte, com um novo
+    snapshot, já enxerga as que confirmaram antes da trava. A reconciliação
+    nunca espera por uma trava, então não entra em deadlock com as escritas.
+    """
+    unread_notifications = (
+        db.query(func.count(models.Notification.id))
+        .filter(models.Notification.user_id == models.User.id, models.Notification.is_read.isnot(True))
+        .scalar_subquery()
+    )
+    unread_messages = (
+        db.query(func.count(models.Message.id))
+        .filter(
+            models.Message.sender_id == models.Conversation.counterpart_id,
+            models.Message.receiver_id == models.Conversation.user_id,
+            models.Message.is_read.isnot(True),
+        )
+        .scalar_subquery()
+    )
+    processed = 0
+    last_id = None
+    while True:
+        query = db.query(models.User.id).order_by(models.User.id)
+        if last_id is not None:
+            query = query.filter(models.User.id > last_id)
+        ids = [row.id for row in query.limit(batch_size)]
+        if not ids:
+            break
+        # FOR NO KEY UPDATE não conflita com o KEY SHARE das chaves estrangeiras; linhas
+        # travadas por uma escrita em andamento ficam para a próxima execução
+        locked_users = [
+            row.id
+            for row in db.query(models.User.id).filter(models.User.id.in_(ids)).with_for_update(key_share=True, skip_locked=True)
+        ]
+        locked_conversations = [
+            row.id
+            for row in db.query(models.Conversation.id)
+            .filter(models.Conversation.user_id.in_(ids))
+            .with_for_update(key_share=True, skip_locked=True)
+        ]
+        db.query(models.User).filter(models.User.id.in_(locked_users)).update(
+            {models.User.unread_notifications: unread_notifications, models.User.updated_at: models.User.updated_at},
+            synchronize_session=False,
+        )
+        db.query(models.Conversation).filter(models.Conversation.id.in_(locked_conversations)).update(
+            {models.Conversation.unread_count: unread_messages}, synchronize_session=False
+        )
+        db.commit()
+        processed += len(ids)
+        last_id = ids[-1]
+    return processed
+
+
+# ===== Feed =====
+# Check-ins entram no feed dos amigos só com estas visibilidades (valores desconhecidos ficam de fora)
+FEED_CHECKIN_VISIBILITY = ("public", "friends")
+FEED_RSVP_STATUSES = ("going",)
+
+
+def _fans_out(db: Session, actor_id) -> bool:
+    return (get_friend_count(db, actor_id) or 0) <= settings.FEED_FANOUT_MAX_FRIENDS
+
+
+def _publish_activities(db: Session, actor_id, verb: str, objects):
+    """Registra atividades de `actor_id` e copia as mais recentes para as timelines dos amigos.
+
+    `objects` são pares (object_id, created_at); created_at None usa o now() da transação.
+    Atores com amigos demais não fazem fan-out: quem os segue lê via feed_pull_sources.
+    """
+    rows = [
+        {"actor_id": actor_id, "verb": verb, "object_id": object_id, **({"created_at": created_at} if created_at else {})}
+        for object_id, created_at in objects
+    ]
+    if not rows:
+        return
+    activities = []
+    # Colunas diferentes por linha (com/sem created_at) não podem ir no mesmo INSERT multi-linha
+    for group in ([row for row in rows if "created_at" in row], [row for row in rows if "created_at" not in row]):
+        if group:
+            stmt = pg_insert(models.FeedActivity).values(group).on_conflict_do_nothing(constraint="feed_activities_object_key")
+            activities += db.execute(stmt.returning(models.FeedActivity.id, models.FeedActivity.created_at)).all()
+    if not activities or not _fans_out(db, actor_id):
+        return
+    # Lotes grandes (importação de histórico) só empurram o que cabe no topo das timelines
+    recent = sorted(activities, key=lambda row: row.created_at, reverse=True)[: settings.FEED_BACKFILL_SIZE]
+    friends = _friends_of(actor_id)
+    entries = select(friends.c.id, models.FeedActivity.id, models.FeedActivity.created_at).where(
+        models.FeedActivity.id.in_([row.id for row in recent])
+    )
+    db.execute(
+        pg_insert(models.FeedEntry)
+        .from_select(["user_id", "activity_id", "created_at"], entries)
+        .on_conflict_do_nothing()
+    )
+
+
+def _retract_activities(db: Session, verb: str, object_ids, actor_id=None):
+    """Remove atividades (e, em cascata, as entradas nas timelines)."""
+    if not object_ids:
+        return
+    stmt = delete(models.FeedActivity).where(models.FeedActivity.verb == verb, models.FeedActivity.object_id.in_(object_ids))
+    if actor_id is not None:
+        stmt = stmt.where(models.FeedActivity.actor_id == actor_id)
+    db.execute(stmt)
+
+
+def _checkins_in_feed(db: Session, user_id) -> bool:
+    visibility = db.query(models.User.auto_checkin_visibility).filter(models.User.id == user_id).scalar()
+    return visibility in FEED_CHECKIN_VISIBILITY
+
+
+def _event_is_public(db: Session, event_id) -> bool:
+    return db.query(models.Event.is_public).filter(models.Event.id == event_id).scalar() is not False
+
+
+def _feed_connect(db: Session, user_a, user_b):
+    """Nova amizade: cada lado passa a ver as atividades recentes do outro."""
+    limit = settings.FEED_FANOUT_MAX_FRIENDS
+    for reader, actor in ((user_a, user_b), (user_b, user_a)):
+        count = get_friend_count(db, actor) or 0
+        if count <= limit:
+            recent = (
+                select(literal(reader), models.FeedActivity.id, models.FeedActivity.created_at)
+                .where(models.FeedActivity.actor_id == actor)
+                .order_by(models.FeedActivity.created_at.desc())
+                .limit(settings.FEED_BACKFILL_SIZE)
+            )
+            db.execute(
+                pg_insert(models.FeedEntry)
+                .from_select(["user_id", "activity_id", "created_at"], recent)
+                .on_conflict_do_nothing()
+            )
+            continue
+        pulling = (
+            db.query(func.count()).select_from(models.FeedPullSource).filter(models.FeedPullSource.source_id == actor).scalar()
+        )
+        if pulling < count:
+            # Passou do limite (inclusive num salto, ex.: após reconcile-friend-counts): todos os amigos
+            # que ainda não leem o ator sob demanda passam a ler, o novo leitor entre eles
+            readers = select(_friends_of(actor).c.id, literal(actor))
+            db.execute(
+                pg_insert(models.FeedPullSource).from_select(["user_id", "source_id"], readers).on_conflict_do_nothing()
+            )
+
+
+def _feed_disconnect(db: Session, user_a, user_b):
+    """Amizade desfeita: tira das timelines as atividades de um lado no feed do outro."""
+    for reader, actor in ((user_a, user_b), (user_b, user_a)):
+        actor_activities = select(models.FeedActivity.id).where(models.FeedActivity.actor_id == actor)
+        db.execute(
+            delete(models.FeedEntry).where(
+                models.FeedEntry.user_id == reader, models.FeedEntry.activity_id.in_(actor_activities)
+            )
+        )
+        db.execute(
+            delete(models.FeedPullSource).where(
+                models.FeedPullSource.user_id == reader, models.FeedPullSource.source_id == actor
+            )
+        )
+
+
+def _feed_visible():
+    return or_(models.FeedActivity.verb != "checkin", models.User.auto_checkin_visibility.in_(FEED_CHECKIN_VISIBILITY))
+
+
+FEED_ITEM_COLUMNS = (
+    models.FeedActivity.id,
+    models.FeedActivity.verb,
+    models.FeedActivity.actor_id,
+    models.FeedActivity.object_id,
+    models.FeedActivity.created_at,
+    models.User.name.label("actor_name"),
+    models.User.avatar_url.label("actor_avatar_url"),
+)
+
+
+def list_feed(db: Session, user_id, limit: int = 50, cursor: Optional[str] = None):
+    """Atividades recentes dos amigos, da mais nova para a mais antiga.
+
+    Une a timeline pré-computada do usuário com as atividades dos amigos que
+    não fazem fan-out (uma leitura limitada por fonte), então o custo depende
+    de `limit` e do número dessas fontes, não do total de amigos.
+    """
+    pushed = apply_keyset(
+        select(models.FeedEntry.activity_id.label("id"))
+        .join(models.FeedActivity, models.FeedActivity.id == models.FeedEntry.activity_id)
+        .join(models.User, models.User.id == models.FeedActivity.actor_id)
+        .where(models.FeedEntry.user_id == user_id, _feed_visible()),
+        models.FeedEntry.created_at,
+        models.FeedEntry.activity_id,
+        cursor,
+    ).limit(limit)
+    recent = (
+        apply_keyset(
+            select(models.FeedActivity.id)
+            .join(models.User, models.User.id == models.FeedActivity.actor_id)
+            .where(models.FeedActivity.actor_id == models.FeedPullSource.source_id, _feed_visible()),
+            models.FeedActivity.created_at,
+            models.FeedActivity.id,
+            cursor,
+        )
+        .limit(limit)
+        .lateral()
+    )
+    pulled = select(recent.c.id).select_from(models.FeedPullSource).join(recent, true()).where(
+        models.FeedPullSource.user_id == user_id
+    )
+    query = (
+        db.query(*FEED_ITEM_COLUMNS)
+        .join(models.User, models.User.id == models.FeedActivity.actor_id)
+        .filter(models.FeedActivity.id.in_(union(pushed, pulled)))
+    )
+    rows = paginate(query, models.FeedActivity.created_at, models.FeedActivity.id, cursor=cursor, skip=0, limit=limit)
+    return _feed_items(db, rows)
+
+
+def _feed_items(db: Session, rows) -> List[schemas.FeedItem]:
+    checkin_ids = [row.object_id for row in rows if row.verb == "checkin"]
+    event_ids = {row.object_id for row in rows if row.verb != "checkin"}
+    checkins = {}
+    if checkin_ids:
+        checkins = {c.id: c for c in db.query(*CHECKIN_READ_COLUMNS).filter(models.Checkin.id.in_(checkin_ids))}
+    events = {}
+    if event_ids:
+        events = {e.id: e for e in db.query(*EVENT_READ_COLUMNS).filter(models.Event.id.in_(event_ids))}
+    return [
+        schemas.FeedItem.model_validate(
+            {
+                "id": row.id,
+                "type": row.verb,
+                "actor_id": row.actor_id,
+                "actor_name": row.actor_name,
+                "actor_avatar_url": row.actor_avatar_url,
+                "created_at": row.created_at,
+                "checkin": checkins.get(row.object_id) if row.verb == "checkin" else None,
+                "event": events.get(row.object_id) if row.verb != "checkin" else None,
+            },
+            from_attributes=True,
+        )
+        for row in rows
+    ]
+
+
+TRIM_FEEDS_SQL = text(
+    """
+    DELETE FROM feed_entries e
+    USING (
+        SELECT user_id, activity_id
+        FROM (
+            SELECT user_id, activity_id,
+                   row_number() OVER (PARTITION BY user_id ORDER BY created_at DESC, activity_id DESC) AS position
+            FROM feed_entries
+        ) ranked
+        WHERE position > :size
+    ) old
+    WHERE e.user_id = old.user_id AND e.activity_id = old.activity_id
+    """
+)
+
+
+def trim_feeds(db: Session, size: Optional[int] = None) -> int:
+    """Mantém no máximo `size` entradas por timeline (FEED_TIMELINE_SIZE por padrão)."""
+    result = db.execute(TRIM_FEEDS_SQL, {"size": size or settings.FEED_TIMELINE_SIZE})
+    db.commit()
+    return result.rowcount
+
+
 # ===== Search / Discovery =====
+VENUE_TAG_MODES = {"all", "any"}
+
+
+def _load_venue_facets(db: Session):
+    return (
+        db.query(models.Venue.id, models.Venue.category, models.Venue.price_range, models.Venue.tags, models.Venue.rating)
+        .filter(models.Venue.is_active.isnot(False))
+        .yield_per(10000)
+    )
+
+
+def venue_search_facets(
+    db: Session,
+    *,
+    category: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+    min_rating: Optional[float] = None,
+    price_range: Optional[str] = None,
+    tags_mode: str = "all",
+):
+    facets.venue_facets.ensure_loaded(lambda: _load_venue_facets(db))
+    return facets.venue_facets.facets(
+        category=category, tags=tags, tags_mode=tags_mode, min_rating=min_rating, price_range=price_range
+    )
+
+
 def search_venues(
     db: Session,
     *,
@@ -808,16 +1627,21 @@ def search_venues(
     tags: Optional[List[str]] = None,
     min_rating: Optional[float] = None,
     price_range: Optional[str] = None,
+    tags_mode: str = "all",
     skip: int = 0,
     limit: int = 50,
 ):
-    query = db.query(models.Venue)
+    # Apenas locais ativos, o mesmo conjunto contado pelas facetas
+    query = db.query(*VENUE_READ_COLUMNS).filter(models.Venue.is_active.isnot(False))
     if category:
         query = query.filter(models.Venue.category == category)
     if tags:
-        # Busca se contem todos os tags fornecidos
-        for t in tags:
-            query = query.filter(models.Venue.tags.any(t))
+        # tags @> ARRAY[...] (todos) ou tags && ARRAY[...] (qualquer um), servidos pelo índice GIN
+        tags = list(dict.fromkeys(tags))
+        if tags_mode == "any":
+            query = query.filter(models.Venue.tags.overlap(tags))
+        else:
+            query = query.filter(models.Venue.tags.contains(tags))
     if min_rating is not None:
         query = query.filter(models.Venue.rating >= min_rating)
     if price_range:
@@ -835,7 +1659,7 @@ def search_events(
     skip: int = 0,
     limit: int = 50,
 ):
-    query = db.query(models.Event)
+    query = db.query(*EVENT_READ_COLUMNS)
     if group_id is not None:
         query = query.filter(models.Event.group_id == group_id)
     if venue_id is not None:
@@ -848,29 +1672,97 @@ def search_events(
 
 
 # ===== Admin / Maintenance =====
+REBUILD_CONVERSATIONS_SQL = text(
+    """
+    INSERT INTO conversations (id, user_id, counterpart_id, last_message_id, last_message_at, unread_count)
+    SELECT DISTINCT ON (user_id, counterpart_id)
+        gen_random_uuid(), user_id, counterpart_id, message_id, created_at,
+        count(*) FILTER (WHERE unread) OVER (PARTITION BY user_id, counterpart_id)
+    FROM (
+        SELECT sender_id AS user_id, receiver_id AS counterpart_id, id AS message_id, created_at, false AS unread
+        FROM messages
+        UNION ALL
+        SELECT receiver_id, sender_id, id, created_at, NOT coalesce(is_read, false)
+        FROM messages
+    ) AS sides
+    WHERE user_id IS NOT NULL AND counterpart_id IS NOT NULL
+    ORDER BY user_id, counterpart_id, created_at DESC, message_id DESC
+    ON CONFLICT ON CONSTRAINT conversations_user_counterpart_key DO UPDATE SET
+        last_message_id = EXCLUDED.last_message_id,
+        last_message_at = EXCLUDED.last_message_at,
+        unread_count = EXCLUDED.unread_count,
+        updated_at = now()
+    """
+)
+
+
+def rebuild_conversations(db: Session) -> int:
+    """Reconstrói a tabela conversations a partir do histórico de mensagens."""
+    result = db.execute(REBUILD_CONVERSATIONS_SQL)
+    db.commit()
+    return result.rowcount
+
+
+def reconcile_venue_ratings(db: Session, batch_size: int = 500) -> int:
+    """Recalcula rating_sum/total_reviews/rating de todos os locais a partir dos check-ins, em lotes."""
+    rating_sum = (
+        db.query(func.coalesce(func.sum(models.Checkin.rating), 0))
+        .filter(models.Checkin.venue_id == models.Venue.id)
+        .scalar_subquery()
+    )
+    review_count = (
+        db.query(func.count(models.Checkin.rating))
+        .filter(models.Checkin.venue_id == models.Venue.id)
+        .scalar_subquery()
+    )
+    processed = 0
+    last_id = None
+    while True:
+        query = db.query(models.Venue.id).order_by(models.Venue.id)
+        if last_id is not None:
+            query = query.filter(models.Venue.id > last_id)
+        ids = [row.id for row in query.limit(batch_size)]
+        if not ids:
+            break
+        db.query(models.Venue).filter(models.Venue.id.in_(ids)).update(
+            {
+                models.Venue.rating_sum: rating_sum,
+                models.Venue.total_reviews: review_count,
+                models.Venue.rating: _venue_rating_value(rating_sum, review_count),
+            },
+            synchronize_session=False,
+        )
+        db.commit()
+        processed += len(ids)
+        last_id = ids[-1]
+    facets.venue_facets.invalidate()
+    return processed
+
+
 def set_venue_active(db: Session, venue_id, active: bool):
-    venue = db.query(models.Venue).filter(models.Venue.id == venue_id).first()
+    venue = _update_returning(db, models.Venue, {"is_active": active}, models.Venue.id == venue_id)
     if not venue:
         return None
-    venue.is_active = active
     db.commit()
-    db.refresh(venue)
+    _sync_venue_indexes(venue)
     return venue
 
 
 def set_promotion_active(db: Session, promotion_id, active: bool):
-    promo = db.query(models.Promotion).filter(models.Promotion.id == promotion_id).first()
+    promo = _update_returning(db, models.Promotion, {"is_active": active}, models.Promotion.id == promotion_id)
     if not promo:
         return None
-    promo.is_active = active
     db.commit()
-    db.refresh(promo)
     return promo
 
 
 def add_group_interest(db: Session, group_id, interest_id):
-    link = models.GroupInterest(group_id=group_id, interest_id=interest_id)
-    db.add(link)
+    link = _insert_link(
+        db,
+        models.GroupInterest,
+        {"group_id": group_id, "interest_id": interest_id},
+        "group_interests_group_interest_key",
+    )
     db.commit()
     return link
 
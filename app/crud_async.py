@@ -0,0 +1,51 @@
+"""Async versions of the crud queries used by the `async def` routes."""
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, schemas
+
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    result = await db.execute(select(models.User).where(models.User.email == email))
+    return result.scalars().first()
+
+
+async def get_user_by_id(db: AsyncSession, user_id):
+    result = await db.execute(select(models.User).where(models.User.id == user_id))
+    return result.scalars().first()
+
+
+async def get_friend_count(db: AsyncSession, user_id):
+    result = await db.execute(select(models.User.friend_count).where(models.User.id == user_id))
+    return result.scalar()
+
+
+async def user_exists(db: AsyncSession, user_id) -> bool:
+    result = await db.execute(select(models.User.id).where(models.User.id == user_id))
+    return result.first() is not None
+
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    """INSERT ... ON CONFLICT (email) DO NOTHING RETURNING; None se o email já está cadastrado."""
+    values = dict(
+        id=user.id,
+        email=user.email,
+        name=user.name,
+        avatar_url=user.avatar_url,
+        bio=user.bio,
+        location=user.location,
+        phone=user.phone,
+        profile_visibility=user.profile_visibility,
+        auto_checkin_visibility=user.auto_checkin_visibility,
+        allow_messages_from=user.allow_messages_from,
+        review_delay=user.review_delay,
+        is_connectable=user.is_connectable,
+        notifications_enabled=user.notifications_enabled,
+    )
+    stmt = pg_insert(models.User).values(**values).on_conflict_do_nothing(index_elements=[models.User.email])
+    result = await db.execute(stmt.returning(models.User))
+    db_user = result.scalars().first()
+    await db.commit()
+    return db_user
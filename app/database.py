@@ -1,10 +1,18 @@
 """Database configuration and session management."""
 
 import os
+import threading
+import time
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from .config import settings
 
 
 def _build_database_url() -> str:
@@ -31,14 +39,109 @@ def _build_database_url() -> str:
     return f"postgresql+psycopg://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
 
 
+def _build_async_database_url(url: str) -> str:
+    """Same database, through psycopg's asyncio support."""
+    return make_url(url).set(drivername="postgresql+psycopg").render_as_string(hide_password=False)
+
+
+class PoolStats:
+    """Counters collected while waiting for a connection from the pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, waited: float, timed_out: bool):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+
+class _InstrumentedPoolMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except sa_exc.TimeoutError:
+            self.stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - started, timed_out=False)
+        return conn
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_stats(pool) -> dict:
+    """Snapshot of pool occupancy and checkout wait times."""
+    stats = pool.stats
+    attempts = stats.checkouts + stats.timeouts
+    return {
+        "size": pool.size(),
+        "max_overflow": pool._max_overflow,
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "checkouts": stats.checkouts,
+        "checkout_timeouts": stats.timeouts,
+        "wait_time_total_ms": round(stats.wait_total * 1000, 3),
+        "wait_time_avg_ms": round(stats.wait_total * 1000 / attempts, 3) if attempts else 0.0,
+        "wait_time_max_ms": round(stats.wait_max * 1000, 3),
+    }
+
+
+_POOL_OPTIONS = dict(
+    pool_pre_ping=True,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+)
+
 DATABASE_URL = _build_database_url()
+ASYNC_DATABASE_URL = _build_async_database_url(DATABASE_URL)
 
 # Create engine and session factory
 engine = create_engine(
     DATABASE_URL,
-    pool_pre_ping=True,
+    poolclass=InstrumentedQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    **_POOL_OPTIONS,
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: objects returned by INSERT/UPDATE ... RETURNING stay usable after commit
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+# Async engine used by the `async def` routes so they never block the event loop.
+# It has its own, smaller pool (DB_ASYNC_*): the two pools add up, they do not share a budget.
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=InstrumentedAsyncQueuePool,
+    pool_size=settings.DB_ASYNC_POOL_SIZE,
+    max_overflow=settings.DB_ASYNC_MAX_OVERFLOW,
+    **_POOL_OPTIONS,
+)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
@@ -48,4 +151,10 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    """Async counterpart of `get_db` for `async def` routes."""
+    async with AsyncSessionLocal() as db:
+        yield db
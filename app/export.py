@@ -0,0 +1,71 @@
+"""Streaming NDJSON/CSV exports rendered from server-side cursors."""
+
+import csv
+import io
+import json
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator
+
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .serialization import adapter
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _batches(rows: Iterable, size: int) -> Iterator[list]:
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def _ndjson(schema: Any, rows: Iterable, batch_size: int) -> Iterator[bytes]:
+    type_adapter = adapter(schema)
+    for batch in _batches(rows, batch_size):
+        yield b"".join(type_adapter.dump_json(type_adapter.validate_python(row, from_attributes=True)) + b"\n" for row in batch)
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _csv(schema: Any, rows: Iterable, batch_size: int) -> Iterator[bytes]:
+    type_adapter = adapter(schema)
+    fields = list(schema.model_fields)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for batch in _batches(rows, batch_size):
+        for row in batch:
+            data = type_adapter.dump_python(type_adapter.validate_python(row, from_attributes=True), mode="json")
+            writer.writerow([_csv_value(data[field]) for field in fields])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def stream_rows(fmt: str, schema: Any, query: Callable[[Session], Iterable], batch_size: int = 1000) -> Iterator[bytes]:
+    """Render `query(db)` as NDJSON or CSV, one chunk per batch.
+
+    The generator opens its own session for the stream. The export routes
+    declare get_db with scope="function", so the session used for their
+    existence checks goes back to the pool before the body starts; with the
+    default request scope it would sit idle in a transaction until the
+    stream ends, holding a second connection.
+    """
+    render = _csv if fmt == "csv" else _ndjson
+    db = SessionLocal()
+    try:
+        yield from render(schema, query(db), batch_size)
+    finally:
+        db.close()
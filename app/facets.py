@@ -0,0 +1,228 @@
+"""In-process facet index used by the venue search filter counts."""
+
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .config import settings
+
+# Faixas cumulativas de avaliação ("4" = nota >= 4)
+RATING_BUCKETS = (4, 3, 2, 1)
+
+
+class VenueFacetIndex:
+    """Posting sets of active venues per category, price range, tag and rating.
+
+    Counts are computed from the posting sets instead of a GROUP BY over the
+    venues table. Each facet ignores its own filter (disjunctive faceting), so
+    the client can show the alternatives to the value currently selected.
+    Writes made by this process are applied in place; the whole index is
+    reloaded after `ttl_seconds` so writes from other workers show up.
+    """
+
+    def __init__(self, ttl_seconds: float = 300.0):
+        self.ttl_seconds = ttl_seconds
+        self._venues: Dict[object, Tuple[str, Optional[str], Tuple[str, ...], float]] = {}
+        self._by_category: Dict[str, Set[object]] = {}
+        self._by_price: Dict[str, Set[object]] = {}
+        self._by_tag: Dict[str, Set[object]] = {}
+        self._by_rating: Dict[int, Set[object]] = {}
+        self._lock = threading.RLock()
+        self._reload_lock = threading.Lock()
+        self._loaded_at: Optional[float] = None
+        self._journal: Optional[List[Tuple[Callable, tuple]]] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def __len__(self) -> int:
+        return len(self._venues)
+
+    def _fresh(self) -> bool:
+        loaded_at = self._loaded_at
+        return loaded_at is not None and time.monotonic() - loaded_at < self.ttl_seconds
+
+    def ensure_loaded(self, fetch_rows: Callable[[], Iterable[Tuple[object, str, Optional[str], Optional[list], object]]]):
+        """Populate the index from `fetch_rows` (id, category, price_range, tags, rating) on first use and after the TTL.
+
+        The new index is built aside and swapped in, so queries keep using the
+        current one meanwhile; writes made during the build are replayed on it.
+        """
+        if self._fresh():
+            return
+        with self._reload_lock:
+            if self._fresh():
+                return
+            with self._lock:
+                self._journal = []
+            fresh = VenueFacetIndex(self.ttl_seconds)
+            try:
+                for venue_id, category, price_range, tags, rating in fetch_rows():
+                    fresh._put(venue_id, category, price_range, tags, rating)
+            except BaseException:
+                with self._lock:
+                    self._journal = None
+                raise
+            with self._lock:
+                journal, self._journal = self._journal, None
+                fresh._loaded_at = time.monotonic()
+                for method, args in journal:
+                    method(fresh, *args)
+                self._venues, self._by_category, self._by_price = fresh._venues, fresh._by_category, fresh._by_price
+                self._by_tag, self._by_rating = fresh._by_tag, fresh._by_rating
+                self._loaded_at = fresh._loaded_at
+
+    def invalidate(self):
+        """Drop the contents so the next query reloads from the database."""
+        with self._lock:
+            self._clear()
+            self._loaded_at = None
+
+    def _record(self, method: Callable, *args):
+        if self._journal is not None:
+            self._journal.append((method, args))
+
+    def _clear(self):
+        self._venues.clear()
+        self._by_category.clear()
+        self._by_price.clear()
+        self._by_tag.clear()
+        self._by_rating.clear()
+
+    @staticmethod
+    def _bucket(rating: float) -> int:
+        return int(math.floor(rating))
+
+    @staticmethod
+    def _add(postings: Dict, key, venue_id):
+        postings.setdefault(key, set()).add(venue_id)
+
+    @staticmethod
+    def _discard(postings: Dict, key, venue_id):
+        ids = postings.get(key)
+        if ids is not None:
+            ids.discard(venue_id)
+            if not ids:
+                del postings[key]
+
+    def _put(self, venue_id, category, price_range, tags, rating):
+        self._drop(venue_id)
+        entry = (category, price_range, tuple(dict.fromkeys(tags or ())), float(rating or 0))
+        self._venues[venue_id] = entry
+        self._add(self._by_category, entry[0], venue_id)
+        if entry[1] is not None:
+            self._add(self._by_price, entry[1], venue_id)
+        for tag in entry[2]:
+            self._add(self._by_tag, tag, venue_id)
+        self._add(self._by_rating, self._bucket(entry[3]), venue_id)
+
+    def _drop(self, venue_id):
+        entry = self._venues.pop(venue_id, None)
+        if entry is None:
+            return
+        category, price_range, tags, rating = entry
+        self._discard(self._by_category, category, venue_id)
+        if price_range is not None:
+            self._discard(self._by_price, price_range, venue_id)
+        for tag in tags:
+            self._discard(self._by_tag, tag, venue_id)
+        self._discard(self._by_rating, self._bucket(rating), venue_id)
+
+    def upsert(self, venue_id, category, price_range, tags, rating, active: bool = True):
+        """Reflect a venue write; inactive venues are removed."""
+        if not self.loaded:
+            return
+        with self._lock:
+            self._record(VenueFacetIndex.upsert, venue_id, category, price_range, tags, rating, active)
+            if not active:
+                self._drop(venue_id)
+            else:
+                self._put(venue_id, category, price_range, tags, rating)
+
+    def set_rating(self, venue_id, rating):
+        """Move an indexed venue to the bucket of its new rating."""
+        if not self.loaded:
+            return
+        with self._lock:
+            self._record(VenueFacetIndex.set_rating, venue_id, rating)
+            entry = self._venues.get(venue_id)
+            if entry is not None:
+                self._put(venue_id, entry[0], entry[1], entry[2], rating)
+
+    def remove(self, venue_id):
+        if not self.loaded:
+            return
+        with self._lock:
+            self._record(VenueFacetIndex.remove, venue_id)
+            self._drop(venue_id)
+
+    def _rating_at_least(self, min_rating: float) -> Set[object]:
+        floor = self._bucket(min_rating)
+        ids: Set[object] = set()
+        for bucket, members in self._by_rating.items():
+            if bucket > floor:
+                ids |= members
+            elif bucket == floor:
+                ids.update(venue_id for venue_id in members if self._venues[venue_id][3] >= min_rating)
+        return ids
+
+    def _match(self, filters: Dict[str, Set[object]], skip: Optional[str] = None) -> Optional[Set[object]]:
+        """Intersect the filter sets, ignoring `skip`; None means every indexed venue."""
+        sets = sorted((ids for name, ids in filters.items() if name != skip), key=len)
+        if not sets:
+            return None
+        result = set(sets[0])
+        for ids in sets[1:]:
+            result &= ids
+            if not result:
+                break
+        return result
+
+    def _counts(self, postings: Dict[str, Set[object]], ids: Optional[Set[object]]) -> Dict[str, int]:
+        if ids is None:
+            return {key: len(members) for key, members in postings.items()}
+        return {key: count for key, members in postings.items() if (count := len(ids & members))}
+
+    def facets(
+        self,
+        *,
+        category: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        tags_mode: str = "all",
+        min_rating: Optional[float] = None,
+        price_range: Optional[str] = None,
+    ) -> Dict[str, Dict[str, int]]:
+        """Counts per category, price_range, tag and rating bucket for the given filters."""
+        with self._lock:
+            filters: Dict[str, Set[object]] = {}
+            if category:
+                filters["category"] = self._by_category.get(category, set())
+            if price_range:
+                filters["price_range"] = self._by_price.get(price_range, set())
+            if tags:
+                postings = [self._by_tag.get(tag, set()) for tag in dict.fromkeys(tags)]
+                if tags_mode == "any":
+                    filters["tags"] = set().union(*postings)
+                else:
+                    filters["tags"] = set.intersection(*postings)
+            if min_rating is not None:
+                filters["rating"] = self._rating_at_least(min_rating)
+
+            rated = self._match(filters, skip="rating")
+            per_bucket = {
+                bucket: len(members) if rated is None else len(rated & members) for bucket, members in self._by_rating.items()
+            }
+            return {
+                "category": self._counts(self._by_category, self._match(filters, skip="category")),
+                "price_range": self._counts(self._by_price, self._match(filters, skip="price_range")),
+                "tags": self._counts(self._by_tag, self._match(filters, skip="tags")),
+                "rating": {
+                    str(threshold): sum(count for bucket, count in per_bucket.items() if bucket >= threshold)
+                    for threshold in RATING_BUCKETS
+                },
+            }
+
+
+venue_facets = VenueFacetIndex(ttl_seconds=settings.FACET_INDEX_TTL_SECONDS)
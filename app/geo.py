@@ -0,0 +1,216 @@
+"""In-process spatial index used by the venue proximity queries."""
+
+import heapq
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .config import settings
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180.0
+
+
+def _hav(angle: float) -> float:
+    return math.sin(angle / 2) ** 2
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points, in kilometers."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class VenueGeoIndex:
+    """Uniform lat/lon grid holding the coordinates of active venues.
+
+    A query only visits the grid rows within `radius_km` of the origin and,
+    in each row, the columns whose longitude can still be within the radius
+    at that row's latitude. Cells are scanned by their lower-bound distance
+    so k-nearest lookups stop once no remaining cell can hold a closer
+    venue. Writes made by this process are applied in place; the whole index
+    is reloaded after `ttl_seconds` so writes from other workers show up.
+    """
+
+    def __init__(self, cell_deg: float = 0.05, ttl_seconds: float = 300.0):
+        self.cell_deg = cell_deg
+        self.ttl_seconds = ttl_seconds
+        self._lon_cells = int(math.ceil(360.0 / cell_deg))
+        self._lat_cells = int(math.ceil(180.0 / cell_deg))
+        self._cells: Dict[Tuple[int, int], Dict[object, Tuple[float, float]]] = {}
+        self._cell_of: Dict[object, Tuple[int, int]] = {}
+        # Colunas ocupadas de cada linha, para não percorrer linhas vazias perto dos polos
+        self._rows: Dict[int, Set[int]] = {}
+        self._lock = threading.RLock()
+        self._reload_lock = threading.Lock()
+        self._loaded_at: Optional[float] = None
+        self._journal: Optional[List[Tuple[object, Optional[Tuple[float, float]]]]] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def __len__(self) -> int:
+        return len(self._cell_of)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        row = min(max(int((lat + 90.0) // self.cell_deg), 0), self._lat_cells - 1)
+        col = int(((lon + 180.0) % 360.0) // self.cell_deg)
+        return row, col
+
+    def _fresh(self) -> bool:
+        loaded_at = self._loaded_at
+        return loaded_at is not None and time.monotonic() - loaded_at < self.ttl_seconds
+
+    def ensure_loaded(self, fetch_rows: Callable[[], Iterable[Tuple[object, float, float]]]):
+        """Populate the index from `fetch_rows` on first use and again once it is older than the TTL.
+
+        The new grid is built aside and swapped in, so queries keep using the
+        current one meanwhile; writes made during the build are replayed on it.
+        """
+        if self._fresh():
+            return
+        with self._reload_lock:
+            if self._fresh():
+                return
+            with self._lock:
+                self._journal = []
+            fresh = VenueGeoIndex(self.cell_deg, self.ttl_seconds)
+            try:
+                for venue_id, lat, lon in fetch_rows():
+                    fresh._put(venue_id, float(lat), float(lon))
+            except BaseException:
+                with self._lock:
+                    self._journal = None
+                raise
+            with self._lock:
+                journal, self._journal = self._journal, None
+                for venue_id, point in journal:
+                    if point is None:
+                        fresh._drop(venue_id)
+                    else:
+                        fresh._put(venue_id, *point)
+                self._cells, self._cell_of, self._rows = fresh._cells, fresh._cell_of, fresh._rows
+                self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        """Drop the contents so the next query reloads from the database."""
+        with self._lock:
+            self._cells, self._cell_of, self._rows = {}, {}, {}
+            self._loaded_at = None
+
+    def _put(self, venue_id, lat: float, lon: float):
+        self._drop(venue_id)
+        key = self._cell(lat, lon)
+        self._cells.setdefault(key, {})[venue_id] = (lat, lon)
+        self._cell_of[venue_id] = key
+        self._rows.setdefault(key[0], set()).add(key[1])
+
+    def _drop(self, venue_id):
+        key = self._cell_of.pop(venue_id, None)
+        if key is None:
+            return
+        bucket = self._cells.get(key)
+        if bucket is not None:
+            bucket.pop(venue_id, None)
+            if not bucket:
+                del self._cells[key]
+                columns = self._rows.get(key[0])
+                if columns is not None:
+                    columns.discard(key[1])
+                    if not columns:
+                        del self._rows[key[0]]
+
+    def upsert(self, venue_id, lat: Optional[float], lon: Optional[float], active: bool = True):
+        """Reflect a venue write; venues without coordinates or inactive are removed."""
+        if not self.loaded:
+            return
+        with self._lock:
+            if lat is None or lon is None or not active:
+                self._record(venue_id, None)
+                self._drop(venue_id)
+            else:
+                self._record(venue_id, (float(lat), float(lon)))
+                self._put(venue_id, float(lat), float(lon))
+
+    def remove(self, venue_id):
+        if not self.loaded:
+            return
+        with self._lock:
+            self._record(venue_id, None)
+            self._drop(venue_id)
+
+    def _record(self, venue_id, point: Optional[Tuple[float, float]]):
+        if self._journal is not None:
+            self._journal.append((venue_id, point))
+
+    def _candidate_cells(self, lat: float, lon: float, radius_km: float) -> List[Tuple[float, int, int]]:
+        """Occupied cells that may hold a venue within `radius_km`, as (lower-bound haversine, row, col)."""
+        hav_radius = _hav(min(radius_km / EARTH_RADIUS_KM, math.pi))
+        cos_origin = math.cos(math.radians(lat))
+        lon = (lon + 180.0) % 360.0 - 180.0
+        origin_col = self._cell(lat, lon)[1]
+        span_deg = radius_km / KM_PER_DEGREE
+        first_row = self._cell(max(-90.0, lat - span_deg), lon)[0]
+        last_row = self._cell(min(90.0, lat + span_deg), lon)[0]
+        candidates = []
+        for row in range(first_row, last_row + 1):
+            columns = self._rows.get(row)
+            if not columns:
+                continue
+            south = -90.0 + row * self.cell_deg
+            north = min(90.0, south + self.cell_deg)
+            dlat = 0.0 if south <= lat <= north else min(abs(lat - south), abs(lat - north))
+            hav_dlat = _hav(math.radians(dlat))
+            if hav_dlat > hav_radius:
+                continue
+            # hav(d) = hav(Δφ) + cos φ1 · cos φ2 · hav(Δλ); o menor cos φ2 da linha dá o maior Δλ possível
+            scale = cos_origin * min(math.cos(math.radians(south)), math.cos(math.radians(north)))
+            remaining = hav_radius - hav_dlat
+            if scale <= remaining:
+                scan = columns
+            else:
+                max_dlon = math.degrees(2 * math.asin(math.sqrt(remaining / scale)))
+                span_cols = int(max_dlon // self.cell_deg) + 1
+                if 2 * span_cols + 1 >= len(columns):
+                    scan = columns
+                else:
+                    scan = [
+                        col
+                        for col in ((origin_col + offset) % self._lon_cells for offset in range(-span_cols, span_cols + 1))
+                        if col in columns
+                    ]
+            for col in scan:
+                west = -180.0 + col * self.cell_deg
+                east = west + self.cell_deg
+                dlon = 0.0 if west <= lon < east else min((west - lon) % 360.0, (lon - east) % 360.0)
+                bound = hav_dlat + max(scale, 0.0) * _hav(math.radians(dlon))
+                if bound <= hav_radius:
+                    candidates.append((bound, row, col))
+        return candidates
+
+    def nearby(self, lat: float, lon: float, radius_km: float, limit: int) -> List[Tuple[object, float]]:
+        """Return up to `limit` (venue_id, distance_km) pairs within `radius_km`, closest first."""
+        best: List[Tuple[float, object]] = []  # max-heap via negated distance
+        with self._lock:
+            candidates = self._candidate_cells(lat, lon, radius_km)
+            candidates.sort(key=lambda candidate: candidate[0])
+            for bound, row, col in candidates:
+                if len(best) >= limit and bound >= _hav(-best[0][0] / EARTH_RADIUS_KM):
+                    break
+                for venue_id, (vlat, vlon) in self._cells[(row, col)].items():
+                    distance = haversine_km(lat, lon, vlat, vlon)
+                    if distance > radius_km:
+                        continue
+                    if len(best) < limit:
+                        heapq.heappush(best, (-distance, venue_id))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, venue_id))
+        return [(venue_id, -neg) for neg, venue_id in sorted(best, reverse=True)]
+
+
+venue_index = VenueGeoIndex(ttl_seconds=settings.GEO_INDEX_TTL_SECONDS)
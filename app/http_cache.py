@@ -0,0 +1,79 @@
+"""Conditional GET support: ETag/Last-Modified validators and 304 responses."""
+
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, Optional, Sequence
+
+from fastapi import Request, Response
+
+NOT_MODIFIED = 304
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Weak comparison of `etag` against If-None-Match (RFC 9110, 13.1.2)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    opaque = etag.removeprefix("W/")
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in tags or opaque in tags
+
+
+def _modified_since(request: Request, last_modified: datetime) -> bool:
+    header = request.headers.get("if-modified-since")
+    if not header:
+        return True
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return True
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # Last-Modified tem resolução de segundos
+    return last_modified.replace(microsecond=0) > since
+
+
+def not_modified_response(response: Response) -> Response:
+    """304 carrying the validators (and any other headers) already set on `response`."""
+    return Response(status_code=NOT_MODIFIED, headers=dict(response.headers))
+
+
+def _validators(rows: Iterable, counters: Sequence[str] = ()) -> tuple[str, Optional[datetime]]:
+    digest = hashlib.sha1()
+    last_modified = None
+    for row in rows:
+        changed = row.updated_at or row.created_at
+        counted = ",".join(str(getattr(row, name)) for name in counters)
+        digest.update(f"{row.id}:{changed.isoformat() if changed else ''}:{counted};".encode())
+        if changed is not None and (last_modified is None or changed > last_modified):
+            last_modified = changed
+    return f'W/"{digest.hexdigest()[:20]}"', last_modified
+
+
+def conditional_response(request: Request, response: Response, rows, counters: Sequence[str] = ()) -> Optional[Response]:
+    """Set ETag (and Last-Modified for one object) for `rows` and return a 304 if the client copy is current.
+
+    The validators are derived from each row's id and updated_at, so the
+    body never has to be serialized to answer a conditional request. When
+    If-None-Match is present it takes precedence over If-Modified-Since.
+    Lists get only an ETag: a row deleted from, or pushed out of, the page
+    does not move the newest updated_at, so Last-Modified would miss it.
+    `counters` names columns shown in the body that are written without
+    touching updated_at; they go into the ETag, and rule out Last-Modified.
+    """
+    collection = isinstance(rows, list)
+    etag, last_modified = _validators(rows if collection else [rows], counters)
+    # Respostas autenticadas: o cliente guarda a cópia, mas sempre revalida
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.headers["ETag"] = etag
+    if collection or counters:
+        matched = etag_matches(request, etag)
+    else:
+        if last_modified is not None:
+            response.headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+        if "if-none-match" in request.headers:
+            matched = etag_matches(request, etag)
+        else:
+            matched = last_modified is not None and not _modified_since(request, last_modified)
+    return not_modified_response(response) if matched else None
@@ -1,25 +1,58 @@
 # app/main.py
 
-from fastapi import FastAPI, Depends, HTTPException, status, Query, Path
+from contextlib import asynccontextmanager
+
+import asyncio
+import time
+
+import anyio
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Path, Request, Response, WebSocket
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from jose import JWTError, jwt
 from uuid import UUID
-from typing import Optional, List
+from typing import Optional, List, Union
 
-from . import crud, models, schemas, auth
-from .database import engine, get_db
+from . import crud, crud_async, models, schemas, auth, catalog, export, http_cache, maintenance, pagination, realtime
+from .social_graph import social_graph
+from .cache import principal_cache
+from .config import settings
+from .database import AsyncSessionLocal, async_engine, engine, get_async_db, get_db, pool_stats
 
 # Cria as tabelas no banco de dados (se não existirem)
 models.Base.metadata.create_all(bind=engine)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Rotas síncronas rodam no threadpool; limitá-lo ao tamanho do pool evita threads presas no checkout
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.THREADPOOL_SIZE
+    tasks = []
+    if settings.REALTIME_BACKEND == "postgres":
+        tasks.append(asyncio.create_task(realtime.listen()))
+    if settings.UNREAD_RECONCILE_INTERVAL_SECONDS > 0:
+        tasks.append(asyncio.create_task(maintenance.reconcile_unread_counts_periodically(settings.UNREAD_RECONCILE_INTERVAL_SECONDS)))
+    yield
+    for task in tasks:
+        task.cancel()
+
+
 app = FastAPI(
     title="CheckIn API",
     description="API para sistema de CheckIn",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
+# Versão do snapshot de interesses/badges, para requisições condicionais dos clientes
+CATALOG_VERSION_HEADER = "X-Catalog-Version"
+# Total da coleção paginada, quando é barato (ex.: users.friend_count)
+TOTAL_COUNT_HEADER = "X-Total-Count"
+# Contadores de schemas.User gravados sem tocar em updated_at; entram no ETag (http_cache)
+USER_COUNTERS = ("friend_count",)
+
 # Configuração CORS
 app.add_middleware(
     CORSMiddleware,
@@ -27,28 +60,85 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[pagination.NEXT_CURSOR_HEADER, "ETag", "Last-Modified", CATALOG_VERSION_HEADER, TOTAL_COUNT_HEADER],
 )
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-# Função para obter usuário atual
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Não foi possível validar as credenciais",
-        headers={"WWW-Authenticate": "Bearer"},
+@app.exception_handler(pagination.InvalidCursor)
+def invalid_cursor_handler(request: Request, exc: pagination.InvalidCursor):
+    return JSONResponse(status_code=422, content={"detail": str(exc)})
+
+
+# Coluna da chave estrangeira violada -> mensagem 404 correspondente
+REFERENCE_NOT_FOUND = {
+    "user_id": "Usuário não encontrado",
+    "friend_id": "Usuário não encontrado",
+    "interest_id": "Interesse não encontrado",
+    "badge_id": "Badge não encontrada",
+    "group_id": "Grupo não encontrado",
+    "event_id": "Evento não encontrado",
+}
+
+
+def reference_not_found(exc: crud.ReferenceNotFound) -> HTTPException:
+    return HTTPException(status_code=404, detail=REFERENCE_NOT_FOUND.get(exc.column, "Registro não encontrado"))
+
+
+def export_response(fmt: str, filename: str, query) -> StreamingResponse:
+    if fmt not in export.EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=422, detail="Formato de exportação inválido")
+    return StreamingResponse(
+        export.stream_rows(fmt, schemas.Checkin, query),
+        media_type=export.EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
     )
+
+
+def set_next_cursor(response: Response, rows, attr: str, limit: int):
+    cursor = pagination.next_cursor(rows, attr, limit)
+    if cursor:
+        response.headers[pagination.NEXT_CURSOR_HEADER] = cursor
+    return rows
+
+def catalog_not_modified(request: Request, response: Response, snapshot) -> bool:
+    """Define ETag/X-Catalog-Version e indica se o cliente já tem esta versão (If-None-Match)."""
+    etag = f'"{snapshot.version}"'
+    response.headers["ETag"] = etag
+    response.headers[CATALOG_VERSION_HEADER] = snapshot.version
+    return http_cache.etag_matches(request, etag)
+
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+
+async def user_from_token(token: str):
+    """Usuário do JWT e o `exp` do token, ou (None, None) se o token for inválido."""
     try:
         payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
-            raise credentials_exception
+            return None, None
         token_data = schemas.TokenData(email=email)
     except JWTError:
-        raise credentials_exception
-    user = crud.get_user_by_email(db, email=token_data.email)
+        return None, None
+    user = principal_cache.get(token_data.email)
+    if user is None:
+        # Sessão própria e curta: a conexão volta ao pool antes de a rota executar
+        async with AsyncSessionLocal() as db:
+            user = await crud_async.get_user_by_email(db, email=token_data.email)
+        if user is None:
+            return None, None
+        principal_cache.set(token_data.email, user)
+    return user, payload.get("exp")
+
+# Função para obter usuário atual
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    user, _ = await user_from_token(token)
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Não foi possível validar as credenciais",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
 
 @app.get("/")
@@ -56,15 +146,15 @@ def read_root():
     return {"message": "Bem-vindo à API CheckIn!"}
 
 @app.post("/register", response_model=schemas.User)
-def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, email=user.email)
-    if db_user:
+async def register_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await crud_async.create_user(db=db, user=user)
+    if db_user is None:
         raise HTTPException(status_code=400, detail="Email já registrado")
-    return crud.create_user(db=db, user=user)
+    return db_user
 
 @app.post("/login", response_model=schemas.Token)
-def login_for_access_token(payload: schemas.LoginRequest, db: Session = Depends(get_db)):
-    user = crud.get_user_by_email(db, email=payload.email)
+async def login_for_access_token(payload: schemas.LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await crud_async.get_user_by_email(db, email=payload.email)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -74,13 +164,22 @@ def login_for_access_token(payload: schemas.LoginRequest, db: Session = Depends(
     access_token = auth.create_access_token(data={"sub": user.email})
     return {"access_token": access_token, "token_type": "bearer"}
 
+@app.get("/users/me/friend-suggestions", response_model=list[schemas.FriendSuggestion])
+def friend_suggestions(limit: int = Query(20, ge=1, le=100), db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    return crud.list_friend_suggestions(db, current_user.id, limit=limit)
+
+
 @app.get("/users/me", response_model=schemas.User)
-async def read_users_me(current_user: models.User = Depends(get_current_user)):
-    return current_user
+async def read_users_me(db: AsyncSession = Depends(get_async_db), current_user: models.User = Depends(get_current_user)):
+    # O usuário vem do principal_cache; só a identidade/perfil são invalidados lá, os contadores são lidos agora
+    friend_count = await crud_async.get_friend_count(db, current_user.id)
+    return schemas.User.model_validate(current_user).model_copy(update={"friend_count": friend_count or 0})
 
 
 @app.get("/users", response_model=list[schemas.User])
 def list_users(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
     search: Optional[str] = Query(None),
@@ -89,15 +188,16 @@ def list_users(
     db: Session = Depends(get_db),
     _: models.User = Depends(get_current_user),
 ):
-    return crud.list_users(db, skip=skip, limit=limit, search=search, sort_by=sort_by, sort_order=sort_order)
+    users = crud.list_users(db, skip=skip, limit=limit, search=search, sort_by=sort_by, sort_order=sort_order)
+    return http_cache.conditional_response(request, response, users, counters=USER_COUNTERS) or users
 
 
 @app.get("/users/{user_id}", response_model=schemas.User)
-def get_user(user_id: UUID = Path(...), db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
-    user = crud.get_user_by_id(db, user_id)
+async def get_user(request: Request, response: Response, user_id: UUID = Path(...), db: AsyncSession = Depends(get_async_db), _: models.User = Depends(get_current_user)):
+    user = await crud_async.get_user_by_id(db, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
-    return user
+    return http_cache.conditional_response(request, response, user, counters=USER_COUNTERS) or user
 
 
 @app.patch("/users/{user_id}", response_model=schemas.User)
@@ -124,6 +224,8 @@ def create_venue(payload: schemas.VenueCreate, db: Session = Depends(get_db), _:
 
 @app.get("/venues", response_model=list[schemas.Venue])
 def list_venues(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
     search: Optional[str] = Query(None),
@@ -132,15 +234,51 @@ def list_venues(
     db: Session = Depends(get_db),
     _: models.User = Depends(get_current_user),
 ):
-    return crud.list_venues(db, skip=skip, limit=limit, search=search, sort_by=sort_by, sort_order=sort_order)
+    venues = crud.list_venues(db, skip=skip, limit=limit, search=search, sort_by=sort_by, sort_order=sort_order)
+    return http_cache.conditional_response(request, response, venues) or venues
+
+
+@app.get("/venues/nearby", response_model=list[schemas.VenueNearby])
+def list_nearby_venues(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(5, gt=0, le=100),
+    limit: int = Query(50, ge=1, le=100),
+    db: Session = Depends(get_db),
+    _: models.User = Depends(get_current_user),
+):
+    return crud.list_nearby_venues(db, lat=lat, lon=lon, radius_km=radius_km, limit=limit)
+
+
+# Declarada antes de /venues/{venue_id} para não ser capturada pela rota com parâmetro
+@app.get("/venues/search", response_model=Union[list[schemas.Venue], schemas.VenueSearchResult])
+def search_venues(
+    category: str | None = Query(None),
+    tags: Optional[List[str]] = Query(None),
+    min_rating: Optional[float] = Query(None, ge=0, le=5),
+    price_range: Optional[str] = Query(None),
+    tags_mode: str = Query("all", description="all: contém todas as tags; any: contém ao menos uma"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=100),
+    facets: bool = Query(False, description="Inclui contagens por categoria, faixa de preço, tag e avaliação"),
+    db: Session = Depends(get_db),
+    _: models.User = Depends(get_current_user),
+):
+    if tags_mode not in crud.VENUE_TAG_MODES:
+        raise HTTPException(status_code=422, detail="Modo de tags inválido")
+    filters = dict(category=category, tags=tags, min_rating=min_rating, price_range=price_range, tags_mode=tags_mode)
+    venues = crud.search_venues(db, **filters, skip=skip, limit=limit)
+    if not facets:
+        return venues
+    return schemas.VenueSearchResult(items=venues, facets=crud.venue_search_facets(db, **filters))
 
 
 @app.get("/venues/{venue_id}", response_model=schemas.Venue)
-def get_venue(venue_id: UUID, db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
+def get_venue(request: Request, response: Response, venue_id: UUID, db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
     venue = crud.get_venue(db, venue_id)
     if not venue:
         raise HTTPException(status_code=404, detail="Local não encontrado")
-    return venue
+    return http_cache.conditional_response(request, response, venue) or venue
 
 
 @app.patch("/venues/{venue_id}", response_model=schemas.Venue)
@@ -168,6 +306,8 @@ def create_group(payload: schemas.GroupCreate, db: Session = Depends(get_db), cu
 
 @app.get("/groups", response_model=list[schemas.Group])
 def list_groups(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
     search: Optional[str] = Query(None),
@@ -176,15 +316,16 @@ def list_groups(
     db: Session = Depends(get_db),
     _: models.User = Depends(get_current_user),
 ):
-    return crud.list_groups(db, skip=skip, limit=limit, search=search, sort_by=sort_by, sort_order=sort_order)
+    groups = crud.list_groups(db, skip=skip, limit=limit, search=search, sort_by=sort_by, sort_order=sort_order)
+    return http_cache.conditional_response(request, response, groups) or groups
 
 
 @app.get("/groups/{group_id}", response_model=schemas.Group)
-def get_group(group_id: UUID, db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
+def get_group(request: Request, response: Response, group_id: UUID, db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
     group = crud.get_group(db, group_id)
     if not group:
         raise HTTPException(status_code=404, detail="Grupo não encontrado")
-    return group
+    return http_cache.conditional_response(request, response, group) or group
 
 
 @app.patch("/groups/{group_id}", response_model=schemas.Group)
@@ -217,6 +358,8 @@ def create_interest(payload: schemas.InterestCreate, db: Session = Depends(get_d
 
 @app.get("/interests", response_model=list[schemas.Interest])
 def list_interests(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=200),
     search: Optional[str] = Query(None),
@@ -225,7 +368,12 @@ def list_interests(
     db: Session = Depends(get_db),
     _: models.User = Depends(get_current_user),
 ):
-    return crud.list_interests(db, skip=skip, limit=limit, search=search, sort_by=sort_by, sort_order=sort_order)
+    snapshot = crud.interest_snapshot(db)
+    if catalog_not_modified(request, response, snapshot):
+        return http_cache.not_modified_response(response)
+    return snapshot.query(
+        skip=skip, limit=limit, search=search, sort_by=sort_by, sort_order=sort_order, sort_fields=crud.INTEREST_SORT_FIELDS
+    )
 
 
 @app.get("/interests/{interest_id}", response_model=schemas.Interest)
@@ -261,6 +409,8 @@ def create_badge(payload: schemas.BadgeCreate, db: Session = Depends(get_db), _:
 
 @app.get("/badges", response_model=list[schemas.Badge])
 def list_badges(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=200),
     search: Optional[str] = Query(None),
@@ -269,7 +419,17 @@ def list_badges(
     db: Session = Depends(get_db),
     _: models.User = Depends(get_current_user),
 ):
-    return crud.list_badges(db, skip=skip, limit=limit, search=search, sort_by=sort_by, sort_order=sort_order)
+    snapshot = crud.badge_snapshot(db)
+    if catalog_not_modified(request, response, snapshot):
+        return http_cache.not_modified_response(response)
+    return snapshot.query(
+        skip=skip, limit=limit, search=search, sort_by=sort_by, sort_order=sort_order, sort_fields=crud.BADGE_SORT_FIELDS
+    )
+
+
+@app.get("/catalog/versions")
+def catalog_versions(db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
+    return {"interests": crud.interest_snapshot(db).version, "badges": crud.badge_snapshot(db).version}
 
 
 @app.get("/badges/{badge_id}", response_model=schemas.Badge)
@@ -291,13 +451,12 @@ def get_user_interests(user_id: UUID, db: Session = Depends(get_db), _: models.U
 def add_user_interest(user_id: UUID, interest_id: UUID, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     if current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Sem permissão para modificar interesses deste usuário")
-    if not crud.user_exists(db, user_id):
-        raise HTTPException(status_code=404, detail="Usuário não encontrado")
-    if not crud.interest_exists(db, interest_id):
-        raise HTTPException(status_code=404, detail="Interesse não encontrado")
-    if crud.user_interest_exists(db, user_id, interest_id):
+    try:
+        link = crud.add_user_interest(db, user_id, interest_id)
+    except crud.ReferenceNotFound as exc:
+        raise reference_not_found(exc)
+    if link is None:
         raise HTTPException(status_code=409, detail="Interesse já associado ao usuário")
-    crud.add_user_interest(db, user_id, interest_id)
     return {"status": "ok"}
 
 
@@ -323,13 +482,12 @@ def get_user_badges(user_id: UUID, db: Session = Depends(get_db), _: models.User
 def add_user_badge(user_id: UUID, badge_id: UUID, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     if current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Sem permissão para modificar badges deste usuário")
-    if not crud.user_exists(db, user_id):
-        raise HTTPException(status_code=404, detail="Usuário não encontrado")
-    if not crud.badge_exists(db, badge_id):
-        raise HTTPException(status_code=404, detail="Badge não encontrada")
-    if crud.user_badge_exists(db, user_id, badge_id):
+    try:
+        link = crud.add_user_badge(db, user_id, badge_id)
+    except crud.ReferenceNotFound as exc:
+        raise reference_not_found(exc)
+    if link is None:
         raise HTTPException(status_code=409, detail="Badge já associado ao usuário")
-    crud.add_user_badge(db, user_id, badge_id)
     return {"status": "ok"}
 
 
@@ -358,13 +516,15 @@ def add_group_member(group_id: UUID, payload: schemas.GroupMemberCreate, db: Ses
         raise HTTPException(status_code=404, detail="Grupo não encontrado")
     if group.created_by != current_user.id:
         raise HTTPException(status_code=403, detail="Sem permissão para adicionar membros")
-    if not crud.user_exists(db, payload.user_id):
-        raise HTTPException(status_code=404, detail="Usuário não encontrado")
-    if crud.group_member_exists(db, group_id, payload.user_id):
-        raise HTTPException(status_code=409, detail="Usuário já é membro do grupo")
     if payload.role and payload.role not in {"admin", "moderator", "member"}:
         raise HTTPException(status_code=422, detail="Role inválida")
-    return crud.add_group_member(db, group_id, payload.user_id, payload.role)
+    try:
+        member = crud.add_group_member(db, group_id, payload.user_id, payload.role)
+    except crud.ReferenceNotFound as exc:
+        raise reference_not_found(exc)
+    if member is None:
+        raise HTTPException(status_code=409, detail="Usuário já é membro do grupo")
+    return member
 
 
 @app.patch("/groups/{group_id}/members/{user_id}", response_model=schemas.GroupMember)
@@ -406,11 +566,12 @@ def add_group_interest(group_id: UUID, interest_id: UUID, db: Session = Depends(
         raise HTTPException(status_code=404, detail="Grupo não encontrado")
     if group.created_by != current_user.id:
         raise HTTPException(status_code=403, detail="Sem permissão para alterar interesses do grupo")
-    if not crud.interest_exists(db, interest_id):
-        raise HTTPException(status_code=404, detail="Interesse não encontrado")
-    if crud.group_interest_exists(db, group_id, interest_id):
+    try:
+        link = crud.add_group_interest(db, group_id, interest_id)
+    except crud.ReferenceNotFound as exc:
+        raise reference_not_found(exc)
+    if link is None:
         raise HTTPException(status_code=409, detail="Interesse já associado ao grupo")
-    crud.add_group_interest(db, group_id, interest_id)
     return {"status": "ok"}
 
 
@@ -461,8 +622,11 @@ def create_event(payload: schemas.EventCreate, db: Session = Depends(get_db), cu
 
 @app.get("/events", response_model=list[schemas.Event])
 def list_events(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
     group_id: Optional[UUID] = Query(None),
     venue_id: Optional[UUID] = Query(None),
     sort_by: Optional[str] = Query(None),
@@ -470,7 +634,7 @@ def list_events(
     db: Session = Depends(get_db),
     _: models.User = Depends(get_current_user),
 ):
-    return crud.list_events(
+    events = crud.list_events(
         db,
         skip=skip,
         limit=limit,
@@ -478,43 +642,70 @@ def list_events(
         venue_id=venue_id,
         sort_by=sort_by,
         sort_order=sort_order,
+        cursor=cursor,
+    )
+    set_next_cursor(response, events, sort_by if sort_by in crud.EVENT_SORT_FIELDS else "start_time", limit)
+    return http_cache.conditional_response(request, response, events) or events
+
+
+# Declarada antes de /events/{event_id} para não ser capturada pela rota com parâmetro
+@app.get("/events/search", response_model=list[schemas.Event])
+def search_events(
+    group_id: Optional[UUID] = Query(None),
+    venue_id: Optional[UUID] = Query(None),
+    start_from: Optional[str] = Query(None),
+    end_until: Optional[str] = Query(None),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=100),
+    db: Session = Depends(get_db),
+    _: models.User = Depends(get_current_user),
+):
+    return crud.search_events(
+        db,
+        group_id=group_id,
+        venue_id=venue_id,
+        start_from=start_from,
+        end_until=end_until,
+        skip=skip,
+        limit=limit,
     )
 
 
 @app.get("/events/{event_id}", response_model=schemas.Event)
-def get_event(event_id: UUID, db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
+def get_event(request: Request, response: Response, event_id: UUID, db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
     event = crud.get_event(db, event_id)
     if not event:
         raise HTTPException(status_code=404, detail="Evento não encontrado")
-    return event
+    return http_cache.conditional_response(request, response, event) or event
 
 
 @app.patch("/events/{event_id}", response_model=schemas.Event)
 def update_event(event_id: UUID, payload: schemas.EventUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    event = crud.get_event(db, event_id)
-    if not event:
-        raise HTTPException(status_code=404, detail="Evento não encontrado")
-    if event.created_by != current_user.id:
-        raise HTTPException(status_code=403, detail="Sem permissão para atualizar este evento")
     if payload.group_id and not crud.group_exists(db, payload.group_id):
         raise HTTPException(status_code=404, detail="Grupo não encontrado")
     if payload.venue_id and not crud.get_venue(db, payload.venue_id):
         raise HTTPException(status_code=404, detail="Local não encontrado")
-    return crud.update_event(db, event_id, payload)
+    # A permissão vai no WHERE do UPDATE; só em caso de falha se lê o evento para escolher o erro
+    event = crud.update_event(db, event_id, payload, owner_id=current_user.id)
+    if event is None:
+        if not crud.get_event(db, event_id):
+            raise HTTPException(status_code=404, detail="Evento não encontrado")
+        raise HTTPException(status_code=403, detail="Sem permissão para atualizar este evento")
+    return event
 
 
 @app.get("/groups/{group_id}/events", response_model=list[schemas.Event])
-def list_group_events(group_id: UUID, skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100), db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
+def list_group_events(group_id: UUID, response: Response, skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100), cursor: Optional[str] = Query(None), db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
     if not crud.group_exists(db, group_id):
         raise HTTPException(status_code=404, detail="Grupo não encontrado")
-    return crud.list_events(db, skip=skip, limit=limit, group_id=group_id)
+    return set_next_cursor(response, crud.list_events(db, skip=skip, limit=limit, group_id=group_id, cursor=cursor), "start_time", limit)
 
 
 @app.get("/venues/{venue_id}/events", response_model=list[schemas.Event])
-def list_venue_events(venue_id: UUID, skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100), db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
+def list_venue_events(venue_id: UUID, response: Response, skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100), cursor: Optional[str] = Query(None), db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
     if not crud.get_venue(db, venue_id):
         raise HTTPException(status_code=404, detail="Local não encontrado")
-    return crud.list_events(db, skip=skip, limit=limit, venue_id=venue_id)
+    return set_next_cursor(response, crud.list_events(db, skip=skip, limit=limit, venue_id=venue_id, cursor=cursor), "start_time", limit)
 
 
 # ===== Checkins =====
@@ -529,6 +720,11 @@ def create_checkin(payload: schemas.CheckinCreate, db: Session = Depends(get_db)
     return crud.create_checkin(db, payload)
 
 
+@app.post("/checkins/batch", response_model=schemas.CheckinBatchResult)
+def create_checkins_batch(payload: schemas.CheckinBatchCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    return crud.create_checkins_bulk(db, payload.items, user_id=current_user.id)
+
+
 @app.get("/checkins/{checkin_id}", response_model=schemas.Checkin)
 def get_checkin(checkin_id: UUID, db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
     checkin = crud.get_checkin(db, checkin_id)
@@ -559,17 +755,31 @@ def delete_checkin(checkin_id: UUID, db: Session = Depends(get_db), current_user
 
 
 @app.get("/users/{user_id}/checkins", response_model=list[schemas.Checkin])
-def list_user_checkins(user_id: UUID, skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100), db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
+def list_user_checkins(user_id: UUID, response: Response, skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100), cursor: Optional[str] = Query(None), db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
     if not crud.user_exists(db, user_id):
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
-    return crud.list_user_checkins(db, user_id, skip=skip, limit=limit)
+    return set_next_cursor(response, crud.list_user_checkins(db, user_id, skip=skip, limit=limit, cursor=cursor), "created_at", limit)
 
 
 @app.get("/venues/{venue_id}/checkins", response_model=list[schemas.Checkin])
-def list_venue_checkins(venue_id: UUID, skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100), db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
+def list_venue_checkins(venue_id: UUID, response: Response, skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100), cursor: Optional[str] = Query(None), db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
     if not crud.get_venue(db, venue_id):
         raise HTTPException(status_code=404, detail="Local não encontrado")
-    return crud.list_venue_checkins(db, venue_id, skip=skip, limit=limit)
+    return set_next_cursor(response, crud.list_venue_checkins(db, venue_id, skip=skip, limit=limit, cursor=cursor), "created_at", limit)
+
+
+@app.get("/users/{user_id}/checkins/export", response_class=StreamingResponse)
+def export_user_checkins(user_id: UUID, format: str = Query("ndjson", description="ndjson ou csv"), db: Session = Depends(get_db, scope="function"), _: models.User = Depends(get_current_user)):
+    if not crud.user_exists(db, user_id):
+        raise HTTPException(status_code=404, detail="Usuário não encontrado")
+    return export_response(format, f"checkins-user-{user_id}", lambda export_db: crud.stream_checkins(export_db, user_id=user_id))
+
+
+@app.get("/venues/{venue_id}/checkins/export", response_class=StreamingResponse)
+def export_venue_checkins(venue_id: UUID, format: str = Query("ndjson", description="ndjson ou csv"), db: Session = Depends(get_db, scope="function"), _: models.User = Depends(get_current_user)):
+    if not crud.get_venue(db, venue_id):
+        raise HTTPException(status_code=404, detail="Local não encontrado")
+    return export_response(format, f"checkins-venue-{venue_id}", lambda export_db: crud.stream_checkins(export_db, venue_id=venue_id))
 
 
 # ===== Promotions =====
@@ -615,18 +825,17 @@ def delete_promotion(promotion_id: UUID, db: Session = Depends(get_db), _: model
 # ===== Event Attendees (RSVP) =====
 @app.post("/events/{event_id}/attendees", response_model=schemas.EventAttendee)
 def add_event_attendee(event_id: UUID, payload: schemas.EventAttendeeCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    if not crud.event_exists(db, event_id):
-        raise HTTPException(status_code=404, detail="Evento não encontrado")
-    if not crud.user_exists(db, payload.user_id):
-        raise HTTPException(status_code=404, detail="Usuário não encontrado")
     if payload.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Sem permissão para confirmar presença por outro usuário")
     if payload.status and payload.status not in {"going", "maybe", "not_going"}:
         raise HTTPException(status_code=422, detail="Status inválido")
-    existing = crud.get_event_attendee(db, event_id, payload.user_id)
-    if existing:
+    try:
+        attendee = crud.add_event_attendee(db, event_id, payload.user_id, payload.status)
+    except crud.ReferenceNotFound as exc:
+        raise reference_not_found(exc)
+    if attendee is None:
         raise HTTPException(status_code=409, detail="Usuário já possui RSVP neste evento")
-    return crud.add_event_attendee(db, event_id, payload.user_id, payload.status)
+    return attendee
 
 
 @app.get("/events/{event_id}/attendees", response_model=list[schemas.EventAttendee])
@@ -663,18 +872,22 @@ def delete_event_attendee(event_id: UUID, user_id: UUID, db: Session = Depends(g
 # ===== Friendships =====
 @app.post("/friendships/requests", response_model=schemas.Friendship)
 def create_friend_request(payload: schemas.FriendshipRequestCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    if not crud.user_exists(db, payload.to_user_id):
-        raise HTTPException(status_code=404, detail="Usuário não encontrado")
     if payload.to_user_id == current_user.id:
         raise HTTPException(status_code=422, detail="Não é possível enviar solicitação para si mesmo")
-    # Evitar duplicatas simples: se já existe pendente em qualquer direção
-    outgoing = crud.list_outgoing_friend_requests(db, current_user.id)
-    if any(fr.friend_id == payload.to_user_id for fr in outgoing):
+    try:
+        friendship, existing = crud.create_friendship_request(db, current_user.id, payload.to_user_id)
+    except crud.ReferenceNotFound as exc:
+        raise reference_not_found(exc)
+    if existing is None:
+        return friendship
+    # Já existe um registro para o par, em alguma direção
+    if existing.status == "accepted":
+        raise HTTPException(status_code=409, detail="Vocês já são amigos")
+    if existing.status != "pending":
+        raise HTTPException(status_code=409, detail="Não é possível enviar solicitação para este usuário")
+    if existing.user_id == current_user.id:
         raise HTTPException(status_code=409, detail="Solicitação já enviada")
-    incoming = crud.list_incoming_friend_requests(db, current_user.id)
-    if any(fr.user_id == payload.to_user_id for fr in incoming):
-        raise HTTPException(status_code=409, detail="Você já possui uma solicitação deste usuário")
-    return crud.create_friendship_request(db, current_user.id, payload.to_user_id)
+    raise HTTPException(status_code=409, detail="Você já possui uma solicitação deste usuário")
 
 
 @app.get("/friendships/requests/incoming", response_model=list[schemas.Friendship])
@@ -730,11 +943,23 @@ def delete_friendship(friendship_id: UUID, db: Session = Depends(get_db), curren
     return {"status": "ok"}
 
 
-@app.get("/users/{user_id}/friends", response_model=list[schemas.User])
-def list_user_friends(user_id: UUID, db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
-    if not crud.user_exists(db, user_id):
+@app.get("/users/{user_id}/friends", response_model=list[schemas.Friend])
+def list_user_friends(user_id: UUID, response: Response, skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100), cursor: Optional[str] = Query(None), db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
+    friend_count = crud.get_friend_count(db, user_id)
+    if friend_count is None:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
-    return crud.list_user_friends(db, user_id)
+    response.headers[TOTAL_COUNT_HEADER] = str(friend_count)
+    return set_next_cursor(response, crud.list_user_friends(db, user_id, skip=skip, limit=limit, cursor=cursor), "friends_since", limit)
+
+
+@app.get("/users/{user_id}/mutual-friends/{other_id}", response_model=list[schemas.User])
+def list_mutual_friends(user_id: UUID, other_id: UUID, response: Response, skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100), db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
+    for uid in (user_id, other_id):
+        if not crud.user_exists(db, uid):
+            raise HTTPException(status_code=404, detail="Usuário não encontrado")
+    friends, total = crud.list_mutual_friends(db, user_id, other_id, skip=skip, limit=limit)
+    response.headers[TOTAL_COUNT_HEADER] = str(total)
+    return friends
 
 
 # ===== Messages =====
@@ -748,23 +973,24 @@ def create_message(payload: schemas.MessageCreate, db: Session = Depends(get_db)
 
 
 @app.get("/messages/threads", response_model=list[schemas.MessageThread])
-def get_threads(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    return crud.list_message_threads(db, current_user.id)
+def get_threads(skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100), db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    return crud.list_message_threads(db, current_user.id, skip=skip, limit=limit)
 
 
 @app.get("/messages/with/{user_id}", response_model=list[schemas.Message])
-def get_messages_with(user_id: UUID, skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100), db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_messages_with(user_id: UUID, response: Response, skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100), cursor: Optional[str] = Query(None), db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     if not crud.user_exists(db, user_id):
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
-    return crud.list_messages_between(db, current_user.id, user_id, skip=skip, limit=limit)
+    return set_next_cursor(response, crud.list_messages_between(db, current_user.id, user_id, skip=skip, limit=limit, cursor=cursor), "created_at", limit)
 
 
 @app.post("/messages/{message_id}/read", response_model=schemas.Message)
 def mark_message_read(message_id: UUID, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    msg = crud.mark_message_read(db, message_id)
+    # Como em PATCH /events: o destinatário vai no WHERE do UPDATE e só em caso de falha se escolhe o erro
+    msg = crud.mark_message_read(db, message_id, receiver_id=current_user.id)
     if not msg:
-        raise HTTPException(status_code=404, detail="Mensagem não encontrada")
-    if msg.receiver_id != current_user.id:
+        if not crud.message_exists(db, message_id):
+            raise HTTPException(status_code=404, detail="Mensagem não encontrada")
         raise HTTPException(status_code=403, detail="Sem permissão para marcar como lida")
     return msg
 
@@ -777,10 +1003,15 @@ def mark_thread_read(user_id: UUID, db: Session = Depends(get_db), current_user:
     return {"status": "ok"}
 
 
+@app.get("/me/unread-counts", response_model=schemas.UnreadCounts)
+def get_unread_counts(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    return crud.get_unread_counts(db, current_user.id)
+
+
 # ===== Notifications =====
 @app.get("/notifications", response_model=list[schemas.Notification])
-def get_notifications(skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100), db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    return crud.list_notifications(db, current_user.id, skip=skip, limit=limit)
+def get_notifications(response: Response, skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=100), cursor: Optional[str] = Query(None), db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    return set_next_cursor(response, crud.list_notifications(db, current_user.id, skip=skip, limit=limit, cursor=cursor), "created_at", limit)
 
 
 @app.post("/notifications", response_model=schemas.Notification)
@@ -817,52 +1048,68 @@ def delete_notification(notification_id: UUID, db: Session = Depends(get_db), cu
     return {"status": "ok"}
 
 
-# ===== Search / Discovery =====
-@app.get("/venues/search", response_model=list[schemas.Venue])
-def search_venues(
-    category: str | None = Query(None),
-    tags: Optional[List[str]] = Query(None),
-    min_rating: Optional[float] = Query(None, ge=0, le=5),
-    price_range: Optional[str] = Query(None),
-    skip: int = Query(0, ge=0),
-    limit: int = Query(50, ge=1, le=100),
-    db: Session = Depends(get_db),
-    _: models.User = Depends(get_current_user),
-):
-    return crud.search_venues(
-        db,
-        category=category,
-        tags=tags,
-        min_rating=min_rating,
-        price_range=price_range,
-        skip=skip,
-        limit=limit,
-    )
+# ===== Feed =====
+@app.get("/feed", response_model=list[schemas.FeedItem])
+def get_feed(response: Response, limit: int = Query(50, ge=1, le=100), cursor: Optional[str] = Query(None), db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    return set_next_cursor(response, crud.list_feed(db, current_user.id, limit=limit, cursor=cursor), "created_at", limit)
 
 
-@app.get("/events/search", response_model=list[schemas.Event])
-def search_events(
-    group_id: Optional[UUID] = Query(None),
-    venue_id: Optional[UUID] = Query(None),
-    start_from: Optional[str] = Query(None),
-    end_until: Optional[str] = Query(None),
-    skip: int = Query(0, ge=0),
-    limit: int = Query(50, ge=1, le=100),
-    db: Session = Depends(get_db),
-    _: models.User = Depends(get_current_user),
-):
-    return crud.search_events(
-        db,
-        group_id=group_id,
-        venue_id=venue_id,
-        start_from=start_from,
-        end_until=end_until,
-        skip=skip,
-        limit=limit,
-    )
+# ===== Admin / Maintenance =====
+# Código de fechamento para token inválido ou expirado (RFC 6455: policy violation)
+WS_POLICY_VIOLATION = 1008
+
+
+@app.websocket("/ws")
+async def realtime_updates(websocket: WebSocket, token: Optional[str] = Query(None)):
+    """Push de notificações e mensagens novas do usuário autenticado.
+
+    Navegadores não enviam Authorization no handshake, então o JWT vem em `?token=`.
+    Cada evento é um JSON {"type": "notification" | "message", "data": {...}};
+    {"type": "resync"} pede ao cliente que recarregue pelos endpoints REST.
+    A conexão é fechada com 1008 quando o token expira.
+    """
+    if token is None and websocket.headers.get("authorization", "").lower().startswith("bearer "):
+        token = websocket.headers["authorization"][7:]
+    user, expires_at = await user_from_token(token) if token else (None, None)
+    if user is None:
+        await websocket.close(code=WS_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    subscription = realtime.hub.subscribe(user.id)
+
+    async def forward():
+        while True:
+            await websocket.send_text(await subscription.next())
+
+    async def drain():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+        task_group.cancel_scope.cancel()
+
+    try:
+        with anyio.move_on_after(expires_at - time.time() if expires_at else float("inf")) as session_scope:
+            async with anyio.create_task_group() as task_group:
+                task_group.start_soon(forward)
+                task_group.start_soon(drain)
+        if session_scope.cancelled_caught:
+            await websocket.close(code=WS_POLICY_VIOLATION)
+    finally:
+        realtime.hub.unsubscribe(subscription)
+
+
+@app.get("/admin/stats")
+async def runtime_stats(_: models.User = Depends(get_current_user)):
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    return {
+        "principal_cache": principal_cache.stats(),
+        "catalogs": {"interests": catalog.interest_catalog.stats(), "badges": catalog.badge_catalog.stats()},
+        "db_pool": {"sync": pool_stats(engine.pool), "async": pool_stats(async_engine.pool)},
+        "threadpool": {"size": limiter.total_tokens, "busy": limiter.borrowed_tokens},
+        "realtime": realtime.hub.stats(),
+        "social_graph": social_graph.stats(),
+    }
 
 
-# ===== Admin / Maintenance =====
 @app.patch("/venues/{venue_id}/activate")
 def activate_venue(venue_id: UUID, db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
     venue = crud.set_venue_active(db, venue_id, True)
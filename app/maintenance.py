@@ -0,0 +1,129 @@
+"""Maintenance commands, e.g. `python -m app.maintenance reconcile-ratings`."""
+
+import argparse
+import asyncio
+import logging
+import sys
+from typing import Optional
+
+import anyio
+from sqlalchemy import func, select
+
+from . import crud, models, query_plans
+from .database import SessionLocal, engine
+
+logger = logging.getLogger(__name__)
+
+# Chave do advisory lock que garante um único worker reconciliando os contadores por vez
+UNREAD_RECONCILE_LOCK = 25_001
+
+
+def create_indexes() -> int:
+    """Cria os índices declarados nos modelos que ainda não existem (create_all não altera tabelas existentes)."""
+    created = 0
+    with engine.begin() as conn:
+        for table in models.Base.metadata.sorted_tables:
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                if not conn.dialect.has_index(conn, table.name, index.name):
+                    index.create(conn)
+                    created += 1
+    return created
+
+
+def reconcile_unread_counts_once(batch_size: int = 500) -> Optional[int]:
+    """Roda reconcile_unread_counts se nenhum outro processo estiver rodando; None se o lock estava ocupado."""
+    # O lock fica numa conexão própria: a sessão devolve a sua ao pool a cada commit
+    with engine.connect() as conn:
+        if not conn.execute(select(func.pg_try_advisory_lock(UNREAD_RECONCILE_LOCK))).scalar():
+            return None
+        try:
+            with SessionLocal() as db:
+                return crud.reconcile_unread_counts(db, batch_size=batch_size)
+        finally:
+            conn.execute(select(func.pg_advisory_unlock(UNREAD_RECONCILE_LOCK)))
+            conn.commit()
+
+
+async def reconcile_unread_counts_periodically(interval: float):
+    """Reconcilia os contadores de não lidas a cada `interval` segundos, fora do event loop."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            processed = await anyio.to_thread.run_sync(reconcile_unread_counts_once)
+        except Exception:
+            logger.exception("Falha na reconciliação dos contadores de não lidas")
+            continue
+        if processed is not None:
+            logger.info("%s usuários com contadores de não lidas reconciliados", processed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ratings = commands.add_parser(
+        "reconcile-ratings", help="Recalcula os agregados de avaliação dos locais a partir dos check-ins"
+    )
+    ratings.add_argument("--batch-size", type=int, default=500)
+
+    friend_counts = commands.add_parser(
+        "reconcile-friend-counts", help="Recalcula users.friend_count a partir das amizades aceitas"
+    )
+    friend_counts.add_argument("--batch-size", type=int, default=500)
+
+    unread_counts = commands.add_parser(
+        "reconcile-unread-counts", help="Recalcula os contadores de notificações e mensagens não lidas"
+    )
+    unread_counts.add_argument("--batch-size", type=int, default=500)
+
+    commands.add_parser(
+        "rebuild-conversations", help="Reconstrói os resumos de conversa a partir do histórico de mensagens"
+    )
+
+    commands.add_parser("create-indexes", help="Cria os índices declarados nos modelos que ainda não existem")
+
+    feeds = commands.add_parser("trim-feeds", help="Apara as timelines do feed para FEED_TIMELINE_SIZE entradas")
+    feeds.add_argument("--size", type=int, default=None)
+
+    plans = commands.add_parser(
+        "check-plans", help="Executa EXPLAIN nas consultas de leitura e falha se houver seq scan em tabela grande"
+    )
+    plans.add_argument("--min-rows", type=int, default=10000)
+
+    args = parser.parse_args(argv)
+    db = SessionLocal()
+    try:
+        if args.command == "reconcile-ratings":
+            processed = crud.reconcile_venue_ratings(db, batch_size=args.batch_size)
+            print(f"{processed} locais reconciliados")
+        elif args.command == "reconcile-friend-counts":
+            processed = crud.reconcile_friend_counts(db, batch_size=args.batch_size)
+            print(f"{processed} usuários reconciliados")
+        elif args.command == "reconcile-unread-counts":
+            processed = reconcile_unread_counts_once(batch_size=args.batch_size)
+            if processed is None:
+                print("Reconciliação já em andamento em outro processo")
+                sys.exit(1)
+            print(f"{processed} usuários reconciliados")
+        elif args.command == "rebuild-conversations":
+            rows = crud.rebuild_conversations(db)
+            print(f"{rows} conversas reconstruídas")
+        elif args.command == "create-indexes":
+            print(f"{create_indexes()} índices criados")
+        elif args.command == "trim-feeds":
+            removed = crud.trim_feeds(db, size=args.size)
+            print(f"{removed} entradas removidas das timelines")
+        elif args.command == "check-plans":
+            scans = query_plans.check_plans(db, min_rows=args.min_rows)
+            for scan in scans:
+                statement = " ".join(scan.statement.split())
+                print(f"{scan.query}: seq scan em {scan.table} (~{scan.rows} linhas)\n    {statement}")
+            if scans:
+                sys.exit(1)
+            print("Nenhum seq scan em tabelas grandes")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
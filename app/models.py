@@ -11,6 +11,10 @@ from sqlalchemy import (
     DateTime,
     ForeignKey,
     CheckConstraint,
+    UniqueConstraint,
+    Index,
+    DDL,
+    event,
     func,
 )
 from sqlalchemy.dialects.postgresql import UUID, JSONB, ARRAY
@@ -18,6 +22,29 @@ from sqlalchemy.dialects.postgresql import UUID, JSONB, ARRAY
 from .database import Base
 
 
+# Busca textual: pg_trgm serve ILIKE '%termo%' por índice GIN e unaccent torna a
+# busca insensível a acentos. unaccent() não é IMMUTABLE, então os índices usam
+# o wrapper f_unaccent(), que fixa o dicionário.
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL(
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm;"
+        " CREATE EXTENSION IF NOT EXISTS unaccent;"
+        " CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text"
+        " LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT"
+        " AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$"
+    ),
+)
+
+
+def trigram_index(name: str, column) -> Index:
+    """GIN trigram index on f_unaccent(column), matching crud's search filters."""
+    # Dentro do corpo da classe a Column ainda não tem nome; o rótulo só liga o opclass à expressão
+    expr = func.f_unaccent(column).label("trgm")
+    return Index(name, expr, postgresql_using="gin", postgresql_ops={"trgm": "gin_trgm_ops"})
+
+
 # ========= Nivel 0 =========
 class Badge(Base):
     __tablename__ = "badges"
@@ -57,11 +84,21 @@ class Venue(Base):
     price_range = Column(Text)
     rating = Column(Numeric, server_default="0")
     total_reviews = Column(Integer, server_default="0")
+    rating_sum = Column(Integer, server_default="0")
     image_url = Column(Text)
     tags = Column(ARRAY(Text))
     is_active = Column(Boolean, server_default="true")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        trigram_index("ix_venues_name_trgm", name),
+        Index("ix_venues_tags", tags, postgresql_using="gin"),
+        # search_venues filtra apenas locais ativos
+        Index("ix_venues_active_category", category, postgresql_where=is_active.isnot(False)),
+        Index("ix_venues_rating", rating),
+        Index("ix_venues_created_at", created_at),
+    )
 
 
 class User(Base):
@@ -81,8 +118,18 @@ class User(Base):
     allow_messages_from = Column(Text, server_default="friends")
     review_delay = Column(Text, server_default="immediate")
     notifications_enabled = Column(Boolean, server_default="true")
+    # Amizades aceitas; mantido por set_friendship_status/delete_friendship
+    friend_count = Column(Integer, nullable=False, server_default="0")
+    # Notificações não lidas; mantido pelas escritas em notifications
+    unread_notifications = Column(Integer, nullable=False, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        trigram_index("ix_users_name_trgm", name),
+        trigram_index("ix_users_email_trgm", email),
+        Index("ix_users_created_at", created_at),
+    )
 
 
 # ========= Nivel 1 =========
@@ -98,7 +145,9 @@ class Group(Base):
     max_members = Column(Integer)
     created_by = Column(UUID(as_uuid=True), ForeignKey("users.id"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (trigram_index("ix_groups_name_trgm", name),)
 
 
 class Promotion(Base):
@@ -115,7 +164,9 @@ class Promotion(Base):
     end_date = Column(DateTime(timezone=True), nullable=False)
     is_active = Column(Boolean, server_default="true")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (Index("ix_promotions_venue_start", venue_id, start_date),)
 
 
 class Checkin(Base):
@@ -130,10 +181,13 @@ class Checkin(Base):
     photos = Column(ARRAY(Text))
     is_anonymous = Column(Boolean, server_default="false")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     __table_args__ = (
         CheckConstraint("rating >= 1 AND rating <= 5", name="checkins_rating_range"),
+        # Paginação por (created_at, id) em list_user_checkins/list_venue_checkins
+        Index("ix_checkins_user_created", user_id, created_at, id),
+        Index("ix_checkins_venue_created", venue_id, created_at, id),
     )
 
 
@@ -145,7 +199,18 @@ class Friendship(Base):
     friend_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
     status = Column(Text, server_default="pending")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # Pedidos pendentes recebidos/enviados, mais recentes primeiro
+        Index("ix_friendships_friend_pending", friend_id, created_at, postgresql_where=status == "pending"),
+        Index("ix_friendships_user_pending", user_id, created_at, postgresql_where=status == "pending"),
+        # Amizades aceitas dos dois lados, já na ordem da paginação de list_user_friends
+        Index("ix_friendships_user_accepted_since", user_id, created_at, friend_id, postgresql_where=status == "accepted"),
+        Index("ix_friendships_friend_accepted_since", friend_id, created_at, user_id, postgresql_where=status == "accepted"),
+        # Um único registro por par de usuários, em qualquer direção e status
+        Index("friendships_pair_key", func.least(user_id, friend_id), func.greatest(user_id, friend_id), unique=True),
+    )
 
 
 class Message(Base):
@@ -158,6 +223,9 @@ class Message(Base):
     is_read = Column(Boolean, server_default="false")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # Cada sentido da conversa é um intervalo do índice; list_messages_between combina os dois
+    __table_args__ = (Index("ix_messages_pair_created", sender_id, receiver_id, created_at, id),)
+
 
 class Notification(Base):
     __tablename__ = "notifications"
@@ -171,6 +239,8 @@ class Notification(Base):
     is_read = Column(Boolean, server_default="false")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (Index("ix_notifications_user_created", user_id, created_at, id),)
+
 
 class UserBadge(Base):
     __tablename__ = "user_badges"
@@ -180,6 +250,8 @@ class UserBadge(Base):
     badge_id = Column(UUID(as_uuid=True), ForeignKey("badges.id"))
     earned_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (UniqueConstraint("user_id", "badge_id", name="user_badges_user_badge_key"),)
+
 
 class UserInterest(Base):
     __tablename__ = "user_interests"
@@ -189,6 +261,8 @@ class UserInterest(Base):
     interest_id = Column(UUID(as_uuid=True), ForeignKey("interests.id"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (UniqueConstraint("user_id", "interest_id", name="user_interests_user_interest_key"),)
+
 
 # ========= Nivel 2 =========
 class GroupMember(Base):
@@ -200,6 +274,8 @@ class GroupMember(Base):
     role = Column(Text, server_default="member")
     joined_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (UniqueConstraint("group_id", "user_id", name="group_members_group_user_key"),)
+
 
 class GroupInterest(Base):
     __tablename__ = "group_interests"
@@ -209,6 +285,30 @@ class GroupInterest(Base):
     interest_id = Column(UUID(as_uuid=True), ForeignKey("interests.id"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (UniqueConstraint("group_id", "interest_id", name="group_interests_group_interest_key"),)
+
+
+class Conversation(Base):
+    """Resumo de uma conversa do ponto de vista de `user_id`, mantido a cada mensagem."""
+
+    __tablename__ = "conversations"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    counterpart_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    last_message_id = Column(UUID(as_uuid=True), ForeignKey("messages.id", ondelete="SET NULL"))
+    last_message_at = Column(DateTime(timezone=True), nullable=False)
+    unread_count = Column(Integer, nullable=False, server_default="0")
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "counterpart_id", name="conversations_user_counterpart_key"),
+        Index("ix_conversations_user_last_message", "user_id", "last_message_at", "id"),
+        # Só as conversas com mensagens não lidas, para /me/unread-counts
+        Index("ix_conversations_user_unread", user_id, counterpart_id, unread_count, postgresql_where=unread_count > 0),
+    )
+
 
 class Event(Base):
     __tablename__ = "events"
@@ -224,7 +324,13 @@ class Event(Base):
     max_attendees = Column(Integer)
     is_public = Column(Boolean, server_default="true")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_events_start", start_time, id),
+        Index("ix_events_group_start", group_id, start_time, id),
+        Index("ix_events_venue_start", venue_id, start_time, id),
+    )
 
 
 # ========= Nivel 3 =========
@@ -235,4 +341,51 @@ class EventAttendee(Base):
     event_id = Column(UUID(as_uuid=True), ForeignKey("events.id"))
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
     status = Column(Text, server_default="going")
-    joined_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    joined_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (UniqueConstraint("event_id", "user_id", name="event_attendees_event_user_key"),)
+
+# ========= Feed =========
+class FeedActivity(Base):
+    """Item publicável no feed dos amigos: check-in, presença confirmada ou evento criado por `actor_id`."""
+
+    __tablename__ = "feed_activities"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False)
+    actor_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    verb = Column(Text, nullable=False)  # checkin | rsvp | event
+    object_id = Column(UUID(as_uuid=True), nullable=False)  # checkin ou evento
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("verb", "object_id", "actor_id", name="feed_activities_object_key"),
+        # Leitura sob demanda dos amigos com muitos amigos e backfill de novas amizades
+        Index("ix_feed_activities_actor_created", actor_id, created_at, id),
+    )
+
+
+class FeedEntry(Base):
+    """Linha da timeline pré-computada de `user_id` (fan-out na escrita)."""
+
+    __tablename__ = "feed_entries"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    activity_id = Column(UUID(as_uuid=True), ForeignKey("feed_activities.id", ondelete="CASCADE"), primary_key=True)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("ix_feed_entries_user_created", user_id, created_at, activity_id),
+        # ON DELETE CASCADE ao remover uma atividade
+        Index("ix_feed_entries_activity", activity_id),
+    )
+
+
+class FeedPullSource(Base):
+    """Amigo de `user_id` com amigos demais para fan-out; suas atividades são lidas na hora (fan-out na leitura)."""
+
+    __tablename__ = "feed_pull_sources"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    source_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+
+    __table_args__ = (Index("ix_feed_pull_sources_source", source_id),)
@@ -0,0 +1,62 @@
+"""Opaque keyset cursors for the time-ordered list endpoints."""
+
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Sequence
+from uuid import UUID
+
+from sqlalchemy import tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(value, row_id) -> str:
+    if isinstance(value, datetime):
+        payload = ["dt", value.isoformat(), str(row_id)]
+    else:
+        payload = ["v", value, str(row_id)]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        kind, value, row_id = json.loads(raw)
+        if kind == "dt":
+            value = datetime.fromisoformat(value)
+        return value, UUID(row_id)
+    except Exception as exc:
+        raise InvalidCursor("Cursor inválido") from exc
+
+
+def apply_keyset(query, column, id_column, cursor: Optional[str], descending: bool = True):
+    """Ordena por (column, id) e, se houver cursor, continua a partir dele."""
+    if descending:
+        query = query.order_by(column.desc(), id_column.desc())
+    else:
+        query = query.order_by(column.asc(), id_column.asc())
+    if not cursor:
+        return query
+    value, row_id = decode_cursor(cursor)
+    position = tuple_(column, id_column)
+    return query.filter(position < tuple_(value, row_id) if descending else position > tuple_(value, row_id))
+
+
+def paginate(query, column, id_column, *, cursor: Optional[str], skip: int, limit: int, descending: bool = True):
+    query = apply_keyset(query, column, id_column, cursor, descending)
+    if not cursor:
+        query = query.offset(skip)
+    return query.limit(limit).all()
+
+
+def next_cursor(rows: Sequence, attr: str, limit: int) -> Optional[str]:
+    if not rows or len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor(getattr(last, attr), last.id)
@@ -0,0 +1,132 @@
+"""EXPLAIN-based check that the crud read queries are served by indexes.
+
+Run it against a seeded database with `python -m app.maintenance check-plans`.
+Each read function in crud is called with ids sampled from the database, the
+SELECTs it issues are captured and EXPLAINed, and any sequential scan over a
+table above the row threshold is reported.
+"""
+
+import json
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from . import crud, models
+
+
+@dataclass
+class SeqScan:
+    query: str
+    table: str
+    rows: int
+    statement: str
+
+
+@contextmanager
+def capture_selects(db: Session) -> Iterator[List[Tuple[str, object]]]:
+    """Collect (statement, parameters) of every SELECT executed on the session's connection."""
+    captured: List[Tuple[str, object]] = []
+    conn = db.connection()
+
+    def before_cursor_execute(_conn, _cursor, statement, parameters, _context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            captured.append((statement, parameters))
+
+    event.listen(conn, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield captured
+    finally:
+        event.remove(conn, "before_cursor_execute", before_cursor_execute)
+
+
+def _sample_ids(db: Session) -> Dict[str, object]:
+    def first(column, *criteria):
+        return db.query(column).filter(*criteria).limit(1).scalar()
+
+    message = db.query(models.Message.sender_id, models.Message.receiver_id).limit(1).first()
+    return {
+        "user": first(models.User.id),
+        "venue": first(models.Venue.id),
+        "group": first(models.Group.id),
+        "event": first(models.Event.id),
+        "category": first(models.Venue.category),
+        "sender": message.sender_id if message else None,
+        "receiver": message.receiver_id if message else None,
+    }
+
+
+def read_queries(db: Session) -> List[Tuple[str, Callable[[], object]]]:
+    """The crud read paths exercised by the check, as (name, call) pairs."""
+    ids = _sample_ids(db)
+    user, venue, group, event_id = ids["user"], ids["venue"], ids["group"], ids["event"]
+    return [
+        ("get_user_by_email", lambda: db.query(models.User).filter(models.User.email == "check@example.com").first()),
+        ("list_users", lambda: crud.list_users(db)),
+        ("list_users:created_at", lambda: crud.list_users(db, sort_by="created_at")),
+        ("list_users:search", lambda: crud.list_users(db, search="ana")),
+        ("list_venues:rating", lambda: crud.list_venues(db, sort_by="rating")),
+        ("list_venues:search", lambda: crud.list_venues(db, search="bar")),
+        ("list_groups:search", lambda: crud.list_groups(db, search="run")),
+        ("list_user_interests", lambda: crud.list_user_interests(db, user)),
+        ("list_user_badges", lambda: crud.list_user_badges(db, user)),
+        ("list_group_members", lambda: crud.list_group_members(db, group)),
+        ("list_group_interests", lambda: crud.list_group_interests(db, group)),
+        ("list_events", lambda: crud.list_events(db)),
+        ("list_events:group", lambda: crud.list_events(db, group_id=group)),
+        ("list_events:venue", lambda: crud.list_events(db, venue_id=venue)),
+        ("list_user_checkins", lambda: crud.list_user_checkins(db, user)),
+        ("list_venue_checkins", lambda: crud.list_venue_checkins(db, venue)),
+        ("list_venue_promotions", lambda: crud.list_venue_promotions(db, venue)),
+        ("list_event_attendees", lambda: crud.list_event_attendees(db, event_id)),
+        ("list_incoming_friend_requests", lambda: crud.list_incoming_friend_requests(db, user)),
+        ("list_outgoing_friend_requests", lambda: crud.list_outgoing_friend_requests(db, user)),
+        ("get_friendship_between", lambda: crud.get_friendship_between(db, ids["sender"], ids["receiver"])),
+        ("list_user_friends", lambda: crud.list_user_friends(db, user)),
+        ("list_messages_between", lambda: crud.list_messages_between(db, ids["sender"], ids["receiver"])),
+        ("list_message_threads", lambda: crud.list_message_threads(db, user)),
+        ("list_notifications", lambda: crud.list_notifications(db, user)),
+        ("list_feed", lambda: crud.list_feed(db, user)),
+        ("search_venues", lambda: crud.search_venues(db, category=ids["category"], tags=["wifi"])),
+        ("search_events", lambda: crud.search_events(db, start_from="2024-01-01T00:00:00")),
+    ]
+
+
+def _table_rows(db: Session) -> Dict[str, int]:
+    rows = db.execute(
+        text("SELECT relname, reltuples::bigint FROM pg_class WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace")
+    )
+    return {name: count for name, count in rows}
+
+
+def _seq_scans(plan: dict, streaming: bool = True) -> Iterator[dict]:
+    """Yield Seq Scan nodes that read the whole relation.
+
+    A filterless Seq Scan whose ancestors are only Limit nodes stops after the
+    first rows and is not reported.
+    """
+    node_type = plan.get("Node Type")
+    if node_type == "Seq Scan" and (not streaming or "Filter" in plan):
+        yield plan
+    for child in plan.get("Plans", ()):
+        yield from _seq_scans(child, streaming and node_type == "Limit")
+
+
+def check_plans(db: Session, min_rows: int = 10000) -> List[SeqScan]:
+    """EXPLAIN every captured read query and return the seq scans on tables with >= `min_rows` rows."""
+    table_rows = _table_rows(db)
+    found: List[SeqScan] = []
+    for name, call in read_queries(db):
+        with capture_selects(db) as statements:
+            call()
+        for statement, parameters in statements:
+            raw = db.connection().exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+            plan = (raw if isinstance(raw, list) else json.loads(raw))[0]["Plan"]
+            for node in _seq_scans(plan):
+                table = node.get("Relation Name")
+                if table_rows.get(table, 0) >= min_rows:
+                    found.append(SeqScan(name, table, table_rows[table], statement))
+        db.rollback()
+    return found
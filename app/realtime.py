@@ -0,0 +1,177 @@
+"""Push of new notifications and messages to connected clients.
+
+`publish` is called by crud inside the write transaction. With the default
+"local" backend events are queued on the session and handed to the
+in-process hub after commit; with the "postgres" backend they are sent with
+pg_notify, which Postgres delivers on commit to every worker LISTENing on
+the channel, so a client connected to any worker receives them.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+from typing import Any, Dict, Iterable, Optional, Set
+
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .database import DATABASE_URL, SessionLocal
+from .serialization import adapter
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "realtime"
+# Limite do payload do NOTIFY é 8000 bytes; acima disso só o id do item é enviado
+NOTIFY_PAYLOAD_LIMIT = 7900
+RECONNECT_SECONDS = 2.0
+_PENDING_KEY = "realtime_pending"
+
+
+class Subscription:
+    """Bounded queue of encoded events for one connection, fed from any thread."""
+
+    def __init__(self, user_id: str, maxsize: int):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize)
+        self.lagged = False
+
+    def _put(self, message: str):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Cliente lento: descarta e pede que ele recarregue pelos endpoints REST
+            self.lagged = True
+
+    def _resync(self):
+        self.lagged = True
+        if self.queue.empty():
+            self._put(json.dumps({"type": "resync"}))
+
+    async def next(self) -> str:
+        message = await self.queue.get()
+        if self.lagged:
+            self.lagged = False
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            return json.dumps({"type": "resync"})
+        return message
+
+
+class Hub:
+    """user id -> open subscriptions of this process."""
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, user_id) -> Subscription:
+        subscription = Subscription(str(user_id), self.queue_size)
+        with self._lock:
+            self._subscriptions.setdefault(subscription.user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def dispatch(self, event: Dict[str, Any]):
+        """Deliver `event` to the subscriptions of its users; safe to call from any thread."""
+        with self._lock:
+            targets = [sub for user_id in event["users"] for sub in self._subscriptions.get(user_id, ())]
+        if not targets:
+            return
+        message = json.dumps({key: value for key, value in event.items() if key != "users"})
+        delivered = dropped = 0
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._put, message)
+                delivered += 1
+            except RuntimeError:
+                # Loop já encerrado: a conexão está fechando
+                dropped += 1
+        # dispatch roda em várias threads (after_commit das rotas síncronas): += fora do lock perde contagens
+        with self._lock:
+            self.delivered += delivered
+            self.dropped += dropped
+
+    def resync_all(self):
+        with self._lock:
+            targets = [sub for subscriptions in self._subscriptions.values() for sub in subscriptions]
+        for subscription in targets:
+            subscription.loop.call_soon_threadsafe(subscription._resync)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "backend": settings.REALTIME_BACKEND,
+                "users": len(self._subscriptions),
+                "connections": sum(len(subscriptions) for subscriptions in self._subscriptions.values()),
+                "delivered": self.delivered,
+                "dropped": self.dropped,
+            }
+
+
+hub = Hub(settings.REALTIME_QUEUE_SIZE)
+
+
+def publish(db: Session, user_ids: Iterable, kind: str, schema: Any, item: Any):
+    """Push `item` (rendered with `schema`) to `user_ids` once the session's transaction commits."""
+    event = {
+        "users": sorted({str(user_id) for user_id in user_ids}),
+        "type": kind,
+        "data": adapter(schema).dump_python(adapter(schema).validate_python(item, from_attributes=True), mode="json"),
+    }
+    if settings.REALTIME_BACKEND == "postgres":
+        payload = json.dumps(event)
+        if len(payload.encode()) > NOTIFY_PAYLOAD_LIMIT:
+            payload = json.dumps({**event, "data": {"id": event["data"]["id"]}, "partial": True})
+        # NOTIFY é transacional: só é entregue se a transação fizer commit
+        db.execute(select(func.pg_notify(CHANNEL, payload)))
+    else:
+        db.info.setdefault(_PENDING_KEY, []).append(event)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _flush_pending(session: Session):
+    for pending in session.info.pop(_PENDING_KEY, ()):
+        hub.dispatch(pending)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_pending(session: Session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _listen_conninfo() -> str:
+    return make_url(DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+async def listen(conninfo: Optional[str] = None):
+    """LISTEN on the channel and feed the hub; reconnects and asks clients to resync after a gap."""
+    import psycopg
+
+    conninfo = conninfo or _listen_conninfo()
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(conninfo, autocommit=True) as conn:
+                await conn.execute(f"LISTEN {CHANNEL}")
+                # Eventos emitidos enquanto a escuta estava fora do ar foram perdidos
+                hub.resync_all()
+                async for notify in conn.notifies():
+                    hub.dispatch(json.loads(notify.payload))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Conexão LISTEN perdida; reconectando em %ss", RECONNECT_SECONDS)
+            await asyncio.sleep(RECONNECT_SECONDS)
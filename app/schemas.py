@@ -1,5 +1,6 @@
 # app/schemas.py
 
+from datetime import date, datetime
 from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, Any
 from uuid import UUID
@@ -27,6 +28,8 @@ class UserCreate(UserBase):
 
 class User(UserBase):
     id: UUID
+    birth_date: Optional[date] = None
+    friend_count: int = 0
 
     class Config:
         from_attributes = True
@@ -108,6 +111,23 @@ class Venue(VenueBase):
         from_attributes = True
 
 
+class VenueNearby(BaseModel):
+    venue: Venue
+    distance_km: float
+
+
+class VenueFacets(BaseModel):
+    category: dict[str, int] = {}
+    price_range: dict[str, int] = {}
+    tags: dict[str, int] = {}
+    rating: dict[str, int] = {}  # "4" = locais com nota >= 4
+
+
+class VenueSearchResult(BaseModel):
+    items: list[Venue]
+    facets: VenueFacets
+
+
 # ========= Groups =========
 class GroupBase(BaseModel):
     name: str
@@ -209,7 +229,7 @@ class GroupMember(BaseModel):
     group_id: UUID
     user_id: UUID
     role: str
-    joined_at: Optional[str] = None
+    joined_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -245,6 +265,8 @@ class EventUpdate(BaseModel):
 class Event(EventBase):
     id: UUID
     created_by: Optional[UUID] = None
+    start_time: datetime
+    end_time: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -275,11 +297,29 @@ class CheckinUpdate(BaseModel):
 
 class Checkin(CheckinBase):
     id: UUID
+    created_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
 
+class CheckinBatchCreate(BaseModel):
+    items: list[CheckinCreate] = Field(..., min_length=1, max_length=5000)
+
+
+class CheckinBatchItemResult(BaseModel):
+    index: int
+    status: str  # created | failed
+    id: Optional[UUID] = None
+    error: Optional[str] = None
+
+
+class CheckinBatchResult(BaseModel):
+    created: int
+    failed: int
+    results: list[CheckinBatchItemResult]
+
+
 # ========= Promotions =========
 class PromotionBase(BaseModel):
     title: str
@@ -310,6 +350,8 @@ class PromotionUpdate(BaseModel):
 class Promotion(PromotionBase):
     id: UUID
     venue_id: Optional[UUID] = None
+    start_date: datetime
+    end_date: datetime
 
     class Config:
         from_attributes = True
@@ -333,7 +375,7 @@ class EventAttendee(BaseModel):
     event_id: UUID
     user_id: UUID
     status: str
-    joined_at: Optional[str] = None
+    joined_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -345,13 +387,22 @@ class Friendship(BaseModel):
     user_id: UUID
     friend_id: UUID
     status: str  # pending | accepted | blocked
-    created_at: Optional[str] = None
-    updated_at: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
 
+class Friend(User):
+    friends_since: Optional[datetime] = None
+
+
+class FriendSuggestion(User):
+    mutual_friends: int
+    shared_interests: int
+
+
 class FriendshipRequestCreate(BaseModel):
     to_user_id: UUID
 
@@ -368,7 +419,7 @@ class Message(BaseModel):
     receiver_id: UUID
     content: str
     is_read: bool
-    created_at: Optional[str] = None
+    created_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -376,10 +427,21 @@ class Message(BaseModel):
 
 class MessageThread(BaseModel):
     user_id: UUID  # counterpart user id
-    last_message: Message
+    last_message: Optional[Message] = None  # None se a última mensagem foi removida (ON DELETE SET NULL)
     unread_count: int
 
 
+class ConversationUnread(BaseModel):
+    user_id: UUID  # counterpart user id
+    unread_count: int
+
+
+class UnreadCounts(BaseModel):
+    notifications: int
+    messages: int
+    conversations: list[ConversationUnread]
+
+
 # ========= Notifications =========
 class NotificationBase(BaseModel):
     type: str
@@ -396,7 +458,22 @@ class Notification(NotificationBase):
     id: UUID
     user_id: UUID
     is_read: bool
-    created_at: Optional[str] = None
+    created_at: Optional[datetime] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+# ========= Feed =========
+class FeedItem(BaseModel):
+    id: UUID
+    type: str  # checkin | rsvp | event
+    actor_id: UUID
+    actor_name: str
+    actor_avatar_url: Optional[str] = None
+    created_at: datetime
+    checkin: Optional[Checkin] = None
+    event: Optional[Event] = None
+
+    class Config:
+        from_attributes = True
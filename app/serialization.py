@@ -0,0 +1,12 @@
+"""Cached pydantic TypeAdapters for rendering rows outside response_model (exports, realtime events)."""
+
+from functools import lru_cache
+from typing import Any
+
+from pydantic import TypeAdapter
+
+
+@lru_cache(maxsize=None)
+def adapter(schema: Any) -> TypeAdapter:
+    """TypeAdapter for `schema` (e.g. list[schemas.Venue]), built once per process."""
+    return TypeAdapter(schema)
@@ -0,0 +1,203 @@
+"""In-process friendship graph used by the mutual-friends and suggestion queries."""
+
+import heapq
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .config import settings
+
+
+class SocialGraph:
+    """Adjacency sets of accepted friendships plus each user's interests.
+
+    User ids are interned to small ints: set intersection over ints hashes in
+    C, while uuid.UUID hashes through a Python-level __hash__. Writes made by
+    this process are applied in place; the whole graph is reloaded after
+    `ttl_seconds` so writes from other workers show up.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._index: Dict[object, int] = {}
+        self._ids: List[object] = []
+        self._friends: Dict[int, Set[int]] = {}
+        self._interests: Dict[int, Set[object]] = {}
+        self._lock = threading.RLock()
+        self._reload_lock = threading.Lock()
+        self._loaded_at: Optional[float] = None
+        self._journal: Optional[List[Tuple[Callable, tuple]]] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def ensure_loaded(
+        self,
+        fetch_friendships: Callable[[], Iterable[Tuple[object, object]]],
+        fetch_interests: Callable[[], Iterable[Tuple[object, object]]],
+    ):
+        """Load from (user_id, friend_id) and (user_id, interest_id) rows on first use.
+
+        Once the graph is older than the TTL it is rebuilt in a background
+        thread and swapped in; until then queries keep using the current one.
+        The fetch callables must open their own database session.
+        """
+        if self._fresh():
+            return
+        if self.loaded:
+            if self._reload_lock.acquire(blocking=False):
+                threading.Thread(target=self._reload, args=(fetch_friendships, fetch_interests), daemon=True).start()
+            return
+        with self._reload_lock:
+            if not self.loaded:
+                self._build(fetch_friendships, fetch_interests)
+
+    def _reload(self, fetch_friendships, fetch_interests):
+        try:
+            self._build(fetch_friendships, fetch_interests)
+        finally:
+            self._reload_lock.release()
+
+    def _build(self, fetch_friendships, fetch_interests):
+        with self._lock:
+            self._journal = []
+        fresh = SocialGraph(self.ttl_seconds)
+        try:
+            for user_id, friend_id in fetch_friendships():
+                fresh._link(fresh._intern(user_id), fresh._intern(friend_id))
+            for user_id, interest_id in fetch_interests():
+                fresh._interests.setdefault(fresh._intern(user_id), set()).add(interest_id)
+        except BaseException:
+            with self._lock:
+                self._journal = None
+            raise
+        with self._lock:
+            # Escritas feitas durante a leitura podem não estar nela; reaplica sobre o grafo novo
+            journal, self._journal = self._journal, None
+            fresh._loaded_at = time.monotonic()
+            for method, args in journal:
+                method(fresh, *args)
+            self._index, self._ids = fresh._index, fresh._ids
+            self._friends, self._interests = fresh._friends, fresh._interests
+            self._loaded_at = fresh._loaded_at
+
+    def _fresh(self) -> bool:
+        loaded_at = self._loaded_at
+        return loaded_at is not None and time.monotonic() - loaded_at < self.ttl_seconds
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def _record(self, method: Callable, *args):
+        if self._journal is not None:
+            self._journal.append((method, args))
+
+    def _intern(self, user_id) -> int:
+        node = self._index.get(user_id)
+        if node is None:
+            node = self._index[user_id] = len(self._ids)
+            self._ids.append(user_id)
+        return node
+
+    def _link(self, a: int, b: int):
+        self._friends.setdefault(a, set()).add(b)
+        self._friends.setdefault(b, set()).add(a)
+
+    def add_friendship(self, user_a, user_b):
+        if not self.loaded:
+            return
+        with self._lock:
+            self._record(SocialGraph.add_friendship, user_a, user_b)
+            self._link(self._intern(user_a), self._intern(user_b))
+
+    def remove_friendship(self, user_a, user_b):
+        if not self.loaded:
+            return
+        with self._lock:
+            self._record(SocialGraph.remove_friendship, user_a, user_b)
+            a, b = self._index.get(user_a), self._index.get(user_b)
+            if a is None or b is None:
+                return
+            self._friends.get(a, set()).discard(b)
+            self._friends.get(b, set()).discard(a)
+
+    def add_interest(self, user_id, interest_id):
+        if not self.loaded:
+            return
+        with self._lock:
+            self._record(SocialGraph.add_interest, user_id, interest_id)
+            self._interests.setdefault(self._intern(user_id), set()).add(interest_id)
+
+    def remove_interest(self, user_id, interest_id):
+        if not self.loaded:
+            return
+        with self._lock:
+            self._record(SocialGraph.remove_interest, user_id, interest_id)
+            node = self._index.get(user_id)
+            if node is not None:
+                self._interests.get(node, set()).discard(interest_id)
+
+    def _neighbours(self, user_id) -> Set[int]:
+        node = self._index.get(user_id)
+        return self._friends.get(node, set()) if node is not None else set()
+
+    def mutual_friends(self, user_a, user_b) -> List[object]:
+        """Ids of the friends `user_a` and `user_b` have in common."""
+        with self._lock:
+            common = self._neighbours(user_a) & self._neighbours(user_b)
+            return [self._ids[node] for node in common]
+
+    def suggestions(self, user_id, limit: int = 20, max_edges: int = 50000, exclude: Iterable = ()) -> List[Tuple[object, int, int]]:
+        """Friends of friends ranked by (mutual friends, shared interests), as (id, mutual, shared).
+
+        Ids in `exclude` (e.g. pending or blocked pairs, which the graph does
+        not hold) are never suggested. The 2-hop expansion walks friends from the lowest degree up and stops
+        after `max_edges` adjacency entries, so a user connected to very
+        popular accounts still pays a bounded cost.
+        """
+        with self._lock:
+            node = self._index.get(user_id)
+            if node is None:
+                return []
+            friends = self._friends.get(node, set())
+            mutual: Counter = Counter()
+            budget = max_edges
+            for friend in sorted(friends, key=lambda other: len(self._friends.get(other, ()))):
+                neighbours = self._friends.get(friend, ())
+                if len(neighbours) > budget:
+                    break
+                budget -= len(neighbours)
+                mutual.update(neighbours)
+            mutual.pop(node, None)
+            for friend in friends:
+                mutual.pop(friend, None)
+            for other in exclude:
+                mutual.pop(self._index.get(other), None)
+            if not mutual:
+                return []
+            # Interesses só desempatam: calcula apenas para quem alcança a menor contagem do top `limit`
+            cutoff = heapq.nlargest(limit, mutual.values())[-1]
+            interests = self._interests.get(node, set())
+            scored = [
+                (count, len(interests & self._interests.get(candidate, set())), candidate)
+                for candidate, count in mutual.items()
+                if count >= cutoff
+            ]
+            ranked = heapq.nlargest(limit, scored, key=lambda entry: (entry[0], entry[1]))
+            return [(self._ids[candidate], count, shared) for count, shared, candidate in ranked]
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            loaded_at = self._loaded_at
+            return {
+                "users": len(self._ids),
+                "friendships": sum(len(friends) for friends in self._friends.values()) // 2,
+                "age_seconds": round(time.monotonic() - loaded_at, 3) if loaded_at is not None else None,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+social_graph = SocialGraph(settings.SOCIAL_GRAPH_TTL_SECONDS)
@@ -0,0 +1,72 @@
+"""Fixtures compartilhadas.
+
+Os testes que usam o banco rodam contra TEST_DATABASE_URL (um banco
+descartável, com as extensões pg_trgm e unaccent disponíveis) e são
+ignorados quando ela não está definida.
+"""
+
+import os
+import uuid
+
+import pytest
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+if TEST_DATABASE_URL:
+    # app.database lê DATABASE_URL na importação
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+
+
+@pytest.fixture(scope="session")
+def app():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL não definido")
+    from app import main
+
+    return main.app
+
+
+@pytest.fixture
+def client(app):
+    from fastapi.testclient import TestClient
+
+    return TestClient(app)
+
+
+@pytest.fixture
+def db(app):
+    from app.database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def new_user(client):
+    """Registra um usuário e devolve (id, headers com o token)."""
+
+    def create(name: str = "Usuário"):
+        user_id = str(uuid.uuid4())
+        email = f"u-{user_id[:8]}@example.com"
+        response = client.post("/register", json={"id": user_id, "email": email, "name": name})
+        assert response.status_code == 200, response.text
+        token = client.post("/login", json={"email": email}).json()["access_token"]
+        return user_id, {"Authorization": f"Bearer {token}"}
+
+    return create
+
+
+@pytest.fixture
+def befriend(client):
+    """Envia e aceita um pedido de amizade entre dois usuários; devolve o id da amizade."""
+
+    def create(user_a, headers_a, user_b, headers_b):
+        request = client.post("/friendships/requests", json={"to_user_id": user_b}, headers=headers_a)
+        assert request.status_code == 200, request.text
+        accepted = client.post(f"/friendships/{request.json()['id']}/accept", headers=headers_b)
+        assert accepted.status_code == 200, accepted.text
+        return request.json()["id"]
+
+    return create
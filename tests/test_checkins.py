@@ -0,0 +1,55 @@
+import uuid
+
+from sqlalchemy import event
+
+from app import models
+from app.database import engine
+
+
+def create_venue(client, headers):
+    response = client.post("/venues", json={"name": f"Local {uuid.uuid4().hex[:8]}", "category": "bar"}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def test_batch_reports_each_item_and_updates_rating_aggregates(client, db, new_user):
+    user_id, headers = new_user("Frequentador")
+    other_id, _ = new_user("Outro")
+    # O lote lista primeiro o local de maior id, fora da ordem de travamento
+    first, second = sorted((create_venue(client, headers), create_venue(client, headers)), key=uuid.UUID)
+    items = [
+        {"user_id": user_id, "venue_id": second, "rating": 5},
+        {"user_id": user_id, "venue_id": first, "rating": 3},
+        {"user_id": user_id, "venue_id": str(uuid.uuid4()), "rating": 4},
+        {"user_id": other_id, "venue_id": first, "rating": 1},
+        {"user_id": user_id, "venue_id": first, "rating": 4},
+        {"user_id": user_id, "venue_id": second},
+    ]
+
+    updated_venues = []
+
+    def capture(_conn, _cursor, statement, parameters, _context, _executemany):
+        if statement.startswith("UPDATE venues"):
+            updated_venues.append(parameters["b_venue_id"])
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        response = client.post("/checkins/batch", json={"items": items}, headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert (result["created"], result["failed"]) == (4, 2)
+    assert [item["status"] for item in result["results"]] == ["created", "created", "failed", "failed", "created", "created"]
+    assert result["results"][2]["error"] == "Local não encontrado"
+    assert result["results"][3]["error"] == "Sem permissão para criar check-in por outro usuário"
+    # Linhas de venues travadas sempre na mesma ordem, qualquer que seja a ordem do lote
+    assert [str(venue_id) for venue_id in updated_venues] == [first, second]
+
+    aggregates = {
+        str(row.id): (row.rating_sum, row.total_reviews, float(row.rating))
+        for row in db.query(models.Venue).filter(models.Venue.id.in_([first, second]))
+    }
+    assert aggregates == {first: (7, 2, 3.5), second: (5, 1, 5.0)}
+    assert db.query(models.Checkin).filter(models.Checkin.user_id == user_id).count() == 4
@@ -0,0 +1,27 @@
+import json
+import uuid
+
+from app import crud
+from app.database import engine
+
+
+def test_export_streams_on_a_single_connection(client, new_user, monkeypatch):
+    user_id, headers = new_user("Exportador")
+    venue = client.post("/venues", json={"name": f"Bar {uuid.uuid4().hex[:8]}", "category": "bar"}, headers=headers).json()
+    for _ in range(3):
+        client.post("/checkins", json={"user_id": user_id, "venue_id": venue["id"]}, headers=headers)
+
+    checked_out = []
+    stream_checkins = crud.stream_checkins
+
+    def spy(db, **filters):
+        # A sessão do stream ainda não conectou; nenhuma outra pode estar presa ao pool
+        checked_out.append(engine.pool.checkedout())
+        return stream_checkins(db, **filters)
+
+    monkeypatch.setattr(crud, "stream_checkins", spy)
+    response = client.get(f"/users/{user_id}/checkins/export", headers=headers)
+
+    assert response.status_code == 200, response.text
+    assert len([json.loads(line) for line in response.text.splitlines()]) == 3
+    assert checked_out == [0]
@@ -0,0 +1,53 @@
+import uuid
+
+import pytest
+from sqlalchemy import update
+
+from app import crud, facets, models
+
+
+def rating_counts(client, headers, category):
+    response = client.get("/venues/search", params={"category": category, "facets": True}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["facets"]["rating"]
+
+
+def create_venue(client, headers, category):
+    response = client.post("/venues", json={"name": f"Local {uuid.uuid4().hex[:8]}", "category": category}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def test_rolled_back_checkin_leaves_the_rating_bucket_alone(client, new_user, monkeypatch):
+    user_id, headers = new_user("Avaliador")
+    category = f"cat-{uuid.uuid4().hex[:8]}"
+    venue_id = create_venue(client, headers, category)
+    assert rating_counts(client, headers, category)["4"] == 0
+
+    def broken_feed(*args, **kwargs):
+        raise RuntimeError("feed indisponível")
+
+    # Falha depois do UPDATE da nota e antes do commit
+    monkeypatch.setattr(crud, "_checkins_in_feed", broken_feed)
+    with pytest.raises(RuntimeError):
+        client.post("/checkins", json={"user_id": user_id, "venue_id": venue_id, "rating": 5}, headers=headers)
+    monkeypatch.undo()
+    assert rating_counts(client, headers, category)["4"] == 0
+
+    client.post("/checkins", json={"user_id": user_id, "venue_id": venue_id, "rating": 5}, headers=headers).raise_for_status()
+    assert rating_counts(client, headers, category)["4"] == 1
+
+
+def test_stale_index_reloads_writes_from_other_workers(client, db, new_user, monkeypatch):
+    _, headers = new_user("Dono")
+    category = f"cat-{uuid.uuid4().hex[:8]}"
+    venue_id = create_venue(client, headers, category)
+    assert rating_counts(client, headers, category)["4"] == 0
+
+    # Escrita feita por outro worker: não passa por este processo
+    db.execute(update(models.Venue).where(models.Venue.id == venue_id).values(rating=4.5, rating_sum=9, total_reviews=2))
+    db.commit()
+    assert rating_counts(client, headers, category)["4"] == 0
+
+    monkeypatch.setattr(facets.venue_facets, "ttl_seconds", 0)
+    assert rating_counts(client, headers, category)["4"] == 1
@@ -0,0 +1,79 @@
+import pytest
+from sqlalchemy import update
+
+from app import crud, models
+from app.config import settings
+
+
+def feed(client, headers, **params):
+    response = client.get("/feed", headers=headers, params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_private_event_leaves_friends_feeds_and_returns_when_public(client, new_user, befriend):
+    host, host_headers = new_user("Anfitrião")
+    guest, guest_headers = new_user("Convidado")
+    reader, reader_headers = new_user("Leitor")
+    befriend(guest, guest_headers, reader, reader_headers)
+    event = client.post("/events", json={"title": "Festa", "start_time": "2030-01-01T20:00:00"}, headers=host_headers).json()
+    rsvp = client.post(
+        f"/events/{event['id']}/attendees",
+        json={"user_id": guest, "event_id": event["id"], "status": "going"},
+        headers=guest_headers,
+    )
+    assert rsvp.status_code == 200, rsvp.text
+
+    def rsvps():
+        return [item for item in feed(client, reader_headers) if item["type"] == "rsvp" and item["event"]["id"] == event["id"]]
+
+    assert len(rsvps()) == 1
+
+    client.patch(f"/events/{event['id']}", json={"is_public": False}, headers=host_headers)
+    assert rsvps() == []
+
+    client.patch(f"/events/{event['id']}", json={"is_public": True}, headers=host_headers)
+    assert [item["actor_id"] for item in rsvps()] == [guest]
+
+
+def test_friends_get_pull_sources_when_count_jumps_past_the_limit(client, db, new_user, befriend, monkeypatch):
+    monkeypatch.setattr(settings, "FEED_FANOUT_MAX_FRIENDS", 3)
+    actor, actor_headers = new_user("Popular")
+    friends = [new_user(f"Amigo {i}") for i in range(2)]
+    for friend, friend_headers in friends:
+        befriend(friend, friend_headers, actor, actor_headers)
+    # Contador corrigido de uma vez (ex.: reconcile-friend-counts) para bem acima do limite
+    db.execute(update(models.User).where(models.User.id == actor).values(friend_count=10))
+    db.commit()
+
+    newcomer, newcomer_headers = new_user("Novo")
+    befriend(newcomer, newcomer_headers, actor, actor_headers)
+
+    sources = {
+        str(row.user_id)
+        for row in db.query(models.FeedPullSource.user_id).filter(models.FeedPullSource.source_id == actor)
+    }
+    assert sources == {friend for friend, _ in friends} | {newcomer}
+    venue = client.post("/venues", json={"name": "Bar", "category": "bar"}, headers=actor_headers).json()
+    checkin = client.post("/checkins", json={"user_id": actor, "venue_id": venue["id"]}, headers=actor_headers).json()
+    for _, friend_headers in friends:
+        assert checkin["id"] in [item["checkin"]["id"] for item in feed(client, friend_headers) if item["checkin"]]
+
+
+def test_rsvp_and_feed_publish_commit_together(client, db, new_user, monkeypatch):
+    host, host_headers = new_user("Anfitrião")
+    guest, guest_headers = new_user("Convidado")
+    event = client.post("/events", json={"title": "Show", "start_time": "2030-01-01T20:00:00"}, headers=host_headers).json()
+
+    def broken_publish(*args, **kwargs):
+        raise RuntimeError("feed indisponível")
+
+    monkeypatch.setattr(crud, "_publish_activities", broken_publish)
+    with pytest.raises(RuntimeError):
+        client.post(
+            f"/events/{event['id']}/attendees",
+            json={"user_id": guest, "event_id": event["id"], "status": "going"},
+            headers=guest_headers,
+        )
+
+    assert db.query(models.EventAttendee).filter(models.EventAttendee.event_id == event["id"]).count() == 0
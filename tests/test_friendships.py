@@ -0,0 +1,127 @@
+import uuid
+
+from sqlalchemy import update
+
+from app import crud, models
+from app.pagination import NEXT_CURSOR_HEADER
+
+
+def request_friendship(client, headers, to_user_id):
+    return client.post("/friendships/requests", json={"to_user_id": to_user_id}, headers=headers)
+
+
+def friend_count(client, headers, user_id):
+    response = client.get(f"/users/{user_id}/friends", params={"limit": 1}, headers=headers)
+    assert response.status_code == 200, response.text
+    return int(response.headers["X-Total-Count"])
+
+
+def test_repeated_and_crossed_requests_conflict(client, new_user):
+    alice, alice_headers = new_user("Alice")
+    bob, bob_headers = new_user("Bob")
+    first = request_friendship(client, alice_headers, bob)
+    assert first.status_code == 200, first.text
+
+    again = request_friendship(client, alice_headers, bob)
+    assert (again.status_code, again.json()["detail"]) == (409, "Solicitação já enviada")
+    crossed = request_friendship(client, bob_headers, alice)
+    assert (crossed.status_code, crossed.json()["detail"]) == (409, "Você já possui uma solicitação deste usuário")
+
+    # Um único pedido para o par, na direção original
+    incoming = client.get("/friendships/requests/incoming", headers=bob_headers).json()
+    assert [request["id"] for request in incoming] == [first.json()["id"]]
+    assert client.get("/friendships/requests/outgoing", headers=bob_headers).json() == []
+
+
+def test_request_between_friends_conflicts_in_both_directions(client, new_user, befriend):
+    alice, alice_headers = new_user("Alice")
+    bob, bob_headers = new_user("Bob")
+    befriend(alice, alice_headers, bob, bob_headers)
+    for headers, other in ((alice_headers, bob), (bob_headers, alice)):
+        response = request_friendship(client, headers, other)
+        assert (response.status_code, response.json()["detail"]) == (409, "Vocês já são amigos")
+
+
+def test_blocked_pair_cannot_request_again(client, new_user):
+    alice, alice_headers = new_user("Alice")
+    bob, bob_headers = new_user("Bob")
+    request = request_friendship(client, alice_headers, bob).json()
+    client.post(f"/friendships/{request['id']}/block", headers=bob_headers).raise_for_status()
+    for headers, other in ((alice_headers, bob), (bob_headers, alice)):
+        response = request_friendship(client, headers, other)
+        assert (response.status_code, response.json()["detail"]) == (409, "Não é possível enviar solicitação para este usuário")
+
+
+def test_request_to_unknown_or_self(client, new_user):
+    me, headers = new_user("Eu")
+    unknown = request_friendship(client, headers, str(uuid.uuid4()))
+    assert (unknown.status_code, unknown.json()["detail"]) == (404, "Usuário não encontrado")
+    assert request_friendship(client, headers, me).status_code == 422
+    assert client.get("/friendships/requests/outgoing", headers=headers).json() == []
+
+
+def test_friend_count_follows_accept_block_and_unfriend(client, new_user, befriend):
+    me, my_headers = new_user("Eu")
+    others = [new_user(name) for name in ("Ana", "Beto", "Caio")]
+    ids = [befriend(me, my_headers, other, other_headers) for other, other_headers in others]
+    assert friend_count(client, my_headers, me) == 3
+    assert friend_count(client, my_headers, others[0][0]) == 1
+
+    # Bloquear duas vezes desconta uma vez só
+    for _ in range(2):
+        client.post(f"/friendships/{ids[0]}/block", headers=others[0][1]).raise_for_status()
+    assert friend_count(client, my_headers, me) == 2
+    assert friend_count(client, my_headers, others[0][0]) == 0
+
+    client.delete(f"/friendships/{ids[1]}", headers=my_headers).raise_for_status()
+    assert friend_count(client, my_headers, me) == 1
+    assert friend_count(client, my_headers, others[1][0]) == 0
+
+    # Pedido pendente rejeitado nunca contou
+    pending, pending_headers = new_user("Pendente")
+    request = request_friendship(client, my_headers, pending).json()
+    client.post(f"/friendships/{request['id']}/reject", headers=pending_headers).raise_for_status()
+    assert friend_count(client, my_headers, me) == 1
+
+
+def test_friend_count_drift_is_exposed_then_reconciled(client, db, new_user, befriend):
+    alice, alice_headers = new_user("Alice")
+    bob, bob_headers = new_user("Bob")
+    friendship_id = befriend(alice, alice_headers, bob, bob_headers)
+    # Contador perdido, como depois de uma escrita fora do crud
+    db.execute(update(models.User).where(models.User.id == alice).values(friend_count=0))
+    db.commit()
+
+    client.delete(f"/friendships/{friendship_id}", headers=bob_headers).raise_for_status()
+    assert friend_count(client, alice_headers, alice) == -1
+
+    crud.reconcile_friend_counts(db)
+    assert friend_count(client, alice_headers, alice) == 0
+
+
+def test_friends_page_through_both_sides_with_a_cursor(client, new_user, befriend):
+    me, my_headers = new_user("Eu")
+    added = []
+    for index in range(5):
+        other, other_headers = new_user(f"Amigo {index}")
+        # Amizades nos dois sentidos: pedidos enviados e recebidos se alternam
+        if index % 2:
+            befriend(other, other_headers, me, my_headers)
+        else:
+            befriend(me, my_headers, other, other_headers)
+        added.append(other)
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2} | ({"cursor": cursor} if cursor else {})
+        response = client.get(f"/users/{me}/friends", params=params, headers=my_headers)
+        assert response.status_code == 200, response.text
+        assert int(response.headers["X-Total-Count"]) == 5
+        seen += [friend["id"] for friend in response.json()]
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if not cursor:
+            break
+    assert seen == added[::-1]
+
+    offset = client.get(f"/users/{me}/friends", params={"skip": 1, "limit": 3}, headers=my_headers).json()
+    assert [friend["id"] for friend in offset] == added[::-1][1:4]
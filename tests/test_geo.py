@@ -0,0 +1,72 @@
+import random
+import time
+
+from app.geo import VenueGeoIndex, haversine_km
+
+
+def brute_force(points, lat, lon, radius_km, limit):
+    hits = sorted(
+        (haversine_km(lat, lon, vlat, vlon), venue_id)
+        for venue_id, (vlat, vlon) in points.items()
+        if haversine_km(lat, lon, vlat, vlon) <= radius_km
+    )
+    return [venue_id for _, venue_id in hits[:limit]]
+
+
+def build(points, ttl_seconds=300.0):
+    index = VenueGeoIndex(ttl_seconds=ttl_seconds)
+    index.ensure_loaded(lambda: [(venue_id, lat, lon) for venue_id, (lat, lon) in points.items()])
+    return index
+
+
+def test_nearby_matches_brute_force():
+    rnd = random.Random(1)
+    points = {i: (rnd.uniform(-89.9, 89.9), rnd.uniform(-180, 180)) for i in range(3000)}
+    # Agrupamentos perto da linha de data e dos polos
+    points.update({f"c{i}": (rnd.uniform(-1, 1), rnd.uniform(179.5, 180.0)) for i in range(300)})
+    points.update({f"p{i}": (rnd.uniform(88, 90), rnd.uniform(-180, 180)) for i in range(300)})
+    index = build(points)
+    for lat, lon, radius_km in [(0, 179.9, 80), (0, -179.9, 80), (89.5, 0, 100), (-45, 10, 1000), (12, 34, 5)]:
+        expected = brute_force(points, lat, lon, radius_km, 50)
+        assert [venue_id for venue_id, _ in index.nearby(lat, lon, radius_km, 50)] == expected
+
+
+def test_nearby_near_pole_is_bounded():
+    rnd = random.Random(2)
+    points = {i: (rnd.uniform(70, 90), rnd.uniform(-180, 180)) for i in range(2000)}
+    index = build(points)
+    for lat in (78, 85, 89.9, 90, -78, -90):
+        started = time.perf_counter()
+        hits = index.nearby(lat, 10, 100, 50)
+        assert time.perf_counter() - started < 1.0
+        assert [venue_id for venue_id, _ in hits] == brute_force(points, lat, 10, 100, 50)
+
+
+def test_empty_index_near_pole():
+    index = build({})
+    started = time.perf_counter()
+    assert index.nearby(78, 10, 100, 50) == []
+    assert time.perf_counter() - started < 1.0
+
+
+def test_reload_after_ttl_picks_up_other_writes():
+    rows = [("a", 10.0, 10.0)]
+    index = VenueGeoIndex(ttl_seconds=0.0)
+    index.ensure_loaded(lambda: list(rows))
+    rows.append(("b", 10.01, 10.01))
+    index.ensure_loaded(lambda: list(rows))
+    assert {venue_id for venue_id, _ in index.nearby(10, 10, 5, 10)} == {"a", "b"}
+
+
+def test_writes_during_reload_are_kept():
+    index = VenueGeoIndex(ttl_seconds=0.0)
+    index.ensure_loaded(lambda: [("a", 10.0, 10.0)])
+
+    def rows():
+        # Escrita feita por este processo enquanto a recarga lê o banco
+        index.upsert("b", 10.01, 10.01)
+        index.remove("a")
+        yield ("a", 10.0, 10.0)
+
+    index.ensure_loaded(rows)
+    assert [venue_id for venue_id, _ in index.nearby(10, 10, 5, 10)] == ["b"]
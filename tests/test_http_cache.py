@@ -0,0 +1,47 @@
+import uuid
+
+from app import models
+
+
+def venue_payload(name):
+    return {"name": f"{name} {uuid.uuid4().hex[:8]}", "category": "bar"}
+
+
+def test_lists_revalidate_only_by_etag(client, new_user):
+    _, headers = new_user("Dono")
+    client.post("/venues", json=venue_payload("Bar Antigo"), headers=headers)
+    first = client.get("/venues", headers=headers)
+    assert "ETag" in first.headers
+    assert "Last-Modified" not in first.headers
+
+    # Um If-Modified-Since no futuro não pode confirmar uma lista que mudou
+    client.post("/venues", json=venue_payload("Bar Novo"), headers=headers)
+    later = client.get("/venues", headers={**headers, "If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"})
+    assert later.status_code == 200
+
+    same = client.get("/venues", headers={**headers, "If-None-Match": later.headers["ETag"]})
+    assert same.status_code == 304
+
+
+def test_single_resource_keeps_last_modified(client, new_user):
+    _, headers = new_user("Dono")
+    venue = client.post("/venues", json=venue_payload("Bar"), headers=headers).json()
+    first = client.get(f"/venues/{venue['id']}", headers=headers)
+    revalidated = client.get(f"/venues/{venue['id']}", headers={**headers, "If-Modified-Since": first.headers["Last-Modified"]})
+    assert revalidated.status_code == 304
+
+
+def test_counters_keep_updated_at_but_friend_count_changes_etag(client, db, new_user, befriend):
+    alice, alice_headers = new_user("Alice")
+    bob, bob_headers = new_user("Bob")
+    before = db.get(models.User, alice).updated_at
+    etag = client.get(f"/users/{alice}", headers=bob_headers).headers["ETag"]
+
+    befriend(alice, alice_headers, bob, bob_headers)
+
+    db.expire_all()
+    assert db.get(models.User, alice).updated_at == before
+    response = client.get(f"/users/{alice}", headers={**bob_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["friend_count"] == 1
+    assert "Last-Modified" not in response.headers
@@ -0,0 +1,50 @@
+from sqlalchemy import delete
+
+from app import models
+from app.pagination import NEXT_CURSOR_HEADER
+
+
+def send(client, headers, receiver, content):
+    response = client.post("/messages", json={"receiver_id": receiver, "content": content}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def test_conversation_pages_merge_both_directions(client, new_user):
+    alice, alice_headers = new_user("Alice")
+    bob, bob_headers = new_user("Bob")
+    other, other_headers = new_user("Outro")
+    sent = []
+    for i in range(7):
+        # Sentidos desbalanceados: o lado de Bob esgota antes da última página
+        if i % 3 == 0:
+            sent.append(send(client, bob_headers, alice, f"b{i}"))
+        else:
+            sent.append(send(client, alice_headers, bob, f"a{i}"))
+    send(client, other_headers, alice, "fora da conversa")
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3} | ({"cursor": cursor} if cursor else {})
+        response = client.get(f"/messages/with/{bob}", params=params, headers=alice_headers)
+        assert response.status_code == 200, response.text
+        seen += [message["id"] for message in response.json()]
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if not cursor:
+            break
+    assert seen == sent[::-1]
+
+    offset = client.get(f"/messages/with/{alice}", params={"skip": 2, "limit": 3}, headers=bob_headers).json()
+    assert [message["id"] for message in offset] == sent[::-1][2:5]
+
+
+def test_thread_survives_the_removal_of_its_last_message(client, db, new_user):
+    alice, alice_headers = new_user("Alice")
+    bob, bob_headers = new_user("Bob")
+    send(client, alice_headers, bob, "primeira")
+    last = send(client, alice_headers, bob, "última")
+    db.execute(delete(models.Message).where(models.Message.id == last))
+    db.commit()
+
+    threads = client.get("/messages/threads", headers=bob_headers).json()
+    assert [(thread["user_id"], thread["last_message"]) for thread in threads] == [(alice, None)]
@@ -0,0 +1,82 @@
+"""Número de comandos SQL emitidos por endpoint de escrita (INSERT/UPDATE ... RETURNING, sem refresh)."""
+
+import uuid
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+
+@contextmanager
+def count_statements():
+    from app.database import async_engine, engine
+
+    statements = []
+
+    def before_cursor_execute(_conn, _cursor, statement, _parameters, _context, _executemany):
+        statements.append(statement)
+
+    engines = (engine, async_engine.sync_engine)
+    for target in engines:
+        event.listen(target, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        for target in engines:
+            event.remove(target, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture
+def user(client, new_user):
+    user_id, headers = new_user("Contador")
+    # Aquece o cache de principal: a autenticação não entra na contagem
+    assert client.get("/users/me", headers=headers).status_code == 200
+    return user_id, headers
+
+
+def test_register_is_one_statement(client):
+    email = f"registro-{uuid.uuid4().hex[:8]}@example.com"
+    with count_statements() as statements:
+        response = client.post("/register", json={"id": str(uuid.uuid4()), "email": email, "name": "Novo"})
+    assert response.status_code == 200, response.text
+    assert len(statements) == 1, statements
+    duplicate = client.post("/register", json={"id": str(uuid.uuid4()), "email": email, "name": "Outro"})
+    assert duplicate.status_code == 400
+
+
+def test_venue_writes_are_one_statement(client, user):
+    _, headers = user
+    with count_statements() as statements:
+        venue = client.post("/venues", json={"name": "Bar da Esquina", "category": "bar"}, headers=headers)
+    assert venue.status_code == 200, venue.text
+    assert len(statements) == 1, statements
+
+    with count_statements() as statements:
+        updated = client.patch(f"/venues/{venue.json()['id']}", json={"description": "Aberto até tarde"}, headers=headers)
+    assert updated.status_code == 200, updated.text
+    assert len(statements) == 1, statements
+
+
+def test_group_create_is_one_statement(client, user):
+    _, headers = user
+    with count_statements() as statements:
+        group = client.post("/groups", json={"name": "Corrida de domingo"}, headers=headers)
+    assert group.status_code == 200, group.text
+    assert len(statements) == 1, statements
+
+
+def test_event_update_without_visibility_change_is_one_statement(client, user):
+    _, headers = user
+    event_id = client.post("/events", json={"title": "Show", "start_time": "2030-01-01T20:00:00"}, headers=headers).json()["id"]
+    with count_statements() as statements:
+        updated = client.patch(f"/events/{event_id}", json={"title": "Show acústico"}, headers=headers)
+    assert updated.status_code == 200, updated.text
+    assert len(statements) == 1, statements
+
+
+def test_event_update_by_other_user_is_forbidden(client, user, new_user):
+    _, headers = user
+    _, other_headers = new_user("Outro")
+    event_id = client.post("/events", json={"title": "Show", "start_time": "2030-01-01T20:00:00"}, headers=headers).json()["id"]
+    assert client.patch(f"/events/{event_id}", json={"title": "X"}, headers=other_headers).status_code == 403
+    assert client.patch(f"/events/{uuid.uuid4()}", json={"title": "X"}, headers=headers).status_code == 404
@@ -0,0 +1,120 @@
+from sqlalchemy import text
+
+from app import query_plans
+
+ROWS = 10_000
+
+# Cada tabela lida pelo check recebe ROWS linhas, com folga sobre o limite passado a check_plans
+SEED_SQL = (
+    """
+    INSERT INTO users (id, email, name, created_at)
+    SELECT gen_random_uuid(), 'plan-' || g || '@example.com', 'Plano ' || md5(g::text), now() - g * interval '1 minute'
+    FROM generate_series(1, :rows) AS g
+    """,
+    """
+    INSERT INTO venues (id, name, category, rating, tags, created_at)
+    SELECT gen_random_uuid(), 'Plano ' || md5(g::text), 'plan-' || g % 50, g % 5, ARRAY['plan-' || g % 20], now() - g * interval '1 minute'
+    FROM generate_series(1, :rows) AS g
+    """,
+    "INSERT INTO interests (id, name) SELECT gen_random_uuid(), 'plan-' || g FROM generate_series(1, 20) AS g",
+    "INSERT INTO badges (id, name) SELECT gen_random_uuid(), 'plan-' || g FROM generate_series(1, 20) AS g",
+    """
+    CREATE TEMP TABLE plan_users ON COMMIT DROP AS
+    SELECT id, row_number() OVER (ORDER BY id) AS n FROM users WHERE email LIKE 'plan-%'
+    """,
+    """
+    CREATE TEMP TABLE plan_venues ON COMMIT DROP AS
+    SELECT id, row_number() OVER (ORDER BY id) AS n FROM venues WHERE name LIKE 'Plano %'
+    """,
+    """
+    INSERT INTO groups (id, name, created_by)
+    SELECT gen_random_uuid(), 'Plano ' || md5(u.n::text), u.id FROM plan_users u
+    """,
+    """
+    CREATE TEMP TABLE plan_groups ON COMMIT DROP AS
+    SELECT id, row_number() OVER (ORDER BY id) AS n FROM groups WHERE name LIKE 'Plano %'
+    """,
+    """
+    INSERT INTO user_interests (id, user_id, interest_id)
+    SELECT gen_random_uuid(), u.id, i.id FROM plan_users u JOIN interests i ON i.name = 'plan-' || (1 + u.n % 20)
+    """,
+    """
+    INSERT INTO user_badges (id, user_id, badge_id)
+    SELECT gen_random_uuid(), u.id, b.id FROM plan_users u JOIN badges b ON b.name = 'plan-' || (1 + u.n % 20)
+    """,
+    """
+    INSERT INTO group_members (id, group_id, user_id)
+    SELECT gen_random_uuid(), g.id, u.id FROM plan_groups g JOIN plan_users u ON u.n = g.n
+    """,
+    """
+    INSERT INTO group_interests (id, group_id, interest_id)
+    SELECT gen_random_uuid(), g.id, i.id FROM plan_groups g JOIN interests i ON i.name = 'plan-' || (1 + g.n % 20)
+    """,
+    """
+    INSERT INTO promotions (id, venue_id, title, start_date, end_date)
+    SELECT gen_random_uuid(), v.id, 'Promoção', now() - v.n * interval '1 hour', now() + interval '30 days' FROM plan_venues v
+    """,
+    """
+    INSERT INTO events (id, title, venue_id, group_id, created_by, start_time)
+    SELECT gen_random_uuid(), 'Evento', v.id, g.id, u.id, now() + v.n * interval '1 hour'
+    FROM plan_venues v JOIN plan_groups g ON g.n = v.n JOIN plan_users u ON u.n = v.n
+    """,
+    """
+    INSERT INTO event_attendees (id, event_id, user_id)
+    SELECT gen_random_uuid(), e.id, e.created_by FROM events e JOIN plan_groups g ON g.id = e.group_id
+    """,
+    """
+    INSERT INTO checkins (id, user_id, venue_id, rating, created_at)
+    SELECT gen_random_uuid(), u.id, v.id, 1 + u.n % 5, now() - u.n * interval '1 minute'
+    FROM plan_users u JOIN plan_venues v ON v.n = u.n
+    """,
+    """
+    INSERT INTO friendships (id, user_id, friend_id, status)
+    SELECT gen_random_uuid(), a.id, b.id, CASE WHEN a.n % 3 = 0 THEN 'pending' ELSE 'accepted' END
+    FROM plan_users a JOIN plan_users b ON b.n = a.n % :rows + 1
+    """,
+    """
+    INSERT INTO messages (id, sender_id, receiver_id, content, created_at)
+    SELECT gen_random_uuid(), a.id, b.id, 'oi', now() - a.n * interval '1 minute'
+    FROM plan_users a JOIN plan_users b ON b.n = a.n % :rows + 1
+    """,
+    """
+    INSERT INTO conversations (id, user_id, counterpart_id, last_message_id, last_message_at)
+    SELECT gen_random_uuid(), m.sender_id, m.receiver_id, m.id, m.created_at
+    FROM messages m JOIN plan_users u ON u.id = m.sender_id
+    """,
+    """
+    INSERT INTO notifications (id, user_id, type, title, message, created_at)
+    SELECT gen_random_uuid(), u.id, 'info', 'Aviso', 'Olá', now() - u.n * interval '1 minute' FROM plan_users u
+    """,
+    """
+    INSERT INTO feed_activities (id, actor_id, verb, object_id, created_at)
+    SELECT gen_random_uuid(), c.user_id, 'checkin', c.id, c.created_at FROM checkins c JOIN plan_users u ON u.id = c.user_id
+    """,
+    """
+    INSERT INTO feed_entries (user_id, activity_id, created_at)
+    SELECT CASE WHEN f.user_id = a.actor_id THEN f.friend_id ELSE f.user_id END, a.id, a.created_at
+    FROM feed_activities a JOIN plan_users u ON u.id = a.actor_id
+    JOIN friendships f ON a.actor_id IN (f.user_id, f.friend_id) AND f.status = 'accepted'
+    """,
+)
+
+
+def seed(db):
+    # O banco de teste é reaproveitado entre execuções: semeia uma vez só
+    if db.execute(text("SELECT 1 FROM users WHERE email LIKE 'plan-%' LIMIT 1")).first():
+        return
+    for statement in SEED_SQL:
+        db.execute(text(statement), {"rows": ROWS} if ":rows" in statement else {})
+    db.commit()
+
+
+def test_read_queries_have_no_seq_scans_on_large_tables(db):
+    seed(db)
+    # check_plans lê o tamanho das tabelas em pg_class.reltuples, que só o ANALYZE atualiza
+    db.execute(text("ANALYZE"))
+    db.commit()
+
+    scans = query_plans.check_plans(db, min_rows=ROWS // 2)
+
+    assert [(scan.query, scan.table) for scan in scans] == []
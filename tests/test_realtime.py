@@ -0,0 +1,99 @@
+import asyncio
+import json
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from jose import jwt
+from starlette.websockets import WebSocketDisconnect
+
+from app import auth, models, realtime, schemas
+
+
+def token_for(headers):
+    return headers["Authorization"].removeprefix("Bearer ")
+
+
+def send(client, headers, receiver, content):
+    response = client.post("/messages", json={"receiver_id": receiver, "content": content}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_new_message_is_pushed_to_the_receiver(client, new_user):
+    alice, alice_headers = new_user("Alice")
+    bob, bob_headers = new_user("Bob")
+    with client.websocket_connect(f"/ws?token={token_for(bob_headers)}") as bob_ws:
+        sent = send(client, alice_headers, bob, "oi")
+        event = bob_ws.receive_json()
+    assert event["type"] == "message"
+    assert event["data"]["id"] == sent["id"]
+    assert event["data"]["content"] == "oi"
+
+
+def test_rolled_back_events_are_not_pushed(client, db, new_user):
+    alice, alice_headers = new_user("Alice")
+    bob, bob_headers = new_user("Bob")
+    with client.websocket_connect(f"/ws?token={token_for(bob_headers)}") as bob_ws:
+        ghost = models.Message(
+            id=uuid.uuid4(), sender_id=alice, receiver_id=bob, content="fantasma", is_read=False, created_at=datetime.now(timezone.utc)
+        )
+        realtime.publish(db, [bob], "message", schemas.Message, ghost)
+        db.rollback()
+        sent = send(client, alice_headers, bob, "de verdade")
+        event = bob_ws.receive_json()
+    assert event["data"]["id"] == sent["id"]
+
+
+def test_invalid_token_is_refused_with_policy_violation(client):
+    with pytest.raises(WebSocketDisconnect) as refused:
+        with client.websocket_connect("/ws?token=invalido") as ws:
+            ws.receive_text()
+    assert refused.value.code == 1008
+
+
+def test_connection_closes_when_the_token_expires(client, new_user):
+    user_id, _ = new_user("Expira")
+    email = f"u-{user_id[:8]}@example.com"
+    expires = datetime.now(timezone.utc) + timedelta(seconds=1)
+    token = jwt.encode({"sub": email, "exp": expires}, auth.SECRET_KEY, algorithm=auth.ALGORITHM)
+    with client.websocket_connect(f"/ws?token={token}") as ws:
+        message = ws.receive()
+    assert message["type"] == "websocket.close"
+    assert message["code"] == 1008
+
+
+def test_overflowing_queue_turns_into_a_single_resync():
+    async def scenario():
+        hub = realtime.Hub(queue_size=2)
+        subscription = hub.subscribe("u1")
+        for index in range(5):
+            hub.dispatch({"users": ["u1"], "type": "notification", "data": {"index": index}})
+        await asyncio.sleep(0)
+        first = json.loads(await subscription.next())
+        hub.dispatch({"users": ["u1"], "type": "notification", "data": {"index": 5}})
+        await asyncio.sleep(0)
+        after = json.loads(await subscription.next())
+        return first, after, subscription.queue.empty(), hub.stats()
+
+    first, after, drained, stats = asyncio.run(scenario())
+    assert first == {"type": "resync"}
+    assert after == {"type": "notification", "data": {"index": 5}}
+    assert drained
+    assert (stats["delivered"], stats["dropped"]) == (6, 0)
+
+
+def test_dispatch_counts_are_exact_across_threads():
+    async def scenario():
+        hub = realtime.Hub(queue_size=100_000)
+        hub.subscribe("u1")
+        event = {"users": ["u1"], "type": "notification", "data": {}}
+        threads = [threading.Thread(target=lambda: [hub.dispatch(event) for _ in range(2000)]) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return hub.stats()["delivered"]
+
+    assert asyncio.run(scenario()) == 16_000
@@ -0,0 +1,20 @@
+def suggested(client, headers):
+    response = client.get("/users/me/friend-suggestions", headers=headers)
+    assert response.status_code == 200, response.text
+    return [user["id"] for user in response.json()]
+
+
+def test_suggestions_skip_pending_and_blocked_pairs(client, new_user, befriend):
+    me, my_headers = new_user("Eu")
+    hub, hub_headers = new_user("Amigo")
+    befriend(me, my_headers, hub, hub_headers)
+    pending, blocked, stranger = (new_user(name) for name in ("Pendente", "Bloqueado", "Desconhecido"))
+    for other, other_headers in (pending, blocked, stranger):
+        befriend(hub, hub_headers, other, other_headers)
+    assert set(suggested(client, my_headers)) == {pending[0], blocked[0], stranger[0]}
+
+    client.post("/friendships/requests", json={"to_user_id": pending[0]}, headers=my_headers).raise_for_status()
+    request = client.post("/friendships/requests", json={"to_user_id": blocked[0]}, headers=my_headers).json()
+    client.post(f"/friendships/{request['id']}/block", headers=blocked[1]).raise_for_status()
+
+    assert suggested(client, my_headers) == [stranger[0]]
@@ -0,0 +1,109 @@
+from sqlalchemy import text, update
+
+from app import crud, models
+from app.database import SessionLocal
+
+
+def unread(client, headers):
+    response = client.get("/me/unread-counts", headers=headers)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    return body["notifications"], {row["user_id"]: row["unread_count"] for row in body["conversations"]}
+
+
+def send(client, headers, receiver, content="oi"):
+    response = client.post("/messages", json={"receiver_id": receiver, "content": content}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def notify(client, headers, user_id):
+    payload = {"user_id": user_id, "type": "info", "title": "Aviso", "message": "Olá"}
+    response = client.post("/notifications", json=payload, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def test_message_counters_follow_create_and_mark(client, new_user):
+    alice, alice_headers = new_user("Alice")
+    bob, bob_headers = new_user("Bob")
+    first, second, third = (send(client, alice_headers, bob) for _ in range(3))
+    assert unread(client, bob_headers)[1] == {alice: 3}
+    assert unread(client, alice_headers)[1] == {}
+
+    # Quem não é o destinatário recebe 403 e a mensagem continua não lida
+    assert client.post(f"/messages/{first}/read", headers=alice_headers).status_code == 403
+    assert unread(client, bob_headers)[1] == {alice: 3}
+
+    # Marcar duas vezes a mesma mensagem desconta uma vez só
+    for _ in range(2):
+        response = client.post(f"/messages/{first}/read", headers=bob_headers)
+        assert response.status_code == 200, response.text
+        assert response.json()["is_read"] is True
+    assert unread(client, bob_headers)[1] == {alice: 2}
+
+    # A conversa desconta só as duas que ainda estavam não lidas
+    client.post(f"/messages/{second}/read", headers=bob_headers).raise_for_status()
+    client.post(f"/messages/with/{alice}/read", headers=bob_headers).raise_for_status()
+    assert unread(client, bob_headers)[1] == {}
+    send(client, alice_headers, bob)
+    assert unread(client, bob_headers)[1] == {alice: 1}
+
+
+def test_marking_an_unknown_message_is_not_found(client, new_user):
+    _, headers = new_user("Leitor")
+    response = client.post("/messages/00000000-0000-0000-0000-000000000000/read", headers=headers)
+    assert response.status_code == 404
+
+
+def test_notification_counter_follows_create_mark_and_delete(client, new_user):
+    user_id, headers = new_user("Notificado")
+    ids = [notify(client, headers, user_id) for _ in range(4)]
+    assert unread(client, headers)[0] == 4
+
+    for _ in range(2):
+        client.post(f"/notifications/{ids[0]}/read", headers=headers).raise_for_status()
+    assert unread(client, headers)[0] == 3
+
+    # Remover uma lida não mexe no contador; remover uma não lida desconta
+    client.delete(f"/notifications/{ids[0]}", headers=headers).raise_for_status()
+    assert unread(client, headers)[0] == 3
+    client.delete(f"/notifications/{ids[1]}", headers=headers).raise_for_status()
+    assert unread(client, headers)[0] == 2
+
+    client.post(f"/notifications/{ids[2]}/read", headers=headers).raise_for_status()
+    client.post("/notifications/read-all", headers=headers).raise_for_status()
+    assert unread(client, headers)[0] == 0
+    notify(client, headers, user_id)
+    assert unread(client, headers)[0] == 1
+
+
+def test_reconcile_fixes_drift_and_skips_locked_rows(client, db, new_user):
+    alice, alice_headers = new_user("Alice")
+    bob, bob_headers = new_user("Bob")
+    send(client, alice_headers, bob)
+    notify(client, alice_headers, bob)
+    notify(client, bob_headers, alice)
+
+    # Contadores fora de sincronia, como depois de uma escrita perdida
+    db.execute(update(models.User).where(models.User.id.in_([alice, bob])).values(unread_notifications=7))
+    db.execute(update(models.Conversation).where(models.Conversation.user_id == bob).values(unread_count=9))
+    db.commit()
+
+    # Uma escrita em andamento segura a linha de Alice: a reconciliação pula essa linha em vez de esperar
+    db.query(models.User).filter(models.User.id == alice).with_for_update().one()
+    with SessionLocal() as reconciler:
+        reconciler.execute(text("SET lock_timeout = '5s'"))
+        try:
+            crud.reconcile_unread_counts(reconciler, batch_size=100)
+        finally:
+            reconciler.execute(text("RESET lock_timeout"))
+            reconciler.commit()
+    db.rollback()
+
+    assert unread(client, bob_headers) == (1, {alice: 1})
+    assert unread(client, alice_headers)[0] == 7
+
+    with SessionLocal() as reconciler:
+        crud.reconcile_unread_counts(reconciler, batch_size=100)
+    assert unread(client, alice_headers)[0] == 1
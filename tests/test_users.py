@@ -0,0 +1,11 @@
+def test_me_reads_counters_past_the_principal_cache(client, new_user, befriend):
+    alice, alice_headers = new_user("Alice")
+    bob, bob_headers = new_user("Bob")
+    # Primeira requisição autenticada: Alice entra no cache com friend_count = 0
+    assert client.get("/users/me", headers=alice_headers).json()["friend_count"] == 0
+
+    befriend(alice, alice_headers, bob, bob_headers)
+
+    me = client.get("/users/me", headers=alice_headers).json()
+    assert me["id"] == alice
+    assert me["friend_count"] == 1